@@ -0,0 +1,93 @@
+"""
+Allocation of limited warehouse stock across the asins that need it.
+`to_ship_units` is calculated from amazon inventory only, so it can ask for more than the warehouse
+holds, and the total can exceed the outbound capacity. `allocate_wh_inventory` caps each asin
+at the restockable stock of its skus (every sku belongs to one asin, as in `sku_mapping`)
+and hands out the capacity in priority order (highest lost sales, then largest days-of-sale gap),
+in whole boxes, so the allocated quantities can always be shipped.
+"""
+
+import numpy as np
+import pandas as pd
+
+# skus with this flag are not counted as available warehouse stock
+NOT_RESTOCKABLE = "Do not ship to amazon"
+
+
+def allocation_priority(
+    forecast: pd.DataFrame, days_of_sale: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Priority keys per asin: lost sales (max, $/day) and days-of-sale gap (`days_of_sale` - dos_inbound).
+    Both "higher goes first".
+    """
+    lost_sales = pd.to_numeric(forecast["lost sales max"], errors="coerce")
+    dos_inbound = pd.to_numeric(forecast["dos_inbound"], errors="coerce")
+    dos_gap = (days_of_sale - dos_inbound.replace([np.inf, -np.inf], np.nan)).fillna(0)
+    return lost_sales.fillna(0).to_numpy(np.float64), dos_gap.to_numpy(np.float64)
+
+
+def _allocate_in_order(
+    demand: np.ndarray, capacity: float, box: np.ndarray
+) -> np.ndarray:
+    """
+    Rows must be sorted by priority. `capacity` is given to the rows in order,
+    every row gets at most its `demand`, rounded down to whole boxes.
+    """
+    before = np.cumsum(demand) - demand  # demand of higher-priority rows
+    granted = np.clip(capacity - before, 0, demand)
+    return np.floor(granted / box) * box
+
+
+def allocate_wh_inventory(
+    forecast: pd.DataFrame,
+    wh_inventory: pd.DataFrame,
+    days_of_sale: int,
+    capacity_units: float | None = None,
+) -> pd.DataFrame:
+    """
+    Distribute warehouse stock across asins by priority.
+    `forecast` - restock frame with plain asins: asin, to_ship_units, to_ship_boxes, sets in a box, lost sales max, dos_inbound.
+        Asins without a box size ask for `to_ship_units` and get single units
+    `wh_inventory` - per sku: sku, asin, wh_inventory, restockable
+    `capacity_units` - optional cap on the total number of units shipped (e.g. outbound capacity)
+    Returns per asin: asin, allocated_units, allocated_boxes, unallocated_units
+    """
+    asins = forecast["asin"].astype(str).to_numpy()
+    box = pd.to_numeric(forecast["sets in a box"], errors="coerce").to_numpy(np.float64)
+    no_box = np.isnan(box) | (box <= 0)
+    box = np.where(no_box, 1, box)
+    boxed = pd.to_numeric(forecast["to_ship_boxes"], errors="coerce") * box
+    units = pd.to_numeric(forecast["to_ship_units"], errors="coerce")
+    demand = boxed.where(~no_box, units).fillna(0).clip(lower=0).to_numpy(np.float64)
+    lost_sales, dos_gap = allocation_priority(forecast, days_of_sale)
+    # rank 0 = first to receive stock
+    rank = np.empty(len(asins), dtype=np.int64)
+    rank[np.lexsort((asins, -dos_gap, -lost_sales))] = np.arange(len(asins))
+
+    stock = wh_inventory.loc[
+        wh_inventory["restockable"] != NOT_RESTOCKABLE, ["asin", "wh_inventory"]
+    ]
+    asin_stock = (
+        pd.to_numeric(stock["wh_inventory"], errors="coerce")
+        .clip(lower=0)
+        .groupby(stock["asin"].astype(str))
+        .sum()
+    )
+    available = asin_stock.reindex(asins).fillna(0).to_numpy(np.float64)
+    allocated = np.floor(np.minimum(demand, available) / box) * box
+
+    if capacity_units is not None:
+        order = np.argsort(rank)
+        allocated[order] = _allocate_in_order(
+            allocated[order], capacity_units, box[order]
+        )
+
+    return pd.DataFrame(
+        {
+            "asin": asins,
+            "allocated_units": allocated,
+            "allocated_boxes": np.round(allocated / box),
+            "unallocated_units": demand - allocated,
+        }
+    )
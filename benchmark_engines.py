@@ -0,0 +1,106 @@
+"""
+Compare the pandas and polars engines of the `restock_utils` kernels on synthetic catalogs of several sizes.
+Checks that both engines return the same frames (within `TOLERANCE`) and prints the timings.
+Run: python benchmark_engines.py [n_asins ...]  (needs the "polars" extra: uv sync --extra polars)
+"""
+
+import sys
+import time
+
+import pandas as pd
+
+from date_utils import get_event_days_delta
+from restock_utils import (
+    calculate_amazon_inventory,
+    calculate_event_forecast,
+    calculate_inventory_isr,
+    get_asin_sales,
+    group_incoming_by_weeks,
+)
+from synthetic_data import synthetic_results
+
+CATALOG_SIZES = [1_000, 5_000, 20_000]
+# outputs are rounded to 2 decimals, a different summation order can flip the last digit
+TOLERANCE = 0.01 + 1e-9
+
+
+def _kernels(results: dict) -> dict:
+    """Kernel name -> function(engine) on the same inputs as in main.py"""
+    sales = results["get_amazon_sales"]
+    asin_sales = (
+        sales.assign(date=pd.to_datetime(sales["date"]))
+        .groupby(["date", "asin"])
+        .agg({"unit_sales": "sum", "dollar_sales": "sum"})
+        .reset_index()
+    )
+    inventory = results["get_amazon_inventory"]
+    snapshot = results["get_amazon_inventory_snapshot"]
+    asin_isr = calculate_inventory_isr(inventory[["date", "asin", "amz_inventory"]])
+    nearest_event, _, _ = get_event_days_delta()
+    total_sales = get_asin_sales(asin_sales.copy(), asin_isr)
+    return {
+        "calculate_inventory_isr": lambda engine: calculate_inventory_isr(
+            inventory[["date", "sku", "amz_inventory"]],
+            col_to_use="sku",
+            engine=engine,
+        ),
+        "get_asin_sales": lambda engine: get_asin_sales(
+            asin_sales.copy(), asin_isr, engine=engine
+        ),
+        "calculate_amazon_inventory": lambda engine: calculate_amazon_inventory(
+            snapshot,
+            max_date=str(snapshot["date"].max()),
+            show_warning=False,
+            engine=engine,
+        ),
+        "calculate_event_forecast": lambda engine: calculate_event_forecast(
+            total_sales[["asin", "avg units"]],
+            results["get_event_spreadsheet"],
+            event=nearest_event,
+            engine=engine,
+        ),
+        "group_incoming_by_weeks": lambda engine: group_incoming_by_weeks(
+            results["incoming_weeks"], engine=engine
+        ),
+    }
+
+
+def _timed(func, engine: str, repeat: int = 3) -> tuple[pd.DataFrame, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(engine)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def benchmark(catalog_sizes: list[int] = CATALOG_SIZES) -> pd.DataFrame:
+    rows = []
+    for n_asins in catalog_sizes:
+        results = synthetic_results(n_asins=n_asins)
+        for name, func in _kernels(results).items():
+            pandas_result, pandas_seconds = _timed(func, "pandas")
+            polars_result, polars_seconds = _timed(func, "polars")
+            pd.testing.assert_frame_equal(
+                pandas_result.reset_index(drop=True),
+                polars_result.reset_index(drop=True),
+                check_dtype=False,
+                check_column_type=False,
+                rtol=0,
+                atol=TOLERANCE,
+            )
+            rows.append(
+                {
+                    "asins": n_asins,
+                    "kernel": name,
+                    "pandas, s": round(pandas_seconds, 4),
+                    "polars, s": round(polars_seconds, 4),
+                    "speedup": round(pandas_seconds / polars_seconds, 1),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or CATALOG_SIZES
+    print(benchmark(sizes).to_string(index=False))
@@ -0,0 +1,171 @@
+"""
+Stage checkpoints: after each pipeline stage its output values are written to <folder>/<run id>/<stage>/,
+frames (also frames inside dicts, like pulled results) as uncompressed Feather (Arrow IPC), everything else pickled.
+`manifest.json` in the run folder lists the parameters and the stages completed so far, so a failed run can
+resume from the last good stage and intermediate state can be reloaded without pulling data again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+from pyarrow import ArrowException, feather
+
+# number of runs kept per folder, oldest are removed first
+KEEP_RUNS = 5
+
+
+def run_id(params: dict) -> str:
+    """Stable id of a run from its parameters (json-serializable values)"""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+
+def _manifest_path(folder: str, run: str) -> str:
+    return os.path.join(folder, run, "manifest.json")
+
+
+def read_manifest(folder: str, run: str) -> dict | None:
+    path = _manifest_path(folder, run)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(folder: str, run: str, manifest: dict) -> None:
+    path = _manifest_path(folder, run)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+
+
+def start_run(folder: str, params: dict, resume: bool = False) -> tuple[str, list[str]]:
+    """
+    Create (or with `resume`, reopen) the checkpoint run for `params`.
+    Returns the run id and the stages already completed (always empty without `resume`).
+    """
+    run = run_id(params)
+    manifest = read_manifest(folder, run) if resume else None
+    if manifest is None:
+        shutil.rmtree(os.path.join(folder, run), ignore_errors=True)
+        os.makedirs(os.path.join(folder, run))
+        manifest = {"params": params, "created": time.time(), "stages": []}
+        _write_manifest(folder, run, manifest)
+        _remove_old_runs(folder)
+    return run, manifest["stages"]
+
+
+def _remove_old_runs(folder: str) -> None:
+    runs = sorted(
+        (x for x in os.listdir(folder) if read_manifest(folder, x)),
+        key=lambda x: read_manifest(folder, x)["created"],  # type: ignore
+    )
+    for old_run in runs[:-KEEP_RUNS]:
+        shutil.rmtree(os.path.join(folder, old_run), ignore_errors=True)
+
+
+def save_stage(folder: str, run: str, stage: str, values: dict) -> None:
+    """Write a stage's outputs and mark the stage as completed"""
+    stage_folder = os.path.join(folder, run, stage)
+    shutil.rmtree(stage_folder, ignore_errors=True)
+    os.makedirs(stage_folder)
+    # Arrow infers a type for object columns (e.g. numbers -> float64), they are restored as object on load
+    object_columns = {}
+
+    def _write_frame(frame: pd.DataFrame, file_name: str) -> bool:
+        path = os.path.join(stage_folder, f"{file_name}.feather")
+        try:
+            feather.write_feather(
+                frame.reset_index(drop=True), path, compression="uncompressed"
+            )
+            object_columns[file_name] = [
+                x for x in frame.columns if frame[x].dtype == object
+            ]
+            return True
+        except (ArrowException, TypeError, ValueError):
+            # mixed-type object columns, nested items etc. can't go to Arrow
+            if os.path.exists(path):
+                os.remove(path)
+            return False
+
+    others = {}
+    for name, value in values.items():
+        if isinstance(value, pd.DataFrame) and _write_frame(value, name):
+            continue
+        if isinstance(value, dict):
+            # "<name>.<key>.feather" for frames in a dict, the rest of the dict is pickled
+            value = {
+                key: x
+                for key, x in value.items()
+                if not (
+                    isinstance(x, pd.DataFrame) and _write_frame(x, f"{name}.{key}")
+                )
+            }
+        others[name] = value
+    pd.to_pickle(others, os.path.join(stage_folder, "values.pkl"))
+    with open(os.path.join(stage_folder, "object_columns.json"), "w") as f:
+        json.dump(object_columns, f)
+
+    manifest = read_manifest(folder, run) or {"stages": []}
+    manifest["stages"] = [x for x in manifest["stages"] if x != stage] + [stage]
+    manifest[f"{stage}_saved"] = time.time()
+    _write_manifest(folder, run, manifest)
+
+
+def load_stage(folder: str, run: str, stage: str) -> dict:
+    stage_folder = os.path.join(folder, run, stage)
+    values = pd.read_pickle(os.path.join(stage_folder, "values.pkl"))
+    object_columns_path = os.path.join(stage_folder, "object_columns.json")
+    object_columns = {}
+    if os.path.exists(object_columns_path):
+        with open(object_columns_path) as f:
+            object_columns = json.load(f)
+    for file in sorted(os.listdir(stage_folder)):
+        if not file.endswith(".feather"):
+            continue
+        frame = feather.read_feather(os.path.join(stage_folder, file))
+        columns = object_columns.get(file[: -len(".feather")], [])
+        if columns:
+            frame[columns] = frame[columns].astype(object)
+        name, _, key = file[: -len(".feather")].partition(".")
+        if key:
+            values.setdefault(name, {})[key] = frame
+        else:
+            values[name] = frame
+    return values
+
+
+def load_checkpoint(folder: str, run: str, upto: str | None = None) -> dict:
+    """All values of the completed stages of `run` (up to and including `upto`), later stages win"""
+    manifest = read_manifest(folder, run)
+    if manifest is None:
+        raise ValueError(f"No checkpoint run {run} in {folder}")
+    values = {}
+    for stage in manifest["stages"]:
+        values.update(load_stage(folder, run, stage))
+        if stage == upto:
+            break
+    return values
+
+
+def list_runs(folder: str) -> pd.DataFrame:
+    """Checkpoint runs in `folder`, newest first: run, created, stages, params"""
+    rows = []
+    if os.path.exists(folder):
+        for run in os.listdir(folder):
+            manifest = read_manifest(folder, run)
+            if manifest:
+                rows.append(
+                    {
+                        "run": run,
+                        "created": pd.to_datetime(manifest["created"], unit="s"),
+                        "stages": ", ".join(manifest["stages"]),
+                        "params": manifest["params"],
+                    }
+                )
+    runs = pd.DataFrame(rows, columns=["run", "created", "stages", "params"])
+    return runs.sort_values("created", ascending=False).reset_index(drop=True)
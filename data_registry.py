@@ -0,0 +1,166 @@
+"""
+In-process registry of pulled data, shared by every entry point running in the same process
+(restock, multi-marketplace restock, sales forecast).
+Requests are keyed by source and parameters:
+    - an identical request that is already running is waited on instead of started again
+    - a date-windowed request is served from any cached window that covers it, by slicing on the date column
+Entries expire after `max_age_minutes`, `stats` counts hits, misses, coalesced and sliced requests.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, timedelta
+from typing import Any, Callable
+
+import pandas as pd
+
+MAX_AGE_MINUTES = 60
+
+
+def date_window(num_days: int, max_date: str | None = None) -> tuple[date, date]:
+    """[max_date - num_days, max_date] as dates, today if `max_date` is not set (same as CURRENT_DATE() in queries)"""
+    end = pd.to_datetime(max_date if max_date else "today").date()
+    return end - timedelta(days=num_days), end
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(x) for x in value)
+    return value
+
+
+def _slice_window(output: dict, window: tuple[date, date], date_column: str) -> dict:
+    start, end = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+    sliced = {}
+    for name, value in output.items():
+        if isinstance(value, pd.DataFrame) and date_column in value.columns:
+            dates = pd.to_datetime(value[date_column])
+            value = value.loc[dates.between(start, end)].reset_index(drop=True)
+        sliced[name] = value
+    return sliced
+
+
+def _copy(output: dict) -> dict:
+    # callers modify the frames they get (e.g. convert date columns), cached frames stay untouched
+    return {
+        name: value.copy() if isinstance(value, pd.DataFrame) else value
+        for name, value in output.items()
+    }
+
+
+class DataRegistry:
+    def __init__(self, max_age_minutes: int = MAX_AGE_MINUTES):
+        self.max_age_minutes = max_age_minutes
+        self._lock = threading.Lock()
+        # key -> list of (window, created, future with the `output` dict)
+        self._entries: dict[tuple, list[tuple[Any, float, Future]]] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "sliced": 0}
+
+    def _find(self, key: tuple, window: tuple[date, date] | None):
+        now = time.time()
+        entries = [
+            x
+            for x in self._entries.get(key, [])
+            if now - x[1] < self.max_age_minutes * 60
+            and not (x[2].done() and x[2].exception())
+        ]
+        self._entries[key] = entries
+        for entry in entries:
+            cached_window = entry[0]
+            if window is None or (
+                cached_window[0] <= window[0] and cached_window[1] >= window[1]
+            ):
+                return entry
+        return None
+
+    def fetch(
+        self,
+        func: Callable,
+        kwargs: dict | None = None,
+        window: tuple[date, date] | None = None,
+        window_params: tuple[str, ...] = ("num_days", "max_date"),
+        date_column: str = "date",
+    ) -> dict:
+        """
+        Run a `db_utils` style function `func(output=..., **kwargs)` once per key and return a copy of
+        what it wrote to `output`.
+        With `window` (see `date_window`), `window_params` are left out of the key and
+        a cached pull covering `window` is sliced down to it instead of pulling again.
+        """
+        kwargs = dict(kwargs or {})
+        kwargs.pop("output", None)
+        key_params = {
+            k: v
+            for k, v in kwargs.items()
+            if k != "to_print" and (window is None or k not in window_params)
+        }
+        key = (func.__module__, func.__name__, _freeze(key_params))
+
+        with self._lock:
+            entry = self._find(key, window)
+            if entry is None:
+                future = Future()
+                entry = (window, time.time(), future)
+                self._entries.setdefault(key, []).append(entry)
+                self._stats["misses"] += 1
+                owner = True
+            else:
+                future = entry[2]
+                owner = False
+                if not future.done():
+                    self._stats["coalesced"] += 1
+                elif entry[0] != window:
+                    self._stats["sliced"] += 1
+                else:
+                    self._stats["hits"] += 1
+
+        if owner:
+            output = {}
+            try:
+                func(output=output, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            future.set_result(output)
+
+        output = future.result()
+        if entry[0] != window:
+            output = _slice_window(output, window, date_column)  # type: ignore
+        return _copy(output)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def invalidate(self, window: tuple[date, date]) -> int:
+        """
+        Drop finished pulls whose window overlaps `window` and pulls without a window (dictionary, warehouse inventory...),
+        so they are pulled again. Other windows, pulls still running and stats are kept.
+        Returns the number of dropped entries.
+        """
+        dropped = 0
+        with self._lock:
+            for key, entries in self._entries.items():
+                kept = [
+                    x
+                    for x in entries
+                    if not x[2].done()
+                    or (
+                        x[0] is not None
+                        and (x[0][1] < window[0] or x[0][0] > window[1])
+                    )
+                ]
+                dropped += len(entries) - len(kept)
+                self._entries[key] = kept
+        return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats = {x: 0 for x in self._stats}
+
+
+registry = DataRegistry()
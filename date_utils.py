@@ -1,6 +1,7 @@
 import datetime
 from dataclasses import dataclass
 from enum import StrEnum
+from functools import lru_cache
 from typing import Any, Literal
 
 import pandas as pd
@@ -155,7 +156,14 @@ def get_event_days_delta():
     return nearest_event, days_to_event, events[nearest_event]["duration"]
 
 
-def is_event(year, month, day) -> Any:
+def event_is_near(event: str, days_to_event: int) -> bool:
+    """Whether the restock already covers `event`: from 45 days before BSS, 90 days before the other events"""
+    return days_to_event <= (45 if event == "BSS" else 90)
+
+
+@lru_cache(maxsize=None)
+def _event_month_days(year: int) -> dict[str, tuple[tuple[int, int], ...]]:
+    """(month, day) pairs of every event in `year`, cached since `is_event` is called for every forecast day."""
     event_config = {
         **events,
         "BFCM": {
@@ -173,8 +181,16 @@ def is_event(year, month, day) -> Any:
         .tolist()
         for key, value in event_config.items()
     }
+    return {
+        key: tuple((x.month, x.day) for x in value)
+        for key, value in future_event_dates.items()
+    }
+
+
+def is_event(year, month, day) -> Any:
+    future_event_dates = _event_month_days(year)
     for event in future_event_dates:
-        if (month, day) in ((x.month, x.day) for x in future_event_dates[event]):
+        if (month, day) in future_event_dates[event]:
             return event
     return None
 
@@ -4,10 +4,42 @@ from connectors import gcloud as gc
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from data_registry import date_window, registry
+from dimensions_store import get_dimensions
 from utils import size_match
 
 EVENT_SPREADSHEET_ID = "1_gSk2xSDuyEQ9qzI15NJBxVCBZSJMuTKS1pDsvnfes8"  # google spreadsheet with events data
 
+# marketplace code -> `sales_channel` value in `reports.all_orders`
+MARKETPLACES = {
+    "US": "Amazon.com",
+    "CA": "Amazon.ca",
+    "UK": "Amazon.co.uk",
+    "DE": "Amazon.de",
+}
+# results keys that are pulled per marketplace, everything else is shared reference data
+MARKETPLACE_RESULTS = (
+    "get_amazon_sales",
+    "get_amazon_inventory",
+    "get_amazon_inventory_snapshot",
+)
+# how far back `calculate_amazon_inventory` looks for the latest inventory snapshot
+INVENTORY_LOOKBACK_DAYS = 11
+
+
+def _marketplace_filter(marketplaces: list[str] | None) -> list[str]:
+    marketplaces = marketplaces or ["US"]
+    unknown = [x for x in marketplaces if x not in MARKETPLACES]
+    if unknown:
+        raise ValueError(f"Unknown marketplaces: {', '.join(unknown)}")
+    return marketplaces
+
+
+def _sales_channel_case(marketplaces: list[str]) -> str:
+    """Build a CASE expression mapping `sales_channel` back to marketplace code"""
+    whens = " ".join(f"WHEN '{MARKETPLACES[x]}' THEN '{x}'" for x in marketplaces)
+    return f"CASE sales_channel {whens} END"
+
 
 def get_event_spreadsheet(output: dict, to_print: bool = False) -> pd.DataFrame | None:
     """
@@ -34,19 +66,24 @@ def get_amazon_sales(
     to_print: bool = False,
     num_days: int = 180,
     max_date: str | None = None,
+    marketplaces: list[str] | None = None,
 ) -> pd.DataFrame | None:
     """
     Bohdan
-    pull sales for last `num_days` days excluding Prime Day for US market from `mellanni-project-da.reports.all_orders`. group by days.
+    pull sales for last `num_days` days excluding Prime Day for `marketplaces` (US by default) from `mellanni-project-da.reports.all_orders`. group by days.
+    all marketplaces are pulled in a single query, partitioned by the `marketplace` column.
     must return dataframe or error string
-    dataframe columns to return: date, asin, unit_sales, dollar_sales
+    dataframe columns to return: date, marketplace, sku, asin, unit_sales, dollar_sales
     """
+    marketplaces = _marketplace_filter(marketplaces)
+    sales_channels = ", ".join(f"'{MARKETPLACES[x]}'" for x in marketplaces)
     MAX_DATE = "CURRENT_DATE()" if not max_date else f'"{max_date}"'
     if to_print:
         print("Starting to run `get_amazon_sales`")
     query = f"""
         SELECT
             CAST(DATETIME(purchase_date, "America/Los_Angeles") AS DATE) AS date,
+            {_sales_channel_case(marketplaces)} AS marketplace,
             sku,
             asin,
             SUM(quantity) AS unit_sales,
@@ -55,9 +92,9 @@ def get_amazon_sales(
             `mellanni-project-da.reports.all_orders`
         WHERE
             CAST(DATETIME(purchase_date, "America/Los_Angeles") AS DATE) BETWEEN DATE_SUB({MAX_DATE}, INTERVAL {num_days + 90} DAY) AND {MAX_DATE}
-            AND sales_channel = 'Amazon.com'
+            AND sales_channel IN ({sales_channels})
         GROUP BY
-            date, sku, asin
+            date, marketplace, sku, asin
         ORDER BY
             date, sku, asin
     """
@@ -72,18 +109,64 @@ def get_amazon_sales(
         raise BaseException(f"error happened: {e}")
 
 
+def get_amazon_sales_daily(
+    output: dict,
+    to_print: bool = False,
+    min_date: str = "2015-01-01",
+    max_date: str | None = None,
+    marketplace: str = "US",
+) -> pd.DataFrame | None:
+    """
+    pull daily sales per asin between `min_date` and `max_date` (inclusive) for a single marketplace.
+    used to extend the local sales store (see `sales_store.py`), no sku breakdown.
+    dataframe columns to return: date, asin, unit_sales, dollar_sales
+    """
+    MAX_DATE = "CURRENT_DATE()" if not max_date else f'"{max_date}"'
+    if to_print:
+        print("Starting to run `get_amazon_sales_daily`")
+    query = f"""
+        SELECT
+            CAST(DATETIME(purchase_date, "America/Los_Angeles") AS DATE) AS date,
+            asin,
+            SUM(quantity) AS unit_sales,
+            SUM(item_price) AS dollar_sales
+        FROM
+            `mellanni-project-da.reports.all_orders`
+        WHERE
+            CAST(DATETIME(purchase_date, "America/Los_Angeles") AS DATE) BETWEEN "{min_date}" AND {MAX_DATE}
+            AND sales_channel = '{MARKETPLACES[marketplace]}'
+        GROUP BY
+            date, asin
+        ORDER BY
+            date, asin
+    """
+    try:
+        with gc.gcloud_connect() as client:
+            result = client.query(query).to_dataframe()
+        output["get_amazon_sales_daily"] = result
+        if to_print:
+            print("Saved data to results `get_amazon_sales_daily`")
+        return result
+    except Exception as e:
+        raise BaseException(f"error happened: {e}")
+
+
 def get_amazon_inventory(
     output: dict,
     to_print: bool = False,
     num_days: int = 180,
     max_date: str | None = None,
+    marketplaces: list[str] | None = None,
 ) -> pd.DataFrame | None:
     """
     Vitalii
-    pull inventory history for last `num_days` days for all skus in US from `mellanni-project-da.reports.fba_inventory_planning`
+    pull inventory history for last `num_days` days for all skus in `marketplaces` (US by default) from `mellanni-project-da.reports.fba_inventory_planning`
+    numeric history only (used for ISR), advisory columns of the latest day come from `get_amazon_inventory_snapshot`
     must return dataframe or error string
-    dataframe columns to return: date, sku, asin, Inventory_Supply_at_FBA renamed as "amz_inventory"
+    dataframe columns to return: date, marketplace, sku, asin, Inventory_Supply_at_FBA renamed as "amz_inventory"
     """
+    marketplaces = _marketplace_filter(marketplaces)
+    marketplace_list = ", ".join(f"'{x}'" for x in marketplaces)
     if to_print:
         print("Starting to run `get_amazon_inventory`")
     MAX_DATE = "CURRENT_DATE()" if not max_date else f'"{max_date}"'
@@ -91,6 +174,54 @@ def get_amazon_inventory(
     query = f"""
         SELECT
             DATE(snapshot_date) AS date,
+            marketplace,
+            sku,
+            asin,
+            Inventory_Supply_at_FBA AS amz_inventory
+        FROM
+            `mellanni-project-da.reports.fba_inventory_planning`
+        WHERE
+            marketplace IN ({marketplace_list})
+            AND DATE(snapshot_date) BETWEEN DATE_SUB({MAX_DATE}, INTERVAL {num_days} DAY) AND {MAX_DATE}
+        ORDER BY
+            date DESC, sku ASC
+    """
+
+    try:
+        with gc.gcloud_connect() as client:
+            df = client.query(query).to_dataframe()
+        output["get_amazon_inventory"] = df
+        if to_print:
+            print("Saved data to results `get_amazon_inventory`")
+        return df
+    except Exception as e:
+        raise BaseException(f"error happened: {e}")
+
+
+def get_amazon_inventory_snapshot(
+    output: dict,
+    to_print: bool = False,
+    max_date: str | None = None,
+    marketplaces: list[str] | None = None,
+    lookback_days: int = INVENTORY_LOOKBACK_DAYS,
+) -> pd.DataFrame | None:
+    """
+    pull the latest available inventory snapshot (within `lookback_days` before `max_date`) per marketplace
+    with availability and advisory columns from `mellanni-project-da.reports.fba_inventory_planning`
+    dataframe columns to return: date, marketplace, sku, asin, amz_available, amz_inventory, alert, recommended_action,
+        healthy_inventory_level, recommended_removal_quantity, estimated_excess_quantity,
+        fba_minimum_inventory_level, fba_inventory_level_health_status, storage_type
+    """
+    marketplaces = _marketplace_filter(marketplaces)
+    marketplace_list = ", ".join(f"'{x}'" for x in marketplaces)
+    if to_print:
+        print("Starting to run `get_amazon_inventory_snapshot`")
+    MAX_DATE = "CURRENT_DATE()" if not max_date else f'"{max_date}"'
+
+    query = f"""
+        SELECT
+            DATE(snapshot_date) AS date,
+            marketplace,
             sku,
             asin,
             available as amz_available,
@@ -106,23 +237,77 @@ def get_amazon_inventory(
         FROM
             `mellanni-project-da.reports.fba_inventory_planning`
         WHERE
-            marketplace = 'US'
-            AND DATE(snapshot_date) BETWEEN DATE_SUB({MAX_DATE}, INTERVAL {num_days} DAY) AND {MAX_DATE}
+            marketplace IN ({marketplace_list})
+            AND DATE(snapshot_date) BETWEEN DATE_SUB({MAX_DATE}, INTERVAL {lookback_days} DAY) AND {MAX_DATE}
+        QUALIFY
+            DATE(snapshot_date) = MAX(DATE(snapshot_date)) OVER (PARTITION BY marketplace)
         ORDER BY
-            date DESC, sku ASC
+            sku ASC
     """
 
     try:
         with gc.gcloud_connect() as client:
             df = client.query(query).to_dataframe()
-        output["get_amazon_inventory"] = df
+        output["get_amazon_inventory_snapshot"] = df
         if to_print:
-            print("Saved data to results `get_amazon_inventory`")
+            print("Saved data to results `get_amazon_inventory_snapshot`")
         return df
     except Exception as e:
         raise BaseException(f"error happened: {e}")
 
 
+def get_fba_inventory_daily(
+    output: dict,
+    to_print: bool = False,
+    min_date: str = "2024-01-01",
+    max_date: str | None = None,
+    marketplace: str = "US",
+) -> pd.DataFrame | None:
+    """
+    pull full daily inventory snapshots between `min_date` and `max_date` (inclusive) for a single marketplace
+    from `mellanni-project-da.reports.fba_inventory_planning`.
+    used to extend the local inventory store (see `inventory_store.py`).
+    dataframe columns to return: date, sku, asin, amz_inventory, amz_available, alert, recommended_action,
+        healthy_inventory_level, recommended_removal_quantity, estimated_excess_quantity,
+        fba_minimum_inventory_level, fba_inventory_level_health_status, storage_type
+    """
+    MAX_DATE = "CURRENT_DATE()" if not max_date else f'"{max_date}"'
+    if to_print:
+        print("Starting to run `get_fba_inventory_daily`")
+    query = f"""
+        SELECT
+            DATE(snapshot_date) AS date,
+            sku,
+            asin,
+            Inventory_Supply_at_FBA AS amz_inventory,
+            available as amz_available,
+            alert,
+            recommended_action,
+            healthy_inventory_level,
+            recommended_removal_quantity,
+            estimated_excess_quantity,
+            fba_minimum_inventory_level,
+            fba_inventory_level_health_status,
+            storage_type
+        FROM
+            `mellanni-project-da.reports.fba_inventory_planning`
+        WHERE
+            marketplace = '{marketplace}'
+            AND DATE(snapshot_date) BETWEEN "{min_date}" AND {MAX_DATE}
+        ORDER BY
+            sku, date
+    """
+    try:
+        with gc.gcloud_connect() as client:
+            result = client.query(query).to_dataframe()
+        output["get_fba_inventory_daily"] = result
+        if to_print:
+            print("Saved data to results `get_fba_inventory_daily`")
+        return result
+    except Exception as e:
+        raise BaseException(f"error happened: {e}")
+
+
 def get_wh_inventory(output: dict, to_print: bool = False) -> pd.DataFrame | None:
     """
     Sergey
@@ -241,36 +426,101 @@ def get_dictionary(output: dict, to_print: bool = False) -> pd.DataFrame | None:
         raise BaseException(f"error happened: {e}")
 
 
-def pull_data(num_days, max_date=None):
+def pull_data(
+    num_days,
+    max_date=None,
+    marketplaces: list[str] | None = None,
+    use_sales_store: bool = False,
+    use_inventory_store: bool = False,
+):
+    """
+    Pull all restock inputs in parallel.
+    `use_sales_store` - read date x asin sales from the local sales store (extending it first)
+    instead of pulling date x sku x asin order lines from BigQuery.
+    `use_inventory_store` - rebuild the inventory history from the local change-interval store
+    (extending it with new days first) instead of pulling every daily snapshot.
+    Every source goes through the in-process `data_registry.registry`: repeated or overlapping
+    pulls in the same process (e.g. restock after the forecast) reuse what's already in memory.
+    """
     results = dict()
-    date_kwargs = {"to_print": True, "output": results, "num_days": num_days}
+    date_kwargs = {
+        "to_print": True,
+        "num_days": num_days,
+        "marketplaces": marketplaces,
+    }
     if max_date:
         date_kwargs["max_date"] = max_date
-    kwargs = {"to_print": True, "output": results}
+    kwargs = {"to_print": True}
+    snapshot_kwargs = {k: v for k, v in date_kwargs.items() if k != "num_days"}
+
+    if use_sales_store:
+        from sales_store import get_amazon_sales_from_store
+
+        sales_func = get_amazon_sales_from_store
+    else:
+        sales_func = get_amazon_sales
+
+    if use_inventory_store:
+        from inventory_store import get_amazon_inventory_from_store
+
+        inventory_func = get_amazon_inventory_from_store
+    else:
+        inventory_func = get_amazon_inventory
 
     with ThreadPoolExecutor() as executor:
         futures = {
-            executor.submit(get_amazon_sales, **date_kwargs): "get_amazon_sales",
-            executor.submit(get_wh_inventory, **kwargs): "get_wh_inventory",
             executor.submit(
-                get_amazon_inventory, **date_kwargs
+                registry.fetch,
+                sales_func,
+                date_kwargs,
+                window=date_window(num_days + 90, max_date),
+            ): "get_amazon_sales",
+            executor.submit(
+                registry.fetch, get_wh_inventory, kwargs
+            ): "get_wh_inventory",
+            executor.submit(
+                registry.fetch,
+                inventory_func,
+                date_kwargs,
+                window=date_window(num_days, max_date),
             ): "get_amazon_inventory",
-            executor.submit(get_event_spreadsheet, **kwargs): "get_event_spreadsheet",
-            executor.submit(get_dictionary, **kwargs): "get_dictionary",
-            executor.submit(size_match.main, out=False): "size_match",
+            executor.submit(
+                registry.fetch, get_amazon_inventory_snapshot, snapshot_kwargs
+            ): "get_amazon_inventory_snapshot",
+            executor.submit(
+                registry.fetch, get_event_spreadsheet, kwargs
+            ): "get_event_spreadsheet",
+            executor.submit(registry.fetch, get_dictionary, kwargs): "get_dictionary",
+            executor.submit(registry.fetch, get_dimensions, kwargs): "size_match",
         }
         for future in as_completed(futures):
             func_name = futures[future]
             try:
-                result = future.result()
-                if func_name == "size_match":
-                    print(f"Received {func_name} results, saving to dict")
-                    results[func_name] = result
+                results.update(future.result())
             except Exception as e:
                 raise BaseException(f"Failed to pull data for {func_name}: {e}")
+    print(f"Data registry: {registry.stats()}")
     return results
 
 
+def split_results_by_marketplace(results: dict, marketplace: str) -> dict:
+    """
+    Return a copy of `pull_data` results limited to a single marketplace.
+    Per-marketplace tables are filtered on the `marketplace` column, shared reference data
+    (dictionary, event spreadsheet, warehouse inventory, size_match) is passed through as is -
+    every marketplace sees the whole warehouse inventory.
+    """
+    market_results = dict(results)
+    for key in MARKETPLACE_RESULTS:
+        if key not in results:
+            continue
+        df = results[key]
+        market_results[key] = df.loc[df["marketplace"] == marketplace].reset_index(
+            drop=True
+        )
+    return market_results
+
+
 def pull_data_old(num_days, max_date=None):
     results = dict()
     date_kwargs = {"to_print": True, "output": results, "num_days": num_days}
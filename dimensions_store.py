@@ -0,0 +1,124 @@
+"""
+Local cache of size_match dimensions, narrowed to what the restock uses (asin, sets in a box)
+and de-duplicated by asin.
+Each distinct content is stored once as dimensions_<hash>.feather, `manifest.json` points to the current version
+and records when size_match was last fetched. The cache is refreshed when older than `MAX_AGE_HOURS`
+or explicitly: `python dimensions_store.py`.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+from common import user_folder
+from pyarrow import feather
+
+from utils import size_match
+
+DIMENSIONS_FOLDER = os.path.join(user_folder, "dimensions")
+DIMENSIONS_COLUMNS = ["asin", "sets in a box"]
+MAX_AGE_HOURS = 24
+# number of previous versions kept on disk
+KEEP_VERSIONS = 5
+
+
+def _manifest_path() -> str:
+    os.makedirs(DIMENSIONS_FOLDER, exist_ok=True)
+    return os.path.join(DIMENSIONS_FOLDER, "manifest.json")
+
+
+def _version_path(content_hash: str) -> str:
+    return os.path.join(DIMENSIONS_FOLDER, f"dimensions_{content_hash}.feather")
+
+
+def _read_manifest() -> dict | None:
+    path = _manifest_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest: dict) -> None:
+    path = _manifest_path()
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def narrow_dimensions(dimensions: pd.DataFrame) -> pd.DataFrame:
+    return (
+        dimensions.loc[:, DIMENSIONS_COLUMNS]
+        .drop_duplicates("asin")
+        .sort_values("asin", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def content_hash(dimensions: pd.DataFrame) -> str:
+    row_hashes = pd.util.hash_pandas_object(dimensions, index=False).values
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()[:16]
+
+
+def refresh_dimensions(to_print: bool = False) -> pd.DataFrame:
+    """Fetch size_match, store a new version if the content changed and mark the cache as fresh"""
+    dimensions = narrow_dimensions(size_match.main(out=False))
+    new_hash = content_hash(dimensions)
+    manifest = _read_manifest() or {"hash": None, "versions": []}
+    if manifest["hash"] != new_hash:
+        path = _version_path(new_hash)
+        feather.write_feather(dimensions, path + ".tmp", compression="uncompressed")
+        os.replace(path + ".tmp", path)
+        versions = [x for x in manifest["versions"] if x != new_hash] + [new_hash]
+        for old_hash in versions[:-KEEP_VERSIONS]:
+            if os.path.exists(_version_path(old_hash)):
+                os.remove(_version_path(old_hash))
+        manifest["versions"] = versions[-KEEP_VERSIONS:]
+        if to_print:
+            print(
+                f"Dimensions changed, stored version {new_hash} ({len(dimensions)} asins)"
+            )
+    elif to_print:
+        print(f"Dimensions unchanged (version {new_hash})")
+    manifest["hash"] = new_hash
+    manifest["fetched_at"] = time.time()
+    manifest["rows"] = len(dimensions)
+    _write_manifest(manifest)
+    return dimensions
+
+
+def load_dimensions(
+    max_age_hours: float = MAX_AGE_HOURS, to_print: bool = False
+) -> pd.DataFrame:
+    """Current dimensions from the cache, fetched from size_match only if missing or older than `max_age_hours`"""
+    manifest = _read_manifest()
+    if (
+        manifest is None
+        or time.time() - manifest["fetched_at"] > max_age_hours * 3600
+        or not os.path.exists(_version_path(manifest["hash"]))
+    ):
+        return refresh_dimensions(to_print=to_print)
+    return feather.read_feather(_version_path(manifest["hash"]))
+
+
+def get_dimensions(
+    output: dict, to_print: bool = False, max_age_hours: float = MAX_AGE_HOURS
+) -> pd.DataFrame:
+    """
+    `pull_data` source for size_match, served from the local dimensions cache
+    dataframe columns to return: asin, sets in a box
+    """
+    if to_print:
+        print("Starting to run `get_dimensions`")
+    result = load_dimensions(max_age_hours=max_age_hours, to_print=to_print)
+    output["size_match"] = result
+    if to_print:
+        print("Saved data to results `size_match`")
+    return result
+
+
+if __name__ == "__main__":
+    refresh_dimensions(to_print="-q" not in sys.argv)
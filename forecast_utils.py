@@ -0,0 +1,435 @@
+import os
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from date_utils import events, is_event
+from restock_utils import event_forecast_units, filter_event_spreadsheet
+
+# first day of each month in a 366-day (leap year) calendar, used to index the seasonality table
+MONTH_OFFSETS = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+SEASONALITY_START = "2023-01-01"
+
+# "avg units" is updated as an exponential moving average over 180 days after every non-event day
+AVG_UNITS_DECAY = 179 / 180
+
+
+def month_day_slots(dates) -> np.ndarray:
+    """Position of each date's (month, day) in the 366-slot seasonality table"""
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return MONTH_OFFSETS[dates.month.values - 1] + dates.day.values - 1
+
+
+def build_seasonality_table(
+    daily_sales: pd.DataFrame,
+    event_dates: list,
+    start_date: str = SEASONALITY_START,
+    cache_folder: str | None = None,
+) -> np.ndarray:
+    """
+    Seasonality coefficient for every (month, day) as a 366-slot array.
+    `daily_sales` is total company units per date (date, unit_sales), `event_dates` are excluded.
+    coefficient = 3-day mean of (units / 180-day rolling mean of units), averaged over all years since `start_date`.
+    Missing (month, day) slots take the next available day's coefficient.
+    If `cache_folder` is given, the table is cached there keyed by the last date of the sales history.
+    """
+    daily_sales = daily_sales.loc[:, ["date", "unit_sales"]].copy()
+    daily_sales["date"] = pd.to_datetime(daily_sales["date"])
+    daily_sales = daily_sales.sort_values("date")
+
+    cache_path = None
+    if cache_folder:
+        last_date = daily_sales["date"].max().strftime("%Y-%m-%d")
+        cache_path = os.path.join(
+            cache_folder, f"seasonality_{start_date}_{last_date}.npy"
+        )
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+    non_event_sales = daily_sales.loc[
+        ~daily_sales["date"].isin(pd.to_datetime(list(event_dates)))
+    ]
+    units = non_event_sales["unit_sales"].astype(float)
+    coeff_raw = units / units.rolling(window=180).mean()
+    coeff = coeff_raw.rolling(window=3).mean()
+
+    in_range = non_event_sales["date"].between(
+        pd.to_datetime(start_date), pd.to_datetime("today"), inclusive="left"
+    )
+    coeff = coeff.loc[in_range.values]
+    slots = month_day_slots(non_event_sales.loc[in_range.values, "date"])
+
+    # plain mean per slot, NaN if any year's coefficient is NaN
+    counts = np.bincount(slots, minlength=366)
+    sums = np.bincount(slots, weights=coeff.fillna(0).values, minlength=366)
+    nans = np.bincount(slots, weights=coeff.isna().values, minlength=366)
+    table = np.full(366, np.nan)
+    present = counts > 0
+    table[present] = sums[present] / counts[present]
+    table[nans > 0] = np.nan
+
+    # fill gaps with the next available slot, wrapping from Dec 31 to Jan 1
+    available = np.flatnonzero(present)
+    if len(available) == 0:
+        raise BaseException("No sales history to build seasonality coefficients")
+    next_available = np.searchsorted(available, np.arange(366)) % len(available)
+    table = np.where(present, table, table[available[next_available]])
+
+    if cache_path:
+        np.save(cache_path, table)
+    return table
+
+
+def seasonality_coefficients(table: np.ndarray, dates) -> np.ndarray:
+    """Look up seasonality coefficients for `dates`"""
+    return table[month_day_slots(dates)]
+
+
+def get_event_calendar(future_date_range: pd.DatetimeIndex) -> list[str | None]:
+    """Event name (or None) for every date in the forecast horizon"""
+    return [is_event(date.year, date.month, date.day) for date in future_date_range]
+
+
+def event_arrays(
+    asins: pd.Series,
+    full_event_df: pd.DataFrame,
+    event_names: list[str],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Average event sales, best event performance (both event x asin) and event durations
+    aligned to `asins`, pulled once per event instead of once per forecast day.
+    """
+    average_sales = np.zeros((len(event_names), len(asins)))
+    best_performance = np.zeros((len(event_names), len(asins)))
+    durations = np.zeros(len(event_names))
+    asin_frame = pd.DataFrame({"asin": asins.values})
+    for i, event in enumerate(event_names):
+        event_df = filter_event_spreadsheet(
+            full_spreadsheet=full_event_df, event=event  # type: ignore
+        )
+        if event_df is None:
+            raise BaseException("Could not pull create event_df dataframe")
+        event_df = pd.merge(
+            asin_frame, event_df, how="left", on="asin", validate="m:1"
+        ).fillna(0)
+        average_sales[i] = event_df[f"Average {event} sales, units (total)"].astype(
+            float
+        )
+        best_performance[i] = event_df[f"Best {event} performance"].astype(float)
+        durations[i] = events[event]["duration"]
+    return average_sales, best_performance, durations
+
+
+def _forecast_step(
+    avg_units: np.ndarray,
+    total_inventory: np.ndarray,
+    capped: np.ndarray,
+    coefficient: float,
+    event: int,
+    event_average_sales: np.ndarray,
+    event_best_performance: np.ndarray,
+    event_durations: np.ndarray,
+    demand_noise: Callable[[np.ndarray], np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One day of the forecast recurrence, works on (asins,) or (paths, asins) arrays:
+        units = avg units * seasonality coefficient, or event forecast / event duration on event days
+        `demand_noise` (if any) turns expected units into a random demand draw
+        capped asins (discontinued / "Do not ship to amazon") can't sell more than total inventory left
+        avg units moves towards units (179/180 decay), on non-event days only
+        total inventory is drawn down by units (clipped at 0)
+    """
+    if event >= 0:
+        day_units = (
+            event_forecast_units(
+                avg_units=avg_units,
+                average_event_sales=event_average_sales[event],
+                best_event_performance=event_best_performance[event],
+                event_duration=event_durations[event],
+            )
+            / event_durations[event]
+        )
+    else:
+        day_units = avg_units * coefficient
+    if demand_noise is not None:
+        day_units = demand_noise(day_units)
+    day_units = np.where(capped, np.fmin(total_inventory, day_units), day_units)
+    if event < 0:
+        avg_units = avg_units * AVG_UNITS_DECAY + day_units * (1 / 180)
+    total_inventory = total_inventory - day_units.clip(0)
+    return day_units, avg_units, total_inventory
+
+
+def forecast_kernel(
+    avg_units: np.ndarray,
+    total_inventory: np.ndarray,
+    capped: np.ndarray,
+    coefficients: np.ndarray,
+    event_index: np.ndarray,
+    event_average_sales: np.ndarray,
+    event_best_performance: np.ndarray,
+    event_durations: np.ndarray,
+    dtype=np.float64,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Evaluate the daily forecast recurrence (see `_forecast_step`) for all asins at once.
+    Returns the asin x day units matrix (in `dtype`) and the final avg units and total inventory per asin.
+    `event_index` is the position of the day's event in the event_* arrays or -1 for regular days.
+    """
+    n_days = len(coefficients)
+    avg_units = np.asarray(avg_units, dtype=np.float64).copy()
+    total_inventory = np.asarray(total_inventory, dtype=np.float64).copy()
+    capped = np.asarray(capped, dtype=bool)
+    units = np.empty((len(avg_units), n_days), dtype=dtype)
+
+    for day in range(n_days):
+        units[:, day], avg_units, total_inventory = _forecast_step(
+            avg_units,
+            total_inventory,
+            capped,
+            coefficients[day],
+            event_index[day],
+            event_average_sales,
+            event_best_performance,
+            event_durations,
+        )
+    return units, avg_units, total_inventory
+
+
+def _event_index(calendar: list[str | None]) -> tuple[list[str], np.ndarray]:
+    event_names = sorted({x for x in calendar if x})
+    event_index = np.array(
+        [event_names.index(x) if x else -1 for x in calendar], dtype=int
+    )
+    return event_names, event_index
+
+
+def _capped(forecast: pd.DataFrame) -> np.ndarray:
+    return (
+        (forecast["restockable"] == "Do not ship to amazon")
+        | (forecast["life stage"] == "Discontinued")
+    ).values
+
+
+def stacked_units(
+    forecast: pd.DataFrame,
+    future_date_range: pd.DatetimeIndex,
+    coefficients: np.ndarray,
+    full_event_df: pd.DataFrame,
+) -> np.ndarray:
+    """
+    asin x day units of the stacked forecast, rows follow `forecast` order.
+    `forecast` must contain asin, avg units, total_inventory, life stage and restockable,
+    `coefficients` are the seasonality coefficients for every date in `future_date_range`.
+    """
+    calendar = get_event_calendar(future_date_range)
+    event_names, event_index = _event_index(calendar)
+    average_sales, best_performance, durations = event_arrays(
+        forecast["asin"], full_event_df, event_names
+    )
+
+    units, _, _ = forecast_kernel(
+        avg_units=forecast["avg units"].values,
+        total_inventory=forecast["total_inventory"].values,
+        capped=_capped(forecast),
+        coefficients=np.asarray(coefficients, dtype=np.float64),
+        event_index=event_index,
+        event_average_sales=average_sales,
+        event_best_performance=best_performance,
+        event_durations=durations,
+    )
+    return units
+
+
+def stacked_chunks(
+    forecast: pd.DataFrame,
+    future_date_range: pd.DatetimeIndex,
+    units: np.ndarray,
+) -> Iterator[tuple[str, pd.DataFrame]]:
+    """
+    Long (asin x date) frames with asin, date, event, units and $ columns, one month ("YYYY-MM") at a time.
+    Only the current month's rows exist in memory, the full year is never concatenated.
+    """
+    calendar = np.array(
+        [x if x else "" for x in get_event_calendar(future_date_range)], dtype=object
+    )
+    dates = np.array([x.date() for x in future_date_range], dtype=object)
+    months = future_date_range.strftime("%Y-%m")
+    n_asins = len(forecast)
+    asins = forecast["asin"].values
+    prices = forecast["avg price"].values
+    for month in pd.unique(months):
+        days = np.flatnonzero(months == month)
+        n_days = len(days)
+        # day-major order, same as concatenating one frame per day
+        day_units = units[:, days].T.ravel()
+        yield month, pd.DataFrame(
+            {
+                "asin": np.tile(asins, n_days),
+                "date": np.repeat(dates[days], n_asins),
+                "event": np.repeat(calendar[days], n_asins),
+                "units": day_units,
+                "$": day_units * np.tile(prices, n_days),
+            }
+        )
+
+
+def stacked_forecast(
+    forecast: pd.DataFrame,
+    future_date_range: pd.DatetimeIndex,
+    coefficients: np.ndarray,
+    full_event_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Long (asin x date) forecast with asin, date, event, units and $ columns in a single frame.
+    `forecast` must also contain avg price, see `stacked_units` for the rest.
+    """
+    units = stacked_units(forecast, future_date_range, coefficients, full_event_df)
+    return pd.concat(
+        [x for _, x in stacked_chunks(forecast, future_date_range, units)],
+        ignore_index=True,
+    )
+
+
+def daily_forecast(
+    forecast: pd.DataFrame,
+    future_date_range: pd.DatetimeIndex,
+    coefficients: np.ndarray,
+) -> tuple[pd.DataFrame, pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    Wide forecast without events or caps: one column per date in `future_date_range`.
+    Units and dollars are computed as contiguous float32 asin x day matrices and each frame is built
+    in a single construction. Returns units frame, dollars frame and the two matrices
+    (the units frame carries the final "avg units", like the old column-by-column loop did).
+    """
+    n_asins = len(forecast)
+    units, avg_units, _ = forecast_kernel(
+        avg_units=forecast["avg units"].values,
+        total_inventory=np.zeros(n_asins),
+        capped=np.zeros(n_asins, dtype=bool),
+        coefficients=np.asarray(coefficients, dtype=np.float64),
+        event_index=np.full(len(coefficients), -1),
+        event_average_sales=np.zeros((0, n_asins)),
+        event_best_performance=np.zeros((0, n_asins)),
+        event_durations=np.zeros(0),
+        dtype=np.float32,
+    )
+    dollars = units * forecast["avg price"].values.astype(np.float32)[:, None]
+    date_columns = [x.date() for x in future_date_range]
+
+    units_forecast = forecast.copy()
+    units_forecast["avg units"] = avg_units
+    units_forecast = pd.concat(
+        [
+            units_forecast,
+            pd.DataFrame(units, columns=date_columns, index=forecast.index),
+        ],
+        axis=1,
+    )
+    dollars_forecast = pd.concat(
+        [forecast, pd.DataFrame(dollars, columns=date_columns, index=forecast.index)],
+        axis=1,
+    )
+    return units_forecast, dollars_forecast, units, dollars
+
+
+def probabilistic_forecast(
+    forecast: pd.DataFrame,
+    future_date_range: pd.DatetimeIndex,
+    coefficients: np.ndarray,
+    full_event_df: pd.DataFrame,
+    n_paths: int = 2000,
+    quantiles: tuple[float, ...] = (0.5, 0.9),
+    dispersion: float = 0.3,
+    chunk_size: int = 250,
+    seed: int | list[int] | None = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Monte Carlo version of the stacked forecast: `n_paths` demand paths per asin.
+    Daily demand is a gamma-Poisson draw around the same expected units as the deterministic forecast
+    (seasonality, event forecasts, avg units decay, caps and inventory drawdown), `dispersion` is the
+    coefficient of variation of the gamma multiplier.
+    Paths are simulated as a paths x asins array per day, `chunk_size` asins at a time to bound memory.
+    Returns:
+        summary - per asin: total units quantiles over the horizon, stockout probability
+            (total_inventory runs out before the end of the horizon) and stockout date quantiles
+        monthly - per asin and month: mean and units quantiles
+    """
+    rng = np.random.default_rng(seed)
+    shape = 1 / dispersion**2
+
+    def _demand(expected):
+        multiplier = rng.standard_gamma(shape, expected.shape, dtype=np.float32)
+        return rng.poisson(np.clip(expected, 0, None) * (multiplier / shape)).astype(
+            np.float64
+        )
+
+    calendar = get_event_calendar(future_date_range)
+    event_names, event_index = _event_index(calendar)
+    average_sales, best_performance, durations = event_arrays(
+        forecast["asin"], full_event_df, event_names
+    )
+    capped = _capped(forecast)
+    months = future_date_range.strftime("%Y-%m")
+    month_names, month_index = np.unique(months, return_inverse=True)
+    dates = np.array([x.date() for x in future_date_range], dtype=object)
+    n_days = len(dates)
+    percent = [f"P{round(q * 100)}" for q in quantiles]
+
+    summaries, monthly = [], []
+    for start in range(0, len(forecast), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        n_asins = len(forecast.iloc[chunk])
+        avg_units = np.broadcast_to(
+            forecast["avg units"].values[chunk].astype(np.float64), (n_paths, n_asins)
+        )
+        initial_inventory = forecast["total_inventory"].values[chunk].astype(np.float64)
+        total_inventory = np.broadcast_to(initial_inventory, (n_paths, n_asins))
+        month_units = np.zeros((len(month_names), n_paths, n_asins), dtype=np.float32)
+        # day index of the first day without inventory, `n_days` if it never runs out
+        stockout_day = np.full((n_paths, n_asins), n_days)
+        stockout_day[total_inventory <= 0] = 0
+
+        for day in range(n_days):
+            day_units, avg_units, total_inventory = _forecast_step(
+                avg_units,
+                total_inventory,
+                capped[chunk],
+                coefficients[day],
+                event_index[day],
+                average_sales[:, chunk],
+                best_performance[:, chunk],
+                durations,
+                demand_noise=_demand,
+            )
+            month_units[month_index[day]] += day_units
+            stockout_day[(total_inventory <= 0) & (stockout_day == n_days)] = day
+
+        total_units = month_units.sum(axis=0)
+        summary = pd.DataFrame({"asin": forecast["asin"].values[chunk]})
+        summary["mean units"] = total_units.mean(axis=0)
+        for name, q in zip(percent, quantiles):
+            summary[f"{name} units"] = np.quantile(total_units, q, axis=0)
+        summary["stockout probability"] = (stockout_day < n_days).mean(axis=0)
+        for name, q in zip(percent, quantiles):
+            day_q = np.quantile(stockout_day, q, axis=0, method="lower")
+            summary[f"{name} stockout date"] = [
+                dates[x] if x < n_days else None for x in day_q
+            ]
+        summaries.append(summary)
+
+        month_frame = pd.DataFrame(
+            {
+                "asin": np.tile(forecast["asin"].values[chunk], len(month_names)),
+                "month": np.repeat(month_names, n_asins),
+                "mean units": month_units.mean(axis=1).ravel(),
+            }
+        )
+        for name, q in zip(percent, quantiles):
+            month_frame[f"{name} units"] = np.quantile(month_units, q, axis=1).ravel()
+        monthly.append(month_frame)
+
+    return pd.concat(summaries, ignore_index=True), pd.concat(
+        monthly, ignore_index=True
+    )
@@ -0,0 +1,387 @@
+import os
+from datetime import date, timedelta
+from typing import Callable, Literal
+
+import numpy as np
+import pandas as pd
+
+from date_utils import get_last_non_event_days
+from restock_utils import combine_sales_windows
+
+STATE_VERSION = 1
+
+
+def _row_hashes(df: pd.DataFrame, key: str) -> pd.Series:
+    """
+    Order-independent hash of all rows belonging to each `key` value.
+    Row hashes are summed (with uint64 wraparound) so the result doesn't depend on row order.
+    """
+    if df.empty:
+        return pd.Series(dtype="uint64")
+    row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False).values
+    return pd.Series(row_hashes).groupby(df[key].values).sum()
+
+
+def _window_sums(ledger: pd.DataFrame, key: str, value_cols: list[str]):
+    sums = ledger.groupby(key)[value_cols].sum()
+    sums["rows"] = ledger.groupby(key).size()
+    return sums
+
+
+def _apply_window_delta(
+    sums: pd.DataFrame,
+    entering: pd.DataFrame,
+    leaving: pd.DataFrame,
+    key: str,
+    value_cols: list[str],
+) -> pd.DataFrame:
+    """Add rows entering the window and subtract rows leaving it, drop keys with no rows left"""
+    delta = _window_sums(entering, key, value_cols).sub(
+        _window_sums(leaving, key, value_cols), fill_value=0
+    )
+    sums = sums.add(delta, fill_value=0)
+    return sums.loc[sums["rows"] > 0].sort_index()
+
+
+def _sales_window_days(
+    sales_max_date: date,
+    include_events: bool,
+    long_term_days: int,
+    short_term_days: int,
+) -> tuple[list, list]:
+    long_days = get_last_non_event_days(
+        num_days=long_term_days, max_date=sales_max_date, include_events=include_events
+    )
+    short_days = get_last_non_event_days(
+        num_days=short_term_days, max_date=sales_max_date, include_events=include_events
+    )
+    return long_days, short_days
+
+
+def _sales_max_date(amazon_sales: pd.DataFrame) -> date:
+    """Same as `get_asin_sales`: the last (possibly partial) day is not used"""
+    return (pd.to_datetime(amazon_sales["date"]).max() - pd.Timedelta(days=1)).date()
+
+
+def _sales_ledger(amazon_sales: pd.DataFrame, days: list) -> pd.DataFrame:
+    ledger = amazon_sales.loc[:, ["date", "asin", "unit_sales", "dollar_sales"]].copy()
+    ledger["date"] = pd.to_datetime(ledger["date"]).dt.date
+    ledger = ledger.loc[ledger["date"].isin(days)]
+    return ledger.fillna(0)
+
+
+def _inventory_ledger(
+    amazon_inventory: pd.DataFrame,
+    col_to_use: Literal["asin", "sku"],
+    window_start: date,
+    inv_max_date: date,
+) -> pd.DataFrame:
+    """Daily in-stock flags per `col_to_use`, same grouping as `calculate_inventory_isr`"""
+    ledger = amazon_inventory.loc[:, ["date", col_to_use, "amz_inventory"]].copy()
+    ledger["date"] = pd.to_datetime(ledger["date"]).dt.date
+    ledger = ledger.groupby(["date", col_to_use]).agg("sum").reset_index()
+    ledger = ledger.loc[ledger["date"].between(window_start, inv_max_date)]
+    ledger["instock"] = (ledger["amz_inventory"] > 0).astype(int)
+    return ledger.loc[:, ["date", col_to_use, "instock"]]
+
+
+def _isr_from_counts(
+    long_counts: pd.DataFrame,
+    short_counts: pd.DataFrame,
+    col_to_use: Literal["asin", "sku"],
+) -> pd.DataFrame:
+    asin_isr = pd.DataFrame(
+        {"ISR": (long_counts["instock"] / long_counts["rows"]).round(2)}
+    )
+    asin_isr["ISR_short"] = (short_counts["instock"] / short_counts["rows"]).round(2)
+    asin_isr.index.name = col_to_use
+    return asin_isr.reset_index().fillna(0)
+
+
+def build_restock_state(
+    amazon_sales: pd.DataFrame,
+    amazon_inventory: pd.DataFrame,
+    params: dict,
+    reference_date: date,
+) -> dict:
+    """
+    Build per-asin (and per-sku for ISR) window state from fully pulled data.
+    `amazon_sales` is the date x asin frame from `prepare_data`, `params` are the run parameters
+    (num_days, num_short_term_days, include_events, marketplace) the state is valid for,
+    `reference_date` is the end of the pull window (max_date or today).
+    """
+    sales_max_date = _sales_max_date(amazon_sales)
+    long_days, short_days = _sales_window_days(
+        sales_max_date,
+        params["include_events"],
+        params["num_days"],
+        params["num_short_term_days"],
+    )
+    sales_ledger = _sales_ledger(amazon_sales, long_days)
+    value_cols = ["unit_sales", "dollar_sales"]
+
+    inv_max_date = pd.to_datetime(amazon_inventory["date"]).max().date()
+    window_start = reference_date - timedelta(days=params["num_days"])
+    state = {
+        "version": STATE_VERSION,
+        "params": params,
+        "reference_date": reference_date,
+        "sales_max_date": sales_max_date,
+        "long_days": long_days,
+        "short_days": short_days,
+        "sales_ledger": sales_ledger,
+        "sales_long": _window_sums(sales_ledger, "asin", value_cols),
+        "sales_short": _window_sums(
+            sales_ledger.loc[sales_ledger["date"].isin(short_days)], "asin", value_cols
+        ),
+        "inv_max_date": inv_max_date,
+        "aggregates": {},
+    }
+    for col_to_use in ("asin", "sku"):
+        ledger = _inventory_ledger(
+            amazon_inventory, col_to_use, window_start, inv_max_date
+        )
+        short_start = inv_max_date - timedelta(days=13)
+        state[f"isr_ledger_{col_to_use}"] = ledger
+        state[f"isr_long_{col_to_use}"] = _window_sums(ledger, col_to_use, ["instock"])
+        state[f"isr_short_{col_to_use}"] = _window_sums(
+            ledger.loc[ledger["date"] >= short_start], col_to_use, ["instock"]
+        )
+    return state
+
+
+def advance_restock_state(
+    state: dict,
+    amazon_sales: pd.DataFrame,
+    amazon_inventory: pd.DataFrame,
+    reference_date: date,
+) -> dict:
+    """
+    Move the sales and ISR windows forward to the latest date in `amazon_sales` / `amazon_inventory`.
+    Days leaving the windows are subtracted using the stored ledgers, every day the new pull covers
+    replaces the stored one (the last days of the previous run may have been partial),
+    so the new pull only needs to cover the days since the last run.
+    """
+    params = state["params"]
+    state = dict(state)
+    value_cols = ["unit_sales", "dollar_sales"]
+
+    sales_max_date = _sales_max_date(amazon_sales)
+    long_days, short_days = _sales_window_days(
+        sales_max_date,
+        params["include_events"],
+        params["num_days"],
+        params["num_short_term_days"],
+    )
+    old_ledger = state["sales_ledger"]
+    pulled_days = set(pd.to_datetime(amazon_sales["date"]).dt.date)
+    refreshed_days = (set(long_days) - set(state["long_days"])) | (
+        pulled_days & set(long_days)
+    )
+    removed_days = (set(state["long_days"]) - set(long_days)) | refreshed_days
+    entering = _sales_ledger(amazon_sales, sorted(refreshed_days))
+    leaving = old_ledger.loc[old_ledger["date"].isin(removed_days)]
+    state["sales_long"] = _apply_window_delta(
+        state["sales_long"], entering, leaving, "asin", value_cols
+    )
+    ledger = pd.concat(
+        [old_ledger.loc[~old_ledger["date"].isin(removed_days)], entering],
+        ignore_index=True,
+    )
+
+    short_entering = ledger.loc[
+        ledger["date"].isin(
+            (set(short_days) - set(state["short_days"]))
+            | (set(short_days) & refreshed_days)
+        )
+    ]
+    short_leaving = old_ledger.loc[
+        old_ledger["date"].isin(
+            (set(state["short_days"]) - set(short_days))
+            | (set(state["short_days"]) & refreshed_days)
+        )
+    ]
+    state["sales_short"] = _apply_window_delta(
+        state["sales_short"], short_entering, short_leaving, "asin", value_cols
+    )
+    state["sales_ledger"] = ledger
+    state["sales_max_date"] = sales_max_date
+    state["long_days"], state["short_days"] = long_days, short_days
+
+    old_inv_max_date = state["inv_max_date"]
+    inv_max_date = pd.to_datetime(amazon_inventory["date"]).max().date()
+    # re-pulled inventory days replace the stored ones as well
+    refresh_start = min(
+        pd.to_datetime(amazon_inventory["date"]).min().date(),
+        old_inv_max_date + timedelta(days=1),
+    )
+    window_start = reference_date - timedelta(days=params["num_days"])
+    short_start = inv_max_date - timedelta(days=13)
+    old_short_start = old_inv_max_date - timedelta(days=13)
+    for col_to_use in ("asin", "sku"):
+        ledger = state[f"isr_ledger_{col_to_use}"]
+        entering = _inventory_ledger(
+            amazon_inventory,
+            col_to_use,
+            max(refresh_start, window_start),
+            inv_max_date,
+        )
+        removed = (ledger["date"] < window_start) | (ledger["date"] >= refresh_start)
+        state[f"isr_long_{col_to_use}"] = _apply_window_delta(
+            state[f"isr_long_{col_to_use}"],
+            entering,
+            ledger.loc[removed],
+            col_to_use,
+            ["instock"],
+        )
+        short_leaving = ledger.loc[
+            (ledger["date"] >= old_short_start)
+            & ((ledger["date"] < short_start) | (ledger["date"] >= refresh_start))
+        ]
+        state[f"isr_short_{col_to_use}"] = _apply_window_delta(
+            state[f"isr_short_{col_to_use}"],
+            entering.loc[entering["date"] >= max(short_start, refresh_start)],
+            short_leaving,
+            col_to_use,
+            ["instock"],
+        )
+        state[f"isr_ledger_{col_to_use}"] = pd.concat(
+            [ledger.loc[~removed], entering], ignore_index=True
+        )
+    state["inv_max_date"] = inv_max_date
+    state["reference_date"] = reference_date
+    return state
+
+
+def state_total_sales(
+    state: dict,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Return asin_isr, sku_isr and total_sales computed from the window state"""
+    params = state["params"]
+    asin_isr = _isr_from_counts(
+        state["isr_long_asin"], state["isr_short_asin"], col_to_use="asin"
+    )
+    sku_isr = _isr_from_counts(
+        state["isr_long_sku"], state["isr_short_sku"], col_to_use="sku"
+    )
+    value_cols = ["unit_sales", "dollar_sales"]
+    total_sales = combine_sales_windows(
+        state["sales_long"][value_cols].reset_index(),
+        state["sales_short"][value_cols].reset_index(),
+        asin_isr,
+        long_term_days=params["num_days"],
+        short_term_days=params["num_short_term_days"],
+    )
+    return asin_isr, sku_isr, total_sales
+
+
+def reuse_unchanged(
+    state: dict,
+    name: str,
+    inputs: pd.DataFrame,
+    key: str,
+    compute: Callable[[pd.DataFrame], pd.DataFrame],
+) -> pd.DataFrame:
+    """
+    Per-key memoization of an aggregate stored in `state["aggregates"][name]`.
+    Rows of `inputs` are hashed per `key`, `compute` is called only on the keys whose inputs
+    changed (or are new), stored output rows are reused for the rest.
+    """
+    hashes = _row_hashes(inputs, key)
+    stored = state["aggregates"].get(name)
+    if stored is None:
+        changed = hashes.index
+        reused = None
+    else:
+        stored_hashes, stored_output = stored
+        same = hashes.reindex(stored_hashes.index).eq(stored_hashes)
+        unchanged = same[same].index
+        changed = hashes.index.difference(unchanged)
+        reused = stored_output.loc[stored_output[key].isin(unchanged)]
+
+    recomputed = compute(inputs.loc[inputs[key].isin(changed)])
+    output = pd.concat(
+        [x for x in (reused, recomputed) if x is not None and len(x) > 0],
+        ignore_index=True,
+    )
+    if output.empty:
+        output = recomputed
+    output = output.sort_values(key).reset_index(drop=True)
+    state["aggregates"][name] = (hashes, output)
+    print(f"`{name}`: recomputed {len(changed)} of {len(hashes)} {key}s")
+    return output
+
+
+def state_pull_days(
+    state: dict | None, params: dict, reference_date: date
+) -> int | None:
+    """
+    Number of days to pull for an incremental run, or None if the state can't be used
+    (missing, built with different parameters or too old) and a full run is needed.
+    """
+    if not state or state.get("version") != STATE_VERSION:
+        return None
+    if state["params"] != params:
+        return None
+    gap = (reference_date - state["reference_date"]).days
+    if gap < 0 or gap >= params["num_short_term_days"]:
+        return None
+    # cover the days since last run plus `calculate_amazon_inventory` lookback
+    return gap + 3
+
+
+def load_restock_state(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_pickle(path)
+    except Exception as e:
+        print(f"Could not read restock state from {path}, running full recompute: {e}")
+        return None
+
+
+def save_restock_state(state: dict, path: str) -> None:
+    pd.to_pickle(state, path)
+
+
+def verify_frames(
+    name: str,
+    incremental: pd.DataFrame,
+    full: pd.DataFrame,
+    key: str,
+    exclude: tuple = (),
+    rtol: float = 1e-6,
+    atol: float = 0.01,
+) -> pd.DataFrame:
+    """
+    Compare incremental and full recompute outputs per `key`.
+    Returns a long frame of mismatches: key, column, incremental, full.
+    """
+    columns = [x for x in full.columns if x != key and x not in exclude]
+    merged = pd.merge(
+        incremental,
+        full,
+        how="outer",
+        on=key,
+        suffixes=("_incremental", "_full"),
+        indicator=True,
+    )
+    mismatches = []
+    missing = merged.loc[merged["_merge"] != "both", [key, "_merge"]]
+    for _, row in missing.iterrows():
+        mismatches.append([row[key], "_row", row["_merge"], ""])
+    both = merged.loc[merged["_merge"] == "both"]
+    for column in columns:
+        left, right = both[f"{column}_incremental"], both[f"{column}_full"]
+        if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+            equal = np.isclose(
+                left.astype(float), right.astype(float), rtol=rtol, atol=atol
+            ) | (left.isna() & right.isna())
+        else:
+            equal = left.astype(str).values == right.astype(str).values
+        for k, l, r in zip(both.loc[~equal, key], left.loc[~equal], right.loc[~equal]):
+            mismatches.append([k, column, l, r])
+    result = pd.DataFrame(mismatches, columns=[key, "column", "incremental", "full"])
+    status = "OK" if result.empty else f"{len(result)} mismatches"
+    print(f"Verifying `{name}` against full recompute: {status}")
+    return result
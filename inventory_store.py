@@ -0,0 +1,384 @@
+"""
+Local store of FBA inventory history (`fba_inventory_planning`) kept as change intervals instead of daily copies:
+for every attribute, one row per sku and run of days with the same value - sku, valid_from, valid_to, value.
+Days are stored as int32 day numbers (days since 1970-01-01), `valid_to` is exclusive. sku and text values
+are dictionary-encoded (categoricals, Arrow dictionary arrays on disk), one uncompressed Feather file per attribute.
+A sku missing from a day's snapshot simply has no interval covering that day.
+Any as-of snapshot (`snapshot_as_of`) or daily history (`daily_history`, e.g. for ISR) is rebuilt on demand,
+each update only pulls the last stored day (it may have been partial) and the days after it.
+"""
+
+import json
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from common import user_folder
+from pyarrow import feather
+
+from db_utils import get_fba_inventory_daily
+
+INVENTORY_STORE_FOLDER = os.path.join(user_folder, "inventory_store")
+# days pulled when the store is created
+INITIAL_DAYS = 400
+# the last stored day is pulled again once the store is older than this
+MAX_AGE_MINUTES = 60
+NUMERIC_COLUMNS = [
+    "amz_inventory",
+    "amz_available",
+    "healthy_inventory_level",
+    "recommended_removal_quantity",
+    "estimated_excess_quantity",
+    "fba_minimum_inventory_level",
+]
+TEXT_COLUMNS = [
+    "asin",
+    "alert",
+    "recommended_action",
+    "fba_inventory_level_health_status",
+    "storage_type",
+]
+ATTRIBUTES = NUMERIC_COLUMNS + TEXT_COLUMNS
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day) -> int:
+    return (pd.to_datetime(day).date() - EPOCH).days
+
+
+def _store_folder(marketplace: str) -> str:
+    folder = os.path.join(INVENTORY_STORE_FOLDER, marketplace)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _attribute_path(folder: str, attribute: str) -> str:
+    return os.path.join(folder, f"{attribute}.feather")
+
+
+def _read_manifest(folder: str) -> dict | None:
+    path = os.path.join(folder, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(folder: str, manifest: dict) -> None:
+    path = os.path.join(folder, "manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _write(df: pd.DataFrame, path: str) -> None:
+    temp_path = path + ".tmp"
+    feather.write_feather(
+        df.reset_index(drop=True), temp_path, compression="uncompressed"
+    )
+    os.replace(temp_path, path)
+
+
+def _daily_rows(history: pd.DataFrame) -> pd.DataFrame:
+    """One row per sku and day (duplicates summed / first value), sorted by sku and day"""
+    history = history.assign(
+        day=(pd.to_datetime(history["date"]) - pd.Timestamp(EPOCH)).dt.days
+    )
+    grouped = history.groupby(["sku", "day"], sort=True)
+    # min_count keeps a missing value missing instead of turning it into 0
+    return pd.concat(
+        [grouped[NUMERIC_COLUMNS].sum(min_count=1), grouped[TEXT_COLUMNS].first()],
+        axis=1,
+    ).reset_index()
+
+
+def encode_intervals(history: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Daily snapshots (date, sku, ATTRIBUTES) -> attribute: intervals (sku, valid_from, valid_to, value).
+    A new interval starts when the sku changes, a day is skipped or the value changes (NaN equals NaN).
+    """
+    rows = _daily_rows(history)
+    skus = rows["sku"].astype(str).to_numpy()
+    days = rows["day"].to_numpy(np.int32)
+    continues = np.zeros(len(rows), dtype=bool)
+    continues[1:] = (skus[1:] == skus[:-1]) & (days[1:] == days[:-1] + 1)
+
+    intervals = {}
+    for attribute in ATTRIBUTES:
+        values = rows[attribute]
+        if attribute in TEXT_COLUMNS:
+            values = values.astype(object).where(values.notna(), None)
+        previous = values.shift(1)
+        same = (values.to_numpy() == previous.to_numpy()) | (
+            values.isna().to_numpy() & previous.isna().to_numpy()
+        )
+        starts = np.flatnonzero(~(continues & same))
+        ends = np.r_[starts[1:], len(rows)] - 1
+        intervals[attribute] = pd.DataFrame(
+            {
+                "sku": skus[starts],
+                "valid_from": days[starts],
+                "valid_to": days[ends] + 1,
+                "value": values.to_numpy()[starts],
+            }
+        )
+    return intervals
+
+
+def _append(stored: pd.DataFrame, new: pd.DataFrame, boundary: int) -> pd.DataFrame:
+    """Add `new` intervals starting at `boundary`, extending stored intervals that continue with the same value"""
+    stored = stored.assign(
+        sku=stored["sku"].astype(object), value=stored["value"].astype(object)
+    )
+    open_stored = stored.loc[stored["valid_to"] == boundary].reset_index()
+    continuing = pd.merge(
+        open_stored[["index", "sku", "value"]],
+        new.loc[new["valid_from"] == boundary].reset_index()[
+            ["index", "sku", "value", "valid_to"]
+        ],
+        on="sku",
+        suffixes=("_stored", "_new"),
+    )
+    same = (continuing["value_stored"] == continuing["value_new"]) | (
+        continuing["value_stored"].isna() & continuing["value_new"].isna()
+    )
+    continuing = continuing.loc[same]
+    stored.loc[continuing["index_stored"].to_numpy(), "valid_to"] = continuing[
+        "valid_to"
+    ].to_numpy()
+    new = new.drop(index=continuing["index_new"].to_numpy())
+    return pd.concat([stored, new], ignore_index=True)
+
+
+def _truncate(stored: pd.DataFrame, boundary: int) -> pd.DataFrame:
+    """Stored intervals cut off at `boundary`, the days from `boundary` on are replaced by a new pull"""
+    stored = stored.loc[stored["valid_from"] < boundary]
+    return stored.assign(valid_to=np.minimum(stored["valid_to"], boundary))
+
+
+def _to_storage(intervals: pd.DataFrame, attribute: str) -> pd.DataFrame:
+    intervals = intervals.sort_values(["sku", "valid_from"], kind="stable")
+    return intervals.assign(
+        sku=intervals["sku"].astype("category"),
+        valid_from=intervals["valid_from"].astype(np.int32),
+        valid_to=intervals["valid_to"].astype(np.int32),
+        value=(
+            intervals["value"].astype("category")
+            if attribute in TEXT_COLUMNS
+            else intervals["value"].astype(np.float64)
+        ),
+    )
+
+
+def last_stored_date(marketplace: str = "US") -> date | None:
+    manifest = _read_manifest(_store_folder(marketplace))
+    if manifest is None:
+        return None
+    return EPOCH + timedelta(days=manifest["last_day"])
+
+
+def update_inventory_store(
+    marketplace: str = "US",
+    max_date: str | None = None,
+    to_print: bool = False,
+    max_age_minutes: int = MAX_AGE_MINUTES,
+) -> None:
+    """
+    Extend the store up to `max_date` (today by default). The last stored day is pulled and encoded again
+    with the days after it, as its snapshot may have been partial. A `max_date` before the last stored date
+    never changes the store.
+    """
+    folder = _store_folder(marketplace)
+    manifest = _read_manifest(folder)
+    last_date = last_stored_date(marketplace)
+    target_date = pd.to_datetime(max_date if max_date else "today").date()
+    if last_date is not None and (
+        last_date > target_date
+        or (
+            last_date == target_date
+            and time.time() - manifest["updated"] < max_age_minutes * 60  # type: ignore
+        )
+    ):
+        if to_print:
+            print(f"Inventory store for {marketplace} is up to date")
+        return
+    min_date = (
+        target_date - timedelta(days=INITIAL_DAYS) if last_date is None else last_date
+    )
+    history = get_fba_inventory_daily(
+        output={},
+        to_print=to_print,
+        min_date=min_date.strftime("%Y-%m-%d"),
+        max_date=target_date.strftime("%Y-%m-%d"),
+        marketplace=marketplace,
+    )
+    if history is None:
+        raise BaseException("Could not pull inventory history for the inventory store")
+    if len(history) == 0:
+        if to_print:
+            print(f"No new inventory days for {marketplace}")
+        return
+    pulled_days = pd.to_datetime(history["date"])
+    # stored days the pull didn't return are kept
+    boundary = day_number(pulled_days.min())
+    new_intervals = encode_intervals(history)
+    for attribute, intervals in new_intervals.items():
+        path = _attribute_path(folder, attribute)
+        if last_date is not None and os.path.exists(path):
+            stored = _truncate(feather.read_feather(path), boundary)
+            intervals = _append(stored, intervals, boundary)
+        _write(_to_storage(intervals, attribute), path)
+    _write_manifest(
+        folder,
+        {
+            "first_day": (
+                day_number(min_date) if manifest is None else manifest["first_day"]
+            ),
+            "last_day": max(
+                day_number(pulled_days.max()),
+                manifest["last_day"] if manifest else 0,
+            ),
+            "updated": time.time(),
+        },
+    )
+    if to_print:
+        print(
+            f"Inventory store for {marketplace} updated from {min_date} with {len(history)} rows"
+        )
+
+
+def load_intervals(attribute: str, marketplace: str = "US") -> pd.DataFrame:
+    path = _attribute_path(_store_folder(marketplace), attribute)
+    if not os.path.exists(path):
+        raise BaseException(
+            f"Inventory store for {marketplace} is empty, run `update_inventory_store` first"
+        )
+    return feather.read_feather(path)
+
+
+def snapshot_as_of(
+    day, columns: list[str] | None = None, marketplace: str = "US"
+) -> pd.DataFrame:
+    """Inventory snapshot of `day` rebuilt from the intervals, columns: date, sku, asin + `columns`"""
+    columns = [x for x in (columns or ATTRIBUTES) if x != "asin"]
+    target = day_number(day)
+    snapshot = None
+    for attribute in ["asin"] + columns:
+        intervals = load_intervals(attribute, marketplace)
+        covering = intervals.loc[
+            (intervals["valid_from"] <= target) & (intervals["valid_to"] > target),
+            ["sku", "value"],
+        ].rename(columns={"value": attribute})
+        snapshot = (
+            covering
+            if snapshot is None
+            else pd.merge(snapshot, covering, how="outer", on="sku", validate="1:1")
+        )
+    snapshot = snapshot.assign(sku=snapshot["sku"].astype(str))  # type: ignore
+    # plain values like `daily_history`, not the stored categories
+    for attribute in snapshot.columns.intersection(TEXT_COLUMNS):
+        snapshot[attribute] = snapshot[attribute].astype(object)
+    snapshot.insert(0, "date", pd.to_datetime(day).date())
+    return snapshot.sort_values("sku").reset_index(drop=True)
+
+
+def _expand(intervals: pd.DataFrame, start: int, end: int) -> pd.DataFrame:
+    """Intervals clipped to [start, end] -> one row per sku and day"""
+    intervals = intervals.loc[
+        (intervals["valid_to"] > start) & (intervals["valid_from"] <= end)
+    ]
+    first = np.maximum(intervals["valid_from"].to_numpy(np.int64), start)
+    last = np.minimum(intervals["valid_to"].to_numpy(np.int64), end + 1)
+    lengths = last - first
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    return pd.DataFrame(
+        {
+            "day": np.repeat(first, lengths) + offsets,
+            "sku": np.repeat(intervals["sku"].to_numpy(), lengths),
+            "value": np.repeat(intervals["value"].to_numpy(), lengths),
+        }
+    )
+
+
+def daily_history(
+    start_date,
+    end_date,
+    columns: list[str] | None = None,
+    marketplace: str = "US",
+) -> pd.DataFrame:
+    """
+    Daily rows between `start_date` and `end_date` (inclusive) rebuilt from the intervals,
+    columns: date, sku, asin + `columns` (amz_inventory by default, the input of `calculate_inventory_isr`)
+    """
+    columns = [x for x in (columns or ["amz_inventory"]) if x != "asin"]
+    start, end = day_number(start_date), day_number(end_date)
+    history = None
+    for attribute in ["asin"] + columns:
+        expanded = _expand(load_intervals(attribute, marketplace), start, end)
+        expanded = expanded.rename(columns={"value": attribute})
+        history = (
+            expanded
+            if history is None
+            else pd.merge(history, expanded, how="outer", on=["day", "sku"])
+        )
+    history = history.sort_values(["day", "sku"]).reset_index(drop=True)  # type: ignore
+    dates = pd.Timestamp(EPOCH) + pd.to_timedelta(history.pop("day"), unit="D")
+    history.insert(0, "date", dates.dt.date)
+    history["sku"] = history["sku"].astype(str)
+    history["asin"] = history["asin"].astype(object)
+    return history
+
+
+def store_stats(marketplace: str = "US") -> dict:
+    """Stored intervals vs. the rows (sku x day x attribute) the same history takes as daily copies"""
+    folder = _store_folder(marketplace)
+    manifest = _read_manifest(folder)
+    if manifest is None:
+        return {}
+    intervals = {x: load_intervals(x, marketplace) for x in ATTRIBUTES}
+    daily_values = sum(
+        int((x["valid_to"] - x["valid_from"]).sum()) for x in intervals.values()
+    )
+    stored = sum(len(x) for x in intervals.values())
+    return {
+        "days": manifest["last_day"] - manifest["first_day"] + 1,
+        "intervals": stored,
+        "daily_values": daily_values,
+        "ratio": round(stored / daily_values, 4) if daily_values else None,
+        "bytes_on_disk": sum(
+            os.path.getsize(_attribute_path(folder, x)) for x in ATTRIBUTES
+        ),
+    }
+
+
+def get_amazon_inventory_from_store(
+    output: dict,
+    to_print: bool = False,
+    num_days: int = 180,
+    max_date: str | None = None,
+    marketplaces: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Drop-in replacement for `get_amazon_inventory` reading from the local inventory store
+    (extending it first): same `num_days` window up to `max_date`.
+    dataframe columns to return: date, marketplace, sku, asin, amz_inventory
+    """
+    if to_print:
+        print("Starting to run `get_amazon_inventory_from_store`")
+    end_date = pd.to_datetime(max_date if max_date else "today").date()
+    start_date = end_date - timedelta(days=num_days)
+    market_inventory = []
+    for marketplace in marketplaces or ["US"]:
+        update_inventory_store(marketplace=marketplace, max_date=max_date)
+        inventory = daily_history(start_date, end_date, marketplace=marketplace)
+        inventory.insert(1, "marketplace", marketplace)
+        market_inventory.append(inventory)
+    result = pd.concat(market_inventory, ignore_index=True)
+    output["get_amazon_inventory"] = result
+    if to_print:
+        print("Saved data to results `get_amazon_inventory`")
+    return result
@@ -1,42 +1,274 @@
+import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
 from tkinter import messagebox
+from typing import Literal
 
 import pandas as pd
 from utils import mellanni_modules as mm
 
-from date_utils import get_event_days_delta
-from db_utils import pull_data
+from allocation_utils import allocate_wh_inventory
+from checkpoint_utils import list_runs, load_checkpoint, save_stage, start_run
+from date_utils import event_is_near, get_event_days_delta
+from db_utils import MARKETPLACES, pull_data, split_results_by_marketplace
+from incremental_utils import (
+    advance_restock_state,
+    build_restock_state,
+    load_restock_state,
+    reuse_unchanged,
+    save_restock_state,
+    state_pull_days,
+    state_total_sales,
+    verify_frames,
+)
+from projection_utils import project_inventory
 from restock_utils import (
+    STANDARD_DAYS_OF_SALE,
     calculate_amazon_inventory,
     calculate_event_forecast,
     calculate_inventory_isr,
+    filter_event_spreadsheet,
     get_asin_sales,
     group_incoming_by_weeks,
 )
-from utils_misc import create_column_formatting
+from sku_mapping import SkuAsinMap, sku_asin_map
+from shard_utils import (
+    amazon_inventory_shard,
+    asin_sales_shard,
+    assign_shards,
+    concat_sorted,
+    isr_shard,
+    run_sharded,
+)
+from utils_misc import create_column_formatting, load_frames_to_bq, row_formulas
 
-STANDARD_DAYS_OF_SALE = 49
+logger = logging.getLogger(__name__)
 
 max_date = None
 include_events: bool = False
 num_days: int = 180
 max_date: str | None = None
 num_short_term_days = 14
+marketplace = "US"
+use_incremental: bool = False
+verify_incremental: bool = False
+use_sales_store: bool = False
+use_inventory_store: bool = False
+restock_state: dict | None = None
+n_shards: int = 1
+shard_by: Literal["hash", "collection"] = "hash"
+verification: dict = {}
+# asin column of the restock before it's turned into HYPERLINK formulas
+raw_asins: pd.Series | None = None
+# write `dos_shipped` as a row formula instead of values
+dos_shipped_formula: bool = False
+# distribute limited warehouse stock across asins (`allocation_utils`)
+allocate_stock: bool = False
+# weeks of the sku inventory projection, 0 = skip (`projection_utils`)
+projection_weeks: int = 0
+projection: pd.DataFrame | None = None
+# sku <-> asin mapping of the current dictionary (`sku_mapping`)
+sku_map: SkuAsinMap | None = None
+# pulled sales are sku-level and cover the whole `num_days` window (not the sales store / an incremental pull)
+sku_sales_pulled: bool = False
+# dataframe engine of the `restock_utils` kernels
+engine: Literal["pandas", "polars"] = "pandas"
+# warnings as tkinter dialogs, False logs them instead (headless runs like `restock_service`)
+show_dialogs: bool = True
 
 
 user_folder = os.path.join(os.path.expanduser("~"), "temp")
 os.makedirs(user_folder, exist_ok=True)
 
 
-def prepare_data():
+def _state_path() -> str:
+    return os.path.join(user_folder, f"restock_state_{marketplace}.pkl")
+
+
+def _state_params() -> dict:
+    return {
+        "num_days": num_days,
+        "num_short_term_days": num_short_term_days,
+        "include_events": include_events,
+        "marketplace": marketplace,
+    }
+
+
+def _checkpoint_folder() -> str:
+    return os.path.join(user_folder, "restock_checkpoints")
+
+
+def _run_params() -> dict:
+    """
+    Parameters identifying a restock run for checkpoints, a new day is a new run.
+    Every setting that changes a stage's outputs must be here, or a resumed run reuses stale stages.
+    """
+    return {
+        "marketplace": marketplace,
+        "num_days": num_days,
+        "max_date": max_date,
+        "num_short_term_days": num_short_term_days,
+        "include_events": include_events,
+        "sales_store": use_sales_store,
+        "inventory_store": use_inventory_store,
+        "incremental": use_incremental,
+        "verify": verify_incremental,
+        "n_shards": n_shards,
+        "shard_by": shard_by,
+        "dos_shipped_formula": dos_shipped_formula,
+        "allocate_stock": allocate_stock,
+        "engine": engine,
+        "day": pd.to_datetime("today").strftime("%Y-%m-%d"),
+    }
+
+
+def _set_run_settings(settings: dict) -> None:
+    """Set the module settings the stages read (`num_days`, `max_date`, `include_events`, `num_short_term_days`)"""
+    globals().update(settings)
+
+
+def _reference_date():
+    return pd.to_datetime(max_date if max_date else "today").date()
+
+
+def _incremental_aggregate(name, inputs, key, compute):
+    """
+    Route a per-asin/per-sku aggregate through the restock state when running incrementally:
+    only keys with changed inputs are recomputed. In verify mode the result is checked against `compute(inputs)`.
+    """
+    if restock_state is None:
+        return compute(inputs)
+    output = reuse_unchanged(restock_state, name, inputs, key, compute)
+    if verify_incremental:
+        verification[name] = verify_frames(name, output, compute(inputs), key)
+    return output
+
+
+def _shards_for(keys: pd.Series, key: str) -> list:
+    """Split `key` values (asin or sku) into `n_shards`, keeping collections together if `shard_by` is "collection" """
+    keys = pd.Series(keys.dropna().unique())
+    groups = None
+    if shard_by == "collection":
+        collections = (
+            dictionary.dropna(subset=[key])
+            .drop_duplicates(key)
+            .set_index(key)["collection"]
+        )
+        groups = keys.map(collections)
+    return assign_shards(keys, n_shards, groups)
+
+
+def _sharded_total_sales():
+    """ISR and asin sales computed per asin / sku shard in a process pool"""
+    sales_max_date = (amazon_sales["date"].max() - pd.Timedelta(days=1)).strftime(
+        "%Y-%m-%d"
+    )
+    inv_max_date = pd.to_datetime(amazon_inventory["date"]).max().strftime("%Y-%m-%d")
+    asin_inventory_history = amazon_inventory.loc[:, ["date", "asin", "amz_inventory"]]
+    sku_inventory_history = amazon_inventory.loc[:, ["date", "sku", "amz_inventory"]]
+
+    shard_results = run_sharded(
+        asin_sales_shard,
+        {"amazon_sales": amazon_sales, "amazon_inventory": asin_inventory_history},
+        "asin",
+        _shards_for(
+            pd.concat([amazon_sales["asin"], asin_inventory_history["asin"]]), "asin"
+        ),
+        include_events=include_events,
+        long_term_days=num_days,
+        short_term_days=num_short_term_days,
+        sales_max_date=sales_max_date,
+        inv_max_date=inv_max_date,
+    )
+    asin_isr = concat_sorted([x[0] for x in shard_results], "asin")
+    total_sales = concat_sorted([x[1] for x in shard_results], "asin")
+    sku_isr = concat_sorted(
+        run_sharded(
+            isr_shard,
+            {"amazon_inventory": sku_inventory_history},
+            "sku",
+            _shards_for(sku_inventory_history["sku"], "sku"),
+            col_to_use="sku",
+            inv_max_date=inv_max_date,
+        ),
+        "sku",
+    )
+    return asin_isr, sku_isr, total_sales
+
+
+def _amazon_inventory(recent_inventory: pd.DataFrame, col_to_use: str):
+    if n_shards > 1 and len(recent_inventory) > 0:
+        return concat_sorted(
+            run_sharded(
+                amazon_inventory_shard,
+                {"amazon_inventory": recent_inventory},
+                col_to_use,
+                _shards_for(recent_inventory[col_to_use], col_to_use),
+                col_to_use=col_to_use,
+            ),
+            col_to_use,
+        )
+    return calculate_amazon_inventory(
+        recent_inventory,
+        col_to_use=col_to_use,  # type: ignore
+        show_warning=False,
+        engine=engine,
+    )
+
+
+def _aggregate_asin_wh_inventory(wh_inventory: pd.DataFrame) -> pd.DataFrame:
+    numeric = sku_map.rollup(  # type: ignore
+        wh_inventory, ["wh_inventory", "incoming_containers"]
+    )
+    labels = (
+        wh_inventory.groupby("asin")
+        .agg(
+            {
+                "sku": lambda x: ", ".join(sorted(x.unique())),
+                "life stage": lambda x: ", ".join(sorted(x.unique())),
+                "restockable": lambda x: ", ".join(sorted(x.unique())),
+                "collection": lambda x: ", ".join(sorted(x.unique())),
+                "size": lambda x: ", ".join(sorted(x.unique())),
+                "color": lambda x: ", ".join(sorted(x.unique())),
+                "sku_mapping": lambda x: ", ".join(sorted(x.unique())),
+            }
+        )
+        .reset_index()
+    )
+    return pd.merge(numeric, labels, how="left", on="asin", validate="1:1")
+
+
+def prepare_data(pulled_results: dict | None = None):
     # prepare data block###################
-    global amazon_sales, wh_inventory, amazon_inventory, full_event_spreadsheet, dictionary, dimensions, incoming_weeks, results
-    results = pull_data(num_days=num_days, max_date=max_date)
+    global amazon_sales, wh_inventory, amazon_inventory, amazon_inventory_snapshot, full_event_spreadsheet, dictionary, dimensions, incoming_weeks, results, restock_state, sku_sales_pulled
+    pull_days = num_days
+    if pulled_results is None:
+        restock_state = None
+        if use_incremental:
+            restock_state = load_restock_state(_state_path())
+            state_days = state_pull_days(
+                restock_state, _state_params(), _reference_date()
+            )
+            if state_days is None:
+                print("No usable restock state found, running full recompute")
+                restock_state = None
+            elif not verify_incremental:
+                pull_days = state_days
+        results = pull_data(
+            num_days=pull_days,
+            max_date=max_date,
+            marketplaces=[marketplace],
+            use_sales_store=use_sales_store,
+            use_inventory_store=use_inventory_store,
+        )
+    else:
+        results = pulled_results
 
     amazon_sales_full = results["get_amazon_sales"]
     amazon_sales_full["date"] = pd.to_datetime(amazon_sales_full["date"])
+    sku_sales_pulled = "sku" in amazon_sales_full.columns and pull_days == num_days
     amazon_sales = (
         amazon_sales_full.groupby(["date", "asin"])
         .agg({"unit_sales": "sum", "dollar_sales": "sum"})
@@ -45,19 +277,20 @@ def prepare_data():
 
     wh_inventory = results["get_wh_inventory"]
     amazon_inventory = results["get_amazon_inventory"]
+    amazon_inventory_snapshot = results["get_amazon_inventory_snapshot"]
     full_event_spreadsheet = results["get_event_spreadsheet"]
     dictionary = results["get_dictionary"]
     dimensions = results["size_match"]
     incoming_weeks_raw = results["incoming_weeks"]
 
-    incoming_weeks = group_incoming_by_weeks(incoming_weeks_raw)
+    incoming_weeks = group_incoming_by_weeks(incoming_weeks_raw, engine=engine)
     incoming_weeks = incoming_weeks.rename(columns={"SKU": "sku"})
     # end of prepare data block#############
 
 
 def prepare_total_sales():
     # prepare total sales block############3
-    global amazon_sales, amazon_inventory, total_sales, max_sales_date_str, sku_isr
+    global amazon_sales, amazon_inventory, total_sales, max_sales_date_str, sku_isr, restock_state
     max_sales_date = amazon_sales["date"].max()
     today = pd.to_datetime("today")
     if max_sales_date.date() == today.date():
@@ -70,22 +303,51 @@ def prepare_total_sales():
         columns={"unit_sales": f"{max_sales_date_str} sales"}
     )
 
-    asin_isr = calculate_inventory_isr(
-        amazon_inventory.loc[:, ["date", "asin", "amz_inventory"]].copy()
-    )
+    incremental_sales = None
+    if restock_state is not None:
+        restock_state = advance_restock_state(
+            restock_state, amazon_sales, amazon_inventory, _reference_date()
+        )
+        incremental_sales = state_total_sales(restock_state)
+
+    if (incremental_sales is None or verify_incremental) and n_shards > 1:
+        asin_isr, sku_isr, total_sales = _sharded_total_sales()
+    elif incremental_sales is None or verify_incremental:
+        asin_isr = calculate_inventory_isr(
+            amazon_inventory.loc[:, ["date", "asin", "amz_inventory"]].copy(),
+            engine=engine,
+        )
 
-    sku_isr = calculate_inventory_isr(
-        amazon_inventory.loc[:, ["date", "sku", "amz_inventory"]].copy(),
-        col_to_use="sku",
-    )
+        sku_isr = calculate_inventory_isr(
+            amazon_inventory.loc[:, ["date", "sku", "amz_inventory"]].copy(),
+            col_to_use="sku",
+            engine=engine,
+        )
 
-    total_sales = get_asin_sales(
-        amazon_sales,
-        asin_isr,
-        include_events=include_events,
-        long_term_days=num_days,
-        short_term_days=num_short_term_days,
-    )
+        total_sales = get_asin_sales(
+            amazon_sales,
+            asin_isr,
+            include_events=include_events,
+            long_term_days=num_days,
+            short_term_days=num_short_term_days,
+            engine=engine,
+        )
+    if incremental_sales is None or verify_incremental:
+        if incremental_sales is not None:
+            for name, key, incremental_df, full_df in zip(
+                ["asin_isr", "sku_isr", "total_sales"],
+                ["asin", "sku", "asin"],
+                incremental_sales,
+                [asin_isr, sku_isr, total_sales],
+            ):
+                verification[name] = verify_frames(name, incremental_df, full_df, key)
+    else:
+        asin_isr, sku_isr, total_sales = incremental_sales
+
+    if use_incremental and restock_state is None:
+        restock_state = build_restock_state(
+            amazon_sales, amazon_inventory, _state_params(), _reference_date()
+        )
     total_sales = pd.merge(
         total_sales, latest_sales, how="outer", on="asin", validate="1:1"
     )
@@ -96,12 +358,13 @@ def prepare_total_sales():
 
 
 def prepare_wh_inventory():
-    global dictionary, wh_inventory, forecast, asin_wh_inventory, nearest_event, sku_inventory
+    global dictionary, wh_inventory, forecast, asin_wh_inventory, nearest_event, sku_inventory, sku_map
     # prepare wh inventory block#########
     dictionary.columns = [x.lower().strip() for x in dictionary.columns]
     dictionary = dictionary[
         ["sku", "asin", "life stage", "restockable", "collection", "size", "color"]
     ]
+    sku_map = sku_asin_map(dictionary)
 
     wh_inventory = pd.merge(
         wh_inventory,
@@ -115,59 +378,81 @@ def prepare_wh_inventory():
         wh_inventory["sku"].astype(str) + ":" + wh_inventory["restockable"].astype(str)
     )
 
-    asin_wh_inventory = (
-        wh_inventory.groupby("asin")
-        .agg(
-            {
-                "wh_inventory": "sum",
-                "incoming_containers": "sum",
-                "sku": lambda x: ", ".join(sorted(x.unique())),
-                "life stage": lambda x: ", ".join(sorted(x.unique())),
-                "restockable": lambda x: ", ".join(sorted(x.unique())),
-                "collection": lambda x: ", ".join(sorted(x.unique())),
-                "size": lambda x: ", ".join(sorted(x.unique())),
-                "color": lambda x: ", ".join(sorted(x.unique())),
-                "sku_mapping": lambda x: ", ".join(sorted(x.unique())),
-            }
-        )
-        .reset_index()
+    asin_wh_inventory = _incremental_aggregate(
+        "asin_wh_inventory", wh_inventory, "asin", _aggregate_asin_wh_inventory
     )
 
     nearest_event, days_to_event, _ = get_event_days_delta()
 
-    event_forecast = calculate_event_forecast(
-        total_sales=total_sales,
-        full_event_df=full_event_spreadsheet,
-        event=nearest_event,
+    event_inputs = pd.merge(
+        total_sales[["asin", "avg units"]],
+        filter_event_spreadsheet(full_event_spreadsheet, event=nearest_event),
+        how="left",
+        on="asin",
+    )
+    event_forecast = _incremental_aggregate(
+        f"event_forecast_{nearest_event}",
+        event_inputs,
+        "asin",
+        lambda x: calculate_event_forecast(
+            total_sales=x[["asin", "avg units"]],
+            full_event_df=full_event_spreadsheet,
+            event=nearest_event,
+            engine=engine,
+        ),
     )
 
     forecast = pd.merge(
         total_sales, event_forecast, how="outer", on="asin", validate="1:1"
     )
 
-    days_threshold = 45 if nearest_event == "BSS" else 90
+    near = event_is_near(nearest_event, days_to_event)
 
-    calculated_days_to_event = 0 if days_to_event > days_threshold else days_to_event
+    calculated_days_to_event = days_to_event if near else 0
     outside_event_sales = forecast["avg units"] * (
         calculated_days_to_event + STANDARD_DAYS_OF_SALE
     )
 
     total_units_needed = (
-        outside_event_sales
-        if days_to_event > days_threshold
-        else outside_event_sales + forecast[f"{nearest_event}_forecasted_sales"]
+        outside_event_sales + forecast[f"{nearest_event}_forecasted_sales"]
+        if near
+        else outside_event_sales
     )
     forecast["total units needed"] = total_units_needed
 
-    asin_inventory = calculate_amazon_inventory(amazon_inventory)
-    sku_inventory = calculate_amazon_inventory(
-        amazon_inventory, col_to_use="sku", show_warning=False
+    check_date = (pd.to_datetime("today") - pd.Timedelta(days=2)).date()
+    recent_inventory = amazon_inventory_snapshot.loc[
+        amazon_inventory_snapshot["date"] >= check_date
+    ]
+    if len(recent_inventory) == 0:
+        # let `calculate_amazon_inventory` warn and look further back
+        asin_inventory = calculate_amazon_inventory(
+            amazon_inventory_snapshot, show_warning=show_dialogs, engine=engine
+        )
+    else:
+        # snapshot dates are hashed too: a reused row must not carry an older snapshot date
+        asin_inventory = _incremental_aggregate(
+            "asin_inventory",
+            recent_inventory,
+            "asin",
+            lambda x: _amazon_inventory(x, col_to_use="asin"),
+        )
+    sku_inventory = _incremental_aggregate(
+        "sku_inventory",
+        recent_inventory,
+        "sku",
+        lambda x: _amazon_inventory(x, col_to_use="sku"),
     )
 
     forecast = pd.merge(
         forecast, asin_inventory, how="outer", on="asin", validate="1:1"
     )
     non_date_cols = [x for x in forecast.columns if x != "date"]
+    # asins missing from the inventory snapshot: no labels instead of 0 in text columns
+    text_cols = [
+        x for x in non_date_cols if not pd.api.types.is_numeric_dtype(forecast[x])
+    ]
+    forecast[text_cols] = forecast[text_cols].fillna("")
     forecast[non_date_cols] = forecast[non_date_cols].fillna(0)
 
     forecast["to_ship_units"] = (
@@ -181,7 +466,7 @@ def prepare_wh_inventory():
 
 
 def prepare_forecast():
-    global forecast, dimensions, nearest_event, sku_results, file_date
+    global forecast, dimensions, nearest_event, sku_results, file_date, raw_asins
     forecast["avg price"] = forecast["avg $"] / forecast["avg units"]
     max_inventory_sales = forecast[
         ["amz_inventory", f"{max_sales_date_str} sales"]
@@ -273,23 +558,44 @@ def prepare_forecast():
     ]
 
     forecast = forecast.loc[:, HARD_COLUMNS]
-    forecast["dos_shipped"] = "=(Y:Y*X:X+O:O)/H:H"
+    if dos_shipped_formula:
+        forecast["dos_shipped"] = row_formulas(
+            forecast.columns.tolist(),
+            "=({to_ship_boxes}*{sets in a box}+{amz_inventory})/{avg units}",
+            len(forecast),
+        ).values
+    else:
+        # same as the formula: empty boxes / box size count as 0
+        forecast["dos_shipped"] = (
+            (forecast["to_ship_boxes"] * forecast["sets in a box"]).fillna(0)
+            + forecast["amz_inventory"]
+        ) / forecast["avg units"]
     file_date = pd.to_datetime("today").strftime("%Y-%m-%d")
 
     forecast["date"] = file_date
     forecast_columns = forecast.columns.tolist()
     if not forecast_columns == HARD_COLUMNS:
-        # raise BaseException("Columns don't match, don't forget to change Excel formula in 'dos_shipped' column")
         mismatched_cols = ", ".join(
             [x for x in forecast_columns if x not in HARD_COLUMNS]
         )
-        messagebox.showwarning(
-            title="Warning",
-            message=f"Columns don't match, don't forget to change Excel formula in 'dos_shipped' column: {mismatched_cols}",
+        if show_dialogs:
+            messagebox.showwarning(
+                title="Warning",
+                message=f"Columns don't match: {mismatched_cols}",
+            )
+        else:
+            logger.warning(f"Columns don't match: {mismatched_cols}")
+
+    if allocate_stock:
+        allocation = allocate_wh_inventory(
+            forecast, wh_inventory, days_of_sale=STANDARD_DAYS_OF_SALE
         )
+        for column in ["allocated_units", "allocated_boxes", "unallocated_units"]:
+            forecast[column] = allocation[column].values
 
+    raw_asins = forecast["asin"].astype(str)
     forecast["asin"] = (
-        '=HYPERLINK("https://www.amazon.com/dp/'
+        f'=HYPERLINK("https://www.{MARKETPLACES[marketplace].lower()}/dp/'
         + forecast["asin"].astype(str)
         + '","'
         + forecast["asin"].astype(str)
@@ -305,13 +611,147 @@ def prepare_forecast():
     )
 
 
+def _sku_sales_shares():
+    """
+    Share of each dictionary sku in its asin's sales over the sales window.
+    The sales store only keeps date x asin and an incremental pull only the last days,
+    then the skus of an asin get equal shares.
+    """
+    if not sku_sales_pulled:
+        return sku_map.equal_shares()  # type: ignore
+    return sku_map.sales_shares(results["get_amazon_sales"])  # type: ignore
+
+
+def prepare_projection():
+    global projection
+    nearest_event, days_to_event, event_duration = get_event_days_delta()
+    asin_demand = pd.DataFrame(
+        {
+            "asin": raw_asins.values,  # type: ignore
+            "avg units": forecast["avg units"].values,
+            "event units": forecast[f"{nearest_event}_forecasted_sales"].values,
+        }
+    )
+    skus = sku_map.drilldown(  # type: ignore
+        asin_demand,
+        ["avg units", "event units"],
+        weights=_sku_sales_shares(),
+    )
+    on_hand = (
+        pd.concat(
+            [
+                sku_inventory.set_index("sku")["amz_inventory"],
+                wh_inventory.set_index("sku")["wh_inventory"],
+            ]
+        )
+        .groupby(level=0)
+        .sum()
+    )
+    skus["on_hand"] = skus["sku"].map(on_hand).fillna(0)
+    skus = skus.rename(
+        columns={"avg units": "daily_units", "event units": "event_units"}
+    )
+
+    # same rule as the restock: an event further away isn't planned for yet
+    summary, weekly = project_inventory(
+        skus,
+        incoming=incoming_weeks,
+        weeks=projection_weeks,
+        event_start=(
+            (pd.to_datetime("today") + pd.Timedelta(days=days_to_event)).date()
+            if event_is_near(nearest_event, days_to_event)
+            else None
+        ),
+        event_duration=event_duration,
+    )
+    summary.insert(1, "asin", skus["asin"].values)
+    projection = pd.merge(summary, weekly, how="left", on="sku", validate="1:1")
+
+
+# module globals each stage produces, saved to / restored from its checkpoint
+STAGE_OUTPUTS = {
+    "prepare_data": [
+        "amazon_sales",
+        "wh_inventory",
+        "amazon_inventory",
+        "amazon_inventory_snapshot",
+        "full_event_spreadsheet",
+        "dictionary",
+        "dimensions",
+        "incoming_weeks",
+        "results",
+        "restock_state",
+        "sku_sales_pulled",
+    ],
+    "prepare_total_sales": [
+        "amazon_sales",
+        "amazon_inventory",
+        "total_sales",
+        "max_sales_date_str",
+        "sku_isr",
+        "restock_state",
+        "verification",
+    ],
+    "prepare_wh_inventory": [
+        "dictionary",
+        "wh_inventory",
+        "forecast",
+        "asin_wh_inventory",
+        "nearest_event",
+        "sku_inventory",
+        "sku_map",
+    ],
+    "prepare_forecast": [
+        "forecast",
+        "dimensions",
+        "sku_results",
+        "file_date",
+        "raw_asins",
+    ],
+}
+
+
+def _bq_restock() -> pd.DataFrame:
+    """Restock with plain asins for BigQuery: text columns as str (Arrow can't load mixed str / number columns)"""
+    restock = forecast.assign(asin=raw_asins.values)
+    text_cols = restock.select_dtypes(exclude="number").columns
+    restock[text_cols] = restock[text_cols].fillna("").astype(str)
+    return restock
+
+
+def load_restock_checkpoint(run: str | None = None, upto: str | None = None) -> dict:
+    """
+    Stage outputs of a checkpointed restock run (latest run by default), e.g. for debugging:
+    `load_restock_checkpoint(upto="prepare_total_sales")["total_sales"]`
+    """
+    if run is None:
+        runs = list_runs(_checkpoint_folder())
+        if runs.empty:
+            raise ValueError("No restock checkpoints found")
+        run = runs["run"].iloc[0]
+    return load_checkpoint(_checkpoint_folder(), run, upto=upto)  # type: ignore
+
+
 def calculate_restock(
     include_events: bool,
     num_days: int = 180,
     max_date: str | None = None,
     num_short_term_days=14,
+    incremental: bool = False,
+    verify: bool = False,
+    sales_store: bool = False,
+    shards: int = 1,
+    shard_on: Literal["hash", "collection"] = "hash",
+    publish: bool = False,
+    dos_formula: bool = False,
+    allocate: bool = False,
+    project_weeks: int = 0,
+    kernel_engine: Literal["pandas", "polars"] = "pandas",
+    checkpoint: bool = False,
+    resume: bool = False,
+    inventory_store: bool = False,
 ):
-    global amazon_sales, wh_inventory, amazon_inventory, full_event_spreadsheet, dictionary, dimensions, incoming_weeks, results, total_sales, max_sales_date_str, sku_isr, forecast, asin_wh_inventory, sku_results
+    global amazon_sales, wh_inventory, amazon_inventory, full_event_spreadsheet, dictionary, dimensions, incoming_weeks, results, total_sales, max_sales_date_str, sku_isr, forecast, asin_wh_inventory, sku_results, use_incremental, verify_incremental, restock_state, verification, use_sales_store, use_inventory_store, n_shards, shard_by, dos_shipped_formula, allocate_stock, projection_weeks, engine
 
     """
     Ruslan
@@ -321,27 +761,202 @@ def calculate_restock(
     4. calculate units needed (min 0, avoid negative numbers) for 49 days
     combine two dataframes into one and output the following columns:
         asin, average_sales_180, average_sales_14, average_combined, isr, amz_inventory (latest), wh_inventory (latest), units_to_ship
+    `incremental` - reuse the previous run's per-asin state (window sums, ISR counts, inventory snapshot,
+        event forecast) and only apply the new days / recompute asins with changed inputs
+    `verify` - with `incremental`, pull full history and check incremental results against a full recompute,
+        mismatches are stored in `verification`
+    `sales_store` - read sales from the local daily sales store (shared with the sales forecast)
+    `shards` - split ISR, sales and inventory calculations by asin / sku across `shards` processes,
+        by stable hash or keeping whole collections together (`shard_on`="collection")
+    `publish` - load the restock (with plain asins) straight to BigQuery daily_reports.restock
+    `dos_formula` - write `dos_shipped` as a per-row Excel formula (editable boxes) instead of computed values
+    `allocate` - add allocated_units / allocated_boxes: warehouse stock distributed across asins by priority
+        (lost sales, days-of-sale gap) in whole boxes, so the totals never exceed what is in the warehouse
+    `project_weeks` - add an "inventory projection" sheet: weekly on hand per sku for `project_weeks` weeks
+        (Amazon + warehouse + incoming by ETA week - forecasted demand incl. the nearest event),
+        with stockout week, minimum on hand and coverage gap
+    `kernel_engine` - "polars" runs ISR, sales windows, inventory, event forecast and incoming weeks
+        as multi-threaded polars queries (needs the "polars" extra), see `benchmark_engines.py`
+    `checkpoint` - save each stage's outputs to user_folder/restock_checkpoints (see `load_restock_checkpoint`)
+    `resume` - continue today's run with the same parameters from its last completed stage
+        (e.g. after a failed export), implies `checkpoint`
+    `inventory_store` - rebuild the inventory history from the local change-interval store (`inventory_store.py`),
+        only days after the last stored one are pulled
     """
-
-    prepare_data()
-
-    prepare_total_sales()
-
-    prepare_wh_inventory()
-
-    prepare_forecast()
+    _set_run_settings(
+        {
+            "include_events": include_events,
+            "num_days": num_days,
+            "max_date": max_date,
+            "num_short_term_days": num_short_term_days,
+        }
+    )
+    use_sales_store = sales_store
+    use_inventory_store = inventory_store
+    n_shards = shards
+    dos_shipped_formula = dos_formula
+    allocate_stock = allocate
+    projection_weeks = project_weeks
+    engine = kernel_engine
+    shard_by = shard_on
+    use_incremental = incremental or verify
+    verify_incremental = verify
+    verification = {}
+
+    completed = []
+    if checkpoint or resume:
+        run, completed = start_run(_checkpoint_folder(), _run_params(), resume=resume)
+        if completed:
+            print(f"Resuming restock run {run} after `{completed[-1]}`")
+            globals().update(load_checkpoint(_checkpoint_folder(), run))
+
+    for stage in [
+        prepare_data,
+        prepare_total_sales,
+        prepare_wh_inventory,
+        prepare_forecast,
+    ]:
+        if stage.__name__ in completed:
+            continue
+        stage()
+        if checkpoint or resume:
+            save_stage(
+                _checkpoint_folder(),
+                run,
+                stage.__name__,
+                {name: globals()[name] for name in STAGE_OUTPUTS[stage.__name__]},
+            )
+
+    dfs, sheet_names = [forecast, sku_results], ["restock", "sku_inventory"]
+    if projection_weeks > 0:
+        prepare_projection()
+        dfs.append(projection)
+        sheet_names.append("inventory projection")
+
+    if restock_state is not None:
+        save_restock_state(restock_state, _state_path())
 
     mm.export_to_excel(
-        dfs=[forecast, sku_results],
-        sheet_names=["restock", "sku_inventory"],
+        dfs=dfs,
+        sheet_names=sheet_names,
         filename=f"inventory_restock_{file_date}.xlsx",
         out_folder=user_folder,
         column_formats=create_column_formatting(),
     )
+
+    # after the export, a failed upload still leaves the workbook
+    if publish:
+        load_frames_to_bq([_bq_restock()], "daily_reports.restock")
     mm.open_file_folder(os.path.join(user_folder))
     return forecast, results
 
 
+def _restock_market(market: str, market_results: dict, settings: dict | None = None):
+    """
+    Worker for `calculate_restock_markets`: runs the restock stages for a single marketplace
+    on already pulled data. Runs in a separate process, so module globals are not shared between markets
+    and the run's `settings` (see `_set_run_settings`) are passed in.
+    """
+    global marketplace
+    marketplace = market
+    if settings:
+        _set_run_settings(settings)
+    prepare_data(pulled_results=market_results)
+    prepare_total_sales()
+    prepare_wh_inventory()
+    prepare_forecast()
+    return market, forecast, sku_results
+
+
+def compute_restock(
+    pulled_results: dict, market: str = "US", interactive: bool = True
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Restock and sku inventory from already pulled data (`pull_data` format) without exporting anything.
+    The restock's asin column holds plain asins instead of HYPERLINK formulas.
+    `interactive=False` logs warnings (e.g. stale inventory snapshot) instead of opening tkinter dialogs.
+    `show_dialogs` and `marketplace` are restored afterwards, so later runs in the same process are not affected.
+    """
+    global show_dialogs, marketplace
+    previous = show_dialogs, marketplace
+    show_dialogs = interactive
+    try:
+        _, restock, market_sku_results = _restock_market(market, pulled_results)
+        return restock.assign(asin=raw_asins.values), market_sku_results  # type: ignore
+    finally:
+        show_dialogs, marketplace = previous
+
+
+def calculate_restock_markets(
+    marketplaces: list[str],
+    num_days: int = 180,
+    max_date: str | None = None,
+    output: Literal["combined", "per_market"] = "combined",
+    include_events: bool = False,
+    num_short_term_days: int = 14,
+):
+    """
+    Calculate restock for several marketplaces from one pull:
+    sales and inventory are queried once for all `marketplaces` (partitioned by `marketplace` column),
+    dictionary, event spreadsheet, warehouse inventory and size_match are fetched once and shared.
+    Per-marketplace calculations run in parallel processes.
+    The warehouse inventory is not split between marketplaces: every market's restock counts the whole
+    warehouse stock (wh_inventory, allocation), the "wh shared with" column lists the other markets.
+    "combined" - single Excel file with restock / sku_inventory sheets per marketplace
+    "per_market" - separate Excel file per marketplace
+    """
+    results = pull_data(num_days=num_days, max_date=max_date, marketplaces=marketplaces)
+    settings = {
+        "include_events": include_events,
+        "num_days": num_days,
+        "max_date": max_date,
+        "num_short_term_days": num_short_term_days,
+    }
+
+    market_results = {}
+    with ProcessPoolExecutor(max_workers=len(marketplaces)) as executor:
+        futures = [
+            executor.submit(
+                _restock_market,
+                market,
+                split_results_by_marketplace(results, market),
+                settings,
+            )
+            for market in marketplaces
+        ]
+        for future in futures:
+            market, market_forecast, market_sku_results = future.result()
+            shared_with = ", ".join(x for x in marketplaces if x != market)
+            if shared_with:
+                market_forecast["wh shared with"] = shared_with
+            market_results[market] = (market_forecast, market_sku_results)
+
+    file_date = pd.to_datetime("today").strftime("%Y-%m-%d")
+    if output == "combined":
+        dfs, sheet_names = [], []
+        for market in marketplaces:
+            dfs.extend(market_results[market])
+            sheet_names.extend([f"restock {market}", f"sku_inventory {market}"])
+        mm.export_to_excel(
+            dfs=dfs,
+            sheet_names=sheet_names,
+            filename=f"inventory_restock_{file_date}.xlsx",
+            out_folder=user_folder,
+            column_formats=create_column_formatting(),
+        )
+    else:
+        for market in marketplaces:
+            mm.export_to_excel(
+                dfs=list(market_results[market]),
+                sheet_names=["restock", "sku_inventory"],
+                filename=f"inventory_restock_{market}_{file_date}.xlsx",
+                out_folder=user_folder,
+                column_formats=create_column_formatting(),
+            )
+    mm.open_file_folder(os.path.join(user_folder))
+    return market_results, results
+
+
 if __name__ == "__main__":
     max_date = None
     if len(sys.argv) > 1:
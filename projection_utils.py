@@ -0,0 +1,107 @@
+"""
+Time-phased weekly inventory projection per sku:
+on hand (Amazon + warehouse) + incoming containers by ETA week - forecasted demand (daily average and event units),
+as one sku x week matrix of cumulative sums. Weeks are ISO weeks labelled "year-week" like `group_incoming_by_weeks`.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+PROJECTION_WEEKS = 26
+
+
+def week_label(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-{week}"
+
+
+def _event_week_fractions(
+    week_starts: pd.DatetimeIndex, event_start: date | None, event_duration: int
+) -> np.ndarray:
+    """Part of the event's days falling into each projected week"""
+    fractions = np.zeros(len(week_starts))
+    if event_start is None or event_duration <= 0:
+        return fractions
+    event_days = pd.date_range(event_start, periods=event_duration)
+    positions = week_starts.searchsorted(event_days, side="right") - 1
+    inside = (positions >= 0) & (event_days < week_starts[-1] + timedelta(days=7))
+    np.add.at(fractions, positions[inside], 1 / event_duration)
+    return fractions
+
+
+def project_inventory(
+    skus: pd.DataFrame,
+    incoming: pd.DataFrame | None = None,
+    weeks: int = PROJECTION_WEEKS,
+    start: date | None = None,
+    event_start: date | None = None,
+    event_duration: int = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Project end-of-week inventory for every sku.
+    `skus` - sku, on_hand, daily_units, event_units (total units of the event starting on `event_start`)
+    `incoming` - `group_incoming_by_weeks` pivot (sku + "year-week" columns), overdue ETAs count as arriving this week
+    The first week starts on `start` (today by default), so it only carries the remaining days of the ISO week.
+    Returns (summary, projection):
+        summary - sku, stockout week ("" if none within `weeks`), min on hand, min on hand week, coverage gap
+            (units needed to never go below zero over the horizon)
+        projection - sku x week end-of-week on hand, negative = unserved demand
+    """
+    start = pd.to_datetime(start if start else "today").normalize()
+    week_starts = pd.date_range(
+        start - timedelta(days=start.weekday()), periods=weeks, freq="7D"
+    )
+    labels = [week_label(x.date()) for x in week_starts]
+    week_days = np.full(weeks, 7.0)
+    week_days[0] = 7 - start.weekday()
+
+    on_hand = skus["on_hand"].fillna(0).to_numpy(np.float64)
+    daily_units = skus["daily_units"].fillna(0).to_numpy(np.float64)
+    event_units = (
+        skus["event_units"].fillna(0).to_numpy(np.float64)
+        if "event_units" in skus.columns
+        else np.zeros(len(skus))
+    )
+
+    flows = -np.outer(daily_units, week_days)
+    flows -= np.outer(
+        event_units, _event_week_fractions(week_starts, event_start, event_duration)
+    )
+    if incoming is not None and len(incoming) > 0:
+        incoming = incoming.set_index("sku").reindex(skus["sku"]).fillna(0)
+        week_position = {label: i for i, label in enumerate(labels)}
+        for column in incoming.columns:
+            year, week = (int(x) for x in str(column).split("-"))
+            eta_week = pd.Timestamp(date.fromisocalendar(year, week, 1))
+            if eta_week < week_starts[0]:
+                position = 0
+            else:
+                position = week_position.get(str(column))
+            if position is not None:
+                flows[:, position] += incoming[column].to_numpy(np.float64)
+
+    projected = on_hand[:, None] + np.cumsum(flows, axis=1)
+
+    out_of_stock = projected < 0
+    has_stockout = out_of_stock.any(axis=1)
+    stockout_week = np.where(
+        has_stockout, np.array(labels, dtype=object)[out_of_stock.argmax(axis=1)], ""
+    )
+    min_position = projected.argmin(axis=1)
+    min_on_hand = projected[np.arange(len(projected)), min_position]
+
+    summary = pd.DataFrame(
+        {
+            "sku": skus["sku"].to_numpy(),
+            "on_hand": on_hand,
+            "stockout week": stockout_week,
+            "min on hand": min_on_hand,
+            "min on hand week": np.array(labels, dtype=object)[min_position],
+            "coverage gap": np.clip(-min_on_hand, 0, None),
+        }
+    )
+    projection = pd.DataFrame(projected, columns=labels)
+    projection.insert(0, "sku", skus["sku"].to_numpy())
+    return summary, projection
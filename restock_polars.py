@@ -0,0 +1,225 @@
+"""
+Polars versions of the `restock_utils` kernels, used with `engine="polars"`.
+Each function takes and returns the same pandas frames as its pandas counterpart, the work in between runs
+as a lazy, multi-threaded polars query. Polars is optional: it's only imported when this engine is used.
+"""
+
+from datetime import date, timedelta
+from typing import Literal
+
+import pandas as pd
+
+
+def _polars():
+    try:
+        import polars as pl
+    except ImportError:
+        raise ImportError(
+            'engine="polars" needs the polars extra: uv sync --extra polars '
+            "(or pip install -r requirements-polars.txt)"
+        ) from None
+    return pl
+
+
+def _to_pandas(frame) -> pd.DataFrame:
+    result = frame.to_pandas()
+    for column in result.columns:
+        # pandas path keeps text columns as plain python strings
+        if isinstance(result[column].dtype, pd.StringDtype):
+            result[column] = result[column].astype(object)
+    return result
+
+
+def inventory_isr(
+    amazon_inventory: pd.DataFrame,
+    inv_max_date: date | None,
+    col_to_use: Literal["asin", "sku"] = "asin",
+) -> pd.DataFrame:
+    """`calculate_inventory_isr`: long-term and last 14 days in-stock rates per asin / sku"""
+    pl = _polars()
+    inventory = pl.from_pandas(
+        amazon_inventory[[col_to_use, "amz_inventory"]].assign(
+            date=pd.to_datetime(amazon_inventory["date"]).values
+        )
+    ).lazy()
+    daily = inventory.group_by(pl.col("date").dt.date(), col_to_use).agg(
+        pl.col("amz_inventory").sum()
+    )
+    if inv_max_date is None:
+        inv_max_date = daily.select(pl.col("date").max()).collect().item()
+    daily = daily.filter(pl.col("date") <= inv_max_date).with_columns(
+        (pl.col("amz_inventory") > 0).cast(pl.Float64).alias("in-stock-rate")
+    )
+    long_term = daily.group_by(col_to_use).agg(
+        pl.col("in-stock-rate").mean().round(2).alias("ISR")
+    )
+    short_term = (
+        daily.filter(pl.col("date") >= inv_max_date - timedelta(days=13))
+        .group_by(col_to_use)
+        .agg(pl.col("in-stock-rate").mean().round(2).alias("ISR_short"))
+    )
+    isr = (
+        long_term.join(short_term, on=col_to_use, how="full", coalesce=True)
+        .fill_null(0)
+        .sort(col_to_use)
+    )
+    return _to_pandas(isr.collect())
+
+
+def sales_windows(
+    amazon_sales: pd.DataFrame, long_term_days: list[date], short_term_days: list[date]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """`get_asin_sales`: unit / dollar sums per asin over the long and short non-event windows"""
+    pl = _polars()
+    sales = (
+        pl.from_pandas(
+            amazon_sales[["asin", "unit_sales", "dollar_sales"]].assign(
+                date=pd.to_datetime(amazon_sales["date"]).values
+            )
+        )
+        .lazy()
+        .with_columns(pl.col("date").dt.date())
+        .filter(pl.col("date").is_in(long_term_days))
+        .with_columns(pl.col("unit_sales", "dollar_sales").fill_null(0).fill_nan(0))
+    )
+
+    def _sums(frame):
+        return (
+            frame.group_by("asin")
+            .agg(pl.col("unit_sales").sum(), pl.col("dollar_sales").sum())
+            .sort("asin")
+        )
+
+    long_term, short_term = pl.collect_all(
+        [
+            _sums(sales),
+            _sums(sales.filter(pl.col("date").is_in(short_term_days))),
+        ]
+    )
+    return _to_pandas(long_term), _to_pandas(short_term)
+
+
+def latest_inventory(
+    last_inventory: pd.DataFrame, col_to_use: Literal["asin", "sku"] = "asin"
+) -> pd.DataFrame:
+    """`calculate_amazon_inventory`: latest day's inventory per asin / sku, labels joined as unique sorted values"""
+    pl = _polars()
+    # same columns and order as the pandas aggregation
+    columns = (
+        {
+            "amz_inventory": "sum",
+            "amz_available": "sum",
+            "alert": "unique",
+            "recommended_action": "unique",
+            "healthy_inventory_level": "sum",
+            "recommended_removal_quantity": "sum",
+            "estimated_excess_quantity": "sum",
+            "fba_minimum_inventory_level": "sum",
+            "fba_inventory_level_health_status": "unique",
+            "storage_type": "unique",
+        }
+        if col_to_use == "asin"
+        else {"amz_inventory": "sum", "amz_available": "sum"}
+    )
+    labels = [x for x, how in columns.items() if how == "unique"]
+    sums = [x for x, how in columns.items() if how == "sum"]
+    inventory = pl.from_pandas(
+        pd.concat(
+            [
+                last_inventory[[col_to_use] + sums],
+                last_inventory[labels].astype(str),
+            ],
+            axis=1,
+        ).assign(date=pd.to_datetime(last_inventory["date"]).values)
+    ).lazy()
+    aggregations = [pl.col(x).sum() for x in sums] + [
+        pl.col(x)
+        .filter(~pl.col(x).is_in(["nan", "n/a"]))
+        .unique()
+        .sort()
+        .str.join(", ")
+        for x in labels
+    ]
+    latest = (
+        inventory.group_by(pl.col("date").dt.date(), col_to_use)
+        .agg(aggregations)
+        .sort(["date", col_to_use], descending=True)
+        .group_by(col_to_use, maintain_order=True)
+        .first()
+        .sort(col_to_use)
+        .select([col_to_use, "date"] + list(columns))
+    )
+    latest = _to_pandas(latest.collect())
+    latest["date"] = pd.to_datetime(latest["date"]).dt.date
+    return latest
+
+
+def event_forecast(
+    total_sales: pd.DataFrame,
+    event_df: pd.DataFrame,
+    event: str,
+    event_duration: int,
+) -> pd.DataFrame:
+    """`calculate_event_forecast`: event units per asin, same formula as `restock_utils.event_forecast_units`"""
+    pl = _polars()
+    average, best = f"Average {event} sales, units (total)", f"Best {event} performance"
+    events_frame = pl.from_pandas(
+        event_df.assign(
+            **{x: pd.to_numeric(event_df[x], errors="coerce") for x in [average, best]}
+        )
+    ).lazy()
+    avg_units = pl.col("avg units")
+    forecast = (
+        pl.from_pandas(total_sales[["asin", "avg units"]])
+        .lazy()
+        .join(events_frame, on="asin", how="left", maintain_order="left")
+        .with_columns(pl.col(average, best).fill_null(0).fill_nan(0))
+        .with_columns(
+            pl.when(avg_units >= 3)
+            .then((pl.col(average) + avg_units * pl.col(best)) / 2 * 1.2)
+            .otherwise((pl.col(average) + avg_units * event_duration * 2) / 2)
+            .alias(f"{event}_forecasted_sales")
+        )
+        .select("asin", average, best, f"{event}_forecasted_sales")
+    )
+    return _to_pandas(forecast.collect())
+
+
+def incoming_by_weeks(incoming_weeks: pd.DataFrame) -> pd.DataFrame:
+    """`group_incoming_by_weeks`: ordered quantities per SKU in "year-week" columns"""
+    pl = _polars()
+    # container items are nested python lists, flattening them stays in python
+    etas, skus, quantities = [], [], []
+    for eta, items in zip(incoming_weeks["eta"], incoming_weeks["items"]):
+        for item in items:
+            etas.append(eta)
+            skus.append(item["SKU"])
+            quantities.append(item["QtyOrdered"])
+    containers = (
+        pl.DataFrame(
+            {
+                "eta": pd.to_datetime(pd.Series(etas)),
+                "SKU": pd.Series(skus, dtype=object).astype(str),
+                "QtyOrdered": pd.to_numeric(pd.Series(quantities)),
+            }
+        )
+        .lazy()
+        .group_by(
+            pl.col("eta").dt.iso_year().alias("year"),
+            pl.col("eta").dt.week().alias("week"),
+            "SKU",
+        )
+        .agg(pl.col("QtyOrdered").sum())
+        .with_columns(
+            pl.format("{}-{}", "year", "week").alias("year-week"),
+            pl.col("QtyOrdered").cast(pl.Float64),
+        )
+        .collect()
+    )
+    weeks = containers.select("year", "week", "year-week").unique().sort("year", "week")
+    pivot = containers.pivot(on="year-week", index="SKU", values="QtyOrdered").sort(
+        "SKU"
+    )
+    full_containers = _to_pandas(pivot.select(["SKU"] + weeks["year-week"].to_list()))
+    full_containers.columns.name = "year-week"
+    return full_containers
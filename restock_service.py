@@ -0,0 +1,215 @@
+"""
+Long-running local restock service: keeps the latest restock in memory, indexed by asin and collection,
+and recomputes it in the background every `refresh_minutes`.
+Endpoints (JSON):
+    GET  /asin/<asin>               - restock row for one asin
+    GET  /collection/<collection>   - restock rows for all asins of a collection
+    GET  /health                    - last refresh time, number of asins, data registry stats
+    POST /refresh                   - recompute now
+    POST /what-if                   - body: list of overrides (see `whatif.what_if`), returns the diff vs the snapshot
+Run: python restock_service.py [--offline] [--port 8765] [--refresh-minutes 60]
+`--offline` uses `synthetic_data` instead of BigQuery / Google Sheets.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import unquote
+
+import pandas as pd
+
+import main
+from data_registry import date_window, registry
+from db_utils import pull_data
+from whatif import build_whatif_state, what_if
+
+REFRESH_MINUTES = 60
+
+
+class RestockService:
+    def __init__(
+        self,
+        backend: Callable = pull_data,
+        marketplace: str = "US",
+        refresh_minutes: float = REFRESH_MINUTES,
+    ):
+        self.backend = backend
+        self.marketplace = marketplace
+        self.refresh_minutes = refresh_minutes
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # replaced as a whole on every refresh, readers never see a half-built snapshot
+        self._snapshot = {
+            "records": {},
+            "collections": {},
+            "whatif": None,
+            "refreshed_at": None,
+            "refresh_seconds": None,
+            "error": None,
+        }
+
+    def refresh(self) -> None:
+        """Pull fresh data and recompute the restock, one refresh at a time"""
+        with self._refresh_lock:
+            start = time.time()
+            # scheduled refreshes must not be served from the in-process cache
+            registry.invalidate(date_window(main.num_days))
+            pulled_results = self.backend(
+                num_days=main.num_days,
+                max_date=None,
+                marketplaces=[self.marketplace],
+            )
+            # runs in a background thread without a display, no tkinter dialogs
+            restock, _ = main.compute_restock(
+                pulled_results, self.marketplace, interactive=False
+            )
+            records = json.loads(
+                restock.to_json(orient="records", date_format="iso", double_precision=4)
+            )
+            by_asin = {x["asin"]: x for x in records}
+            collections = {}
+            for record in records:
+                # asins shared by several collections are listed as "a, b"
+                for name in str(record.get("collection") or "").split(", "):
+                    if name and name != "0":
+                        collections.setdefault(name, []).append(record["asin"])
+            self._snapshot = {
+                "records": by_asin,
+                "collections": collections,
+                "whatif": build_whatif_state(restock),
+                "refreshed_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+                "refresh_seconds": round(time.time() - start, 2),
+                "error": None,
+            }
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_minutes * 60):
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep serving the previous snapshot
+                self._snapshot = dict(self._snapshot, error=str(e))
+                print(f"Restock refresh failed: {e}")
+
+    def start(self) -> None:
+        """Compute the first snapshot and start refreshing in the background"""
+        self.refresh()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def asin(self, asin: str) -> dict | None:
+        return self._snapshot["records"].get(asin)
+
+    def collection(self, name: str) -> list[dict]:
+        snapshot = self._snapshot
+        return [snapshot["records"][x] for x in snapshot["collections"].get(name, [])]
+
+    def what_if(self, overrides: list[dict]) -> list[dict]:
+        state = self._snapshot["whatif"]
+        if state is None:
+            raise ValueError("Restock is not computed yet")
+        diff = what_if(state, overrides)
+        return json.loads(diff.to_json(orient="records", double_precision=4))
+
+    def health(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "marketplace": self.marketplace,
+            "refreshed_at": snapshot["refreshed_at"],
+            "refresh_seconds": snapshot["refresh_seconds"],
+            "asins": len(snapshot["records"]),
+            "collections": len(snapshot["collections"]),
+            "error": snapshot["error"],
+            "registry": registry.stats(),
+        }
+
+
+class RestockHandler(BaseHTTPRequestHandler):
+    service: RestockService
+
+    def _send(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = [unquote(x) for x in self.path.split("?")[0].strip("/").split("/", 1)]
+        if parts == ["health"]:
+            return self._send(200, self.service.health())
+        if len(parts) == 2 and parts[0] == "asin":
+            record = self.service.asin(parts[1])
+            if record is None:
+                return self._send(404, {"error": f"asin {parts[1]} not found"})
+            return self._send(200, record)
+        if len(parts) == 2 and parts[0] == "collection":
+            records = self.service.collection(parts[1])
+            if not records:
+                return self._send(404, {"error": f"collection {parts[1]} not found"})
+            return self._send(200, records)
+        return self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        path = self.path.strip("/")
+        if path == "what-if":
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                overrides = json.loads(self.rfile.read(length) or b"[]")
+                return self._send(200, self.service.what_if(overrides))
+            except (ValueError, KeyError) as e:
+                return self._send(400, {"error": str(e)})
+        if path != "refresh":
+            return self._send(404, {"error": f"unknown path {self.path}"})
+        try:
+            self.service.refresh()
+        except Exception as e:
+            return self._send(500, {"error": str(e)})
+        return self._send(200, self.service.health())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(
+    service: RestockService, host: str = "127.0.0.1", port: int = 8765
+) -> ThreadingHTTPServer:
+    """Start `service` and return the HTTP server (call `serve_forever` on it)"""
+    service.start()
+    handler = type("Handler", (RestockHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm in-memory restock service")
+    parser.add_argument("--offline", action="store_true", help="use synthetic data")
+    parser.add_argument("--marketplace", default="US")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--refresh-minutes", type=float, default=REFRESH_MINUTES)
+    args = parser.parse_args()
+
+    if args.offline:
+        from synthetic_data import synthetic_pull_data
+
+        backend = synthetic_pull_data
+    else:
+        backend = pull_data
+    server = serve(
+        RestockService(backend, args.marketplace, args.refresh_minutes),
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Restock service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,3 +1,4 @@
+import logging
 from datetime import timedelta
 from tkinter.messagebox import showwarning
 from typing import Literal
@@ -7,12 +8,28 @@ import pandas as pd
 
 from date_utils import events, get_last_non_event_days
 
+logger = logging.getLogger(__name__)
+
+# days of sale the restock covers outside of events
+STANDARD_DAYS_OF_SALE = 49
+
+Engine = Literal["pandas", "polars"]
+
 
 def calculate_inventory_isr(
     amazon_inventory: pd.DataFrame,
     inv_max_date_input: str | None = None,
     col_to_use: Literal["asin", "sku"] = "asin",
+    engine: Engine = "pandas",
 ):
+    if engine == "polars":
+        from restock_polars import inventory_isr
+
+        return inventory_isr(
+            amazon_inventory,
+            pd.to_datetime(inv_max_date_input).date() if inv_max_date_input else None,
+            col_to_use=col_to_use,
+        )
 
     amazon_inventory = amazon_inventory.copy()
 
@@ -73,6 +90,7 @@ def get_asin_sales(
     sales_max_date_input: str | None = None,
     long_term_days: int = 180,
     short_term_days: int = 14,
+    engine: Engine = "pandas",
 ):
     if not sales_max_date_input:
         sales_max_date = (amazon_sales["date"].max() - pd.Timedelta(days=1)).date()
@@ -87,6 +105,20 @@ def get_asin_sales(
 
     amazon_sales["date"] = pd.to_datetime(amazon_sales["date"]).dt.date
 
+    if engine == "polars":
+        from restock_polars import sales_windows
+
+        long_term_sales, short_term_sales = sales_windows(
+            amazon_sales, non_event_days, non_event_days_short
+        )
+        return combine_sales_windows(
+            long_term_sales,
+            short_term_sales,
+            asin_isr,
+            long_term_days=long_term_days,
+            short_term_days=short_term_days,
+        )
+
     amazon_sales = amazon_sales.loc[amazon_sales["date"].isin(non_event_days)]
     amazon_sales = amazon_sales.fillna(0)
 
@@ -104,6 +136,26 @@ def get_asin_sales(
         .reset_index()
         .fillna(0)
     )
+    return combine_sales_windows(
+        long_term_sales,
+        short_term_sales,
+        asin_isr,
+        long_term_days=long_term_days,
+        short_term_days=short_term_days,
+    )
+
+
+def combine_sales_windows(
+    long_term_sales: pd.DataFrame,
+    short_term_sales: pd.DataFrame,
+    asin_isr: pd.DataFrame,
+    long_term_days: int = 180,
+    short_term_days: int = 14,
+) -> pd.DataFrame:
+    """
+    Turn per-asin unit/dollar sums over the long and short windows into ISR-adjusted averages
+    and the blended "avg units" / "avg $" columns.
+    """
     long_term_sales = pd.merge(
         long_term_sales, asin_isr, how="left", on="asin", validate="1:1"
     ).fillna(0)
@@ -249,10 +301,33 @@ def filter_event_spreadsheet(
         raise BaseException(f"Error happened: {e}")
 
 
+def event_forecast_units(
+    avg_units,
+    average_event_sales,
+    best_event_performance,
+    event_duration: int,
+):
+    """
+    Forecasted units for the whole event, works on Series and numpy arrays alike.
+    strong performers (avg units >= 3) get the average of historical event sales and avg units x best performance, +20%,
+    the rest get the average of historical event sales and 2x regular sales over the event duration.
+    """
+    strong_performance = avg_units * best_event_performance  # * event_duration
+    poor_performance = avg_units * event_duration * 2
+    average_event_performance = average_event_sales  # * event_duration
+
+    return np.where(
+        avg_units >= 3,
+        ((average_event_performance + strong_performance) / 2) * 1.2,
+        (average_event_performance + poor_performance) / 2,
+    )
+
+
 def calculate_event_forecast(
     total_sales: pd.DataFrame,
     full_event_df: pd.DataFrame,
     event: Literal["BFCM", "BSS", "PD", "PBDD"],
+    engine: Engine = "pandas",
 ):
 
     # verify that total_sales contains "asin" and "avg units" columns
@@ -268,6 +343,11 @@ def calculate_event_forecast(
 
     event_duration = events[event]["duration"]
 
+    if engine == "polars":
+        from restock_polars import event_forecast
+
+        return event_forecast(total_sales, event_df, event, event_duration)
+
     forecast = pd.merge(
         total_sales, event_df, how="left", on="asin", validate="1:1"
     ).fillna(0)
@@ -285,22 +365,12 @@ def calculate_event_forecast(
     #     forecast["avg units"] * event_duration * 2,  # if condition is false
     # )
 
-    strong_performance = (
-        forecast["avg units"]
-        * forecast[f"Best {event} performance"]  # * event_duration
+    forecast[f"{event}_forecasted_sales"] = event_forecast_units(
+        avg_units=forecast["avg units"],
+        average_event_sales=forecast[f"Average {event} sales, units (total)"],
+        best_event_performance=forecast[f"Best {event} performance"],
+        event_duration=event_duration,
     )
-    poor_performance = forecast["avg units"] * event_duration * 2
-    average_event_performance = forecast[
-        f"Average {event} sales, units (total)"
-    ]  # * event_duration
-
-    forecast[f"{event}_forecasted_sales"] = (
-        average_event_performance + poor_performance
-    ) / 2
-
-    forecast.loc[forecast["avg units"] >= 3, f"{event}_forecasted_sales"] = (
-        (average_event_performance + strong_performance) / 2
-    ) * 1.2
 
     return forecast[
         [
@@ -317,6 +387,7 @@ def calculate_amazon_inventory(
     max_date: str | None = None,
     col_to_use: Literal["asin", "sku"] = "asin",
     show_warning=True,
+    engine: Engine = "pandas",
 ) -> pd.DataFrame:
     # max_date = amazon_inventory["date"].max()
     if max_date:
@@ -328,16 +399,17 @@ def calculate_amazon_inventory(
     # last_inventory = last_inventory.replace("nan", "").replace(np.nan, "")
 
     attempts = 1
-    while len(last_inventory) == 0 and attempts <= 10 and show_warning:
+    while len(last_inventory) == 0 and attempts <= 10:
 
         attempts += 1
 
-        showwarning(
-            title="No inv data",
-            message="No inventory data found for yesterday!!!",
-            icon="warning",
-            detail=f"Report shows zero for AMZ inventory on {check_date} - caution!",
-        )
+        if show_warning:
+            showwarning(
+                title="No inv data",
+                message="No inventory data found for yesterday!!!",
+                icon="warning",
+                detail=f"Report shows zero for AMZ inventory on {check_date} - caution!",
+            )
         check_date = max_date_dt - timedelta(days=attempts)
 
         last_inventory: pd.DataFrame = amazon_inventory.loc[
@@ -345,12 +417,23 @@ def calculate_amazon_inventory(
         ]
 
         if len(last_inventory) > 0:
-            showwarning(
-                title="Found inventory",
-                message=f"Inventory exists for {check_date} only!",
-            )
+            if show_warning:
+                showwarning(
+                    title="Found inventory",
+                    message=f"Inventory exists for {check_date} only!",
+                )
+            else:
+                # headless runs (`show_warning=False`) log instead of opening dialogs
+                logger.warning(
+                    f"No AMZ inventory data found for yesterday, using {check_date}"
+                )
             break
 
+    if engine == "polars":
+        from restock_polars import latest_inventory
+
+        return latest_inventory(last_inventory, col_to_use=col_to_use)
+
     def _fetch_unique(x):
         x = x.astype(str)
         x = x.replace("nan", "n/a")
@@ -383,10 +466,16 @@ def calculate_amazon_inventory(
     return last_inventory
 
 
-def group_incoming_by_weeks(incoming_weeks: pd.DataFrame) -> pd.DataFrame:
+def group_incoming_by_weeks(
+    incoming_weeks: pd.DataFrame, engine: Engine = "pandas"
+) -> pd.DataFrame:
     """
     Helper function to group incoming containers ETAs into weeks and transform them into columns.
     """
+    if engine == "polars":
+        from restock_polars import incoming_by_weeks
+
+        return incoming_by_weeks(incoming_weeks)
 
     tables_list = []
     for _, row in incoming_weeks.iterrows():
@@ -1,14 +1,35 @@
-import pandas as pd
+import os
 import numpy as np
-from db_utils import get_amazon_sales
-from date_utils import is_event, events
-from restock_utils import calculate_event_forecast
+import pandas as pd
+from sales_store import load_asin_daily, load_company_daily, update_sales_store
+from forecast_utils import (
+    build_seasonality_table,
+    daily_forecast,
+    probabilistic_forecast,
+    seasonality_coefficients,
+    stacked_chunks,
+    stacked_units,
+)
 from common import event_dates_margins_list, user_folder
 from utils import mellanni_modules as mm
 from typing import Literal
+from utils_misc import (
+    load_frames_to_bq,
+    read_parquet_partitions,
+    write_long_chunks,
+    write_wide_sheets,
+)
+from shard_utils import (
+    assign_shards,
+    probabilistic_forecast_shard,
+    run_sharded,
+    stacked_units_shard,
+)
 from main import calculate_restock
+from sku_mapping import sku_asin_map
 import threading
 import time
+from functools import partial
 
 FORECAST_YEAR = 2026
 stop = False
@@ -30,94 +51,84 @@ def print_threaded():
         time.sleep(1)
 
 
+def _merge_in_asin_order(
+    results: list[pd.DataFrame], forecast: pd.DataFrame, by: list[str] | None = None
+) -> pd.DataFrame:
+    """Concat shard results, ordered by `by` columns and then by asin position in `forecast`"""
+    position = pd.Series(range(len(forecast)), index=forecast["asin"].values)
+    merged = pd.concat(results, ignore_index=True)
+    merged["_position"] = merged["asin"].map(position)
+    merged = merged.sort_values((by or []) + ["_position"], kind="stable")
+    return merged.drop(columns="_position").reset_index(drop=True)
+
+
+def _sharded_forecast(shard_func, forecast, shards: int, **kwargs) -> list:
+    forecast = forecast.assign(asin=forecast["asin"].astype(str))
+    return run_sharded(
+        shard_func,
+        {"forecast": forecast},
+        "asin",
+        assign_shards(forecast["asin"], shards),
+        **kwargs,
+    )
+
+
+def _sharded_units(forecast, shards: int, **kwargs) -> np.ndarray:
+    """Stacked units computed per shard, rows put back in `forecast` order"""
+    position = pd.Series(
+        range(len(forecast)), index=forecast["asin"].astype(str).values
+    )
+    units = np.zeros((len(forecast), len(kwargs["future_date_range"])))
+    for asins, shard_units in _sharded_forecast(
+        stacked_units_shard, forecast, shards, **kwargs
+    ):
+        units[position[asins].values] = shard_units
+    return units
+
+
 # def main(stack=False):
 def main(
-    stack: Literal["stacked", "daily", "yearly", "last_year"] = "stacked",
+    stack: Literal[
+        "stacked", "daily", "yearly", "last_year", "probabilistic"
+    ] = "stacked",
     max_date: str | None = None,
+    shards: int = 1,
+    stacked_excel: bool = False,
+    publish: bool = False,
 ):
     """
-    "stacked" - forecast with daily breakdown stacked in single column
+    "stacked" - forecast with daily breakdown stacked in single column, streamed month by month
+        to a Parquet dataset `sales_forecast_stacked` partitioned by month
     "daily" - forecast with daily breakdown in separate columns
     "yearly" - forecast with yearly totals only
     "last_year" - forecast based on last year's numbers
+    "probabilistic" - Monte Carlo forecast with P50/P90 units per asin and month, stockout probability and dates
+    `shards` - split restock and stacked / probabilistic forecast calculations by asin across `shards` processes
+    `stacked_excel` - also write the stacked forecast to Excel, split across sheets at Excel's row limit
+    `publish` - load the stacked forecast (asin, date, units, dollars) straight to BigQuery daily_reports.forecast
     """
+    if publish and stack != "stacked":
+        raise ValueError("Only the stacked forecast can be published to BigQuery")
     global stop
-    result = {}
 
-    get_amazon_sales(output=result, to_print=True, num_days=20000, max_date=max_date)
-    full_sales = result["get_amazon_sales"].copy()
-    full_sales = full_sales[["date", "sku", "asin", "unit_sales", "dollar_sales"]]
-    daily_sales = (
-        full_sales[["date", "unit_sales"]].groupby("date").agg("sum").reset_index()
+    update_sales_store(max_date=max_date, to_print=True)
+    daily_sales = load_company_daily(end_date=max_date)
+    seasonality = build_seasonality_table(
+        daily_sales, event_dates=event_dates_margins_list, cache_folder=user_folder
     )
-    non_event_sales = daily_sales[
-        ~daily_sales["date"].isin(event_dates_margins_list)
-    ].copy()
-
-    non_event_sales["avg"] = non_event_sales["unit_sales"].rolling(window=180).mean()
-    non_event_sales["coeff_raw"] = (
-        non_event_sales["unit_sales"] / non_event_sales["avg"]
-    )
-    non_event_sales["coeff"] = non_event_sales["coeff_raw"].rolling(window=3).mean()
-
-    non_event_sales = non_event_sales[
-        non_event_sales["date"].between(
-            pd.to_datetime("2023-01-01").date(),
-            pd.to_datetime("today"),
-            inclusive="left",
-        )
-    ]
-
-    averages = {}
-    for date in non_event_sales["date"].unique():
-        coeff = (
-            non_event_sales[non_event_sales["date"] == date].loc[:, "coeff"].values[0]
-        )
-        month, day = date.month, date.day
-        if (month, day) not in averages:
-            averages[(month, day)] = [coeff]
-        else:
-            averages[(month, day)].append(coeff)
-
-    for key, value in averages.items():
-        averages[key] = np.mean(value)
-
-    def get_nearest_date(date):
-        print(f"Checking date: {date}")
-        month, day = date.month, date.day
-        while (month, day) not in averages:
-            print(f"date {month}-{day} not found, incrementing day.")
-            if day < 31:
-                day += 1
-            else:
-                month += 1 if month < 12 else 1
-                day = 1
-        return month, day
 
     current_restock, results = calculate_restock(
-        include_events=False, num_days=365, max_date=max_date
+        include_events=False,
+        num_days=365,
+        max_date=max_date,
+        sales_store=True,
+        shards=shards,
     )
     forecast = current_restock[["asin", "avg units"]].copy()
     forecast["asin"] = forecast["asin"].str.extract(r"(B\w{9})")
     forecast["avg price"] = current_restock["avg $"] / current_restock["avg units"]
-    wh_inventory = results["get_wh_inventory"]
-    wh_dictionary = results["get_dictionary"][
-        [
-            "asin",
-            "sku",
-        ]
-    ]
-    wh_inventory = pd.merge(
-        wh_inventory,
-        wh_dictionary,
-        how="left",
-        on="sku",
-        validate="m:1",
-    )
-    wh_inventory = (
-        wh_inventory.groupby("asin")
-        .agg({"wh_inventory": "sum", "incoming_containers": "sum"})
-        .reset_index()
+    wh_inventory = sku_asin_map(results["get_dictionary"]).rollup(
+        results["get_wh_inventory"], ["wh_inventory", "incoming_containers"]
     )
     amazon_inventory = results["get_amazon_inventory"]
     amazon_inventory = (
@@ -169,46 +180,22 @@ def main(
 
     forecast_dollars = forecast.copy()
 
-    total = None
     if stack == "stacked":
-        total = pd.DataFrame()
-        for date in future_date_range:
-            forecast["date"] = date.date()
-            if event := is_event(date.year, date.month, date.day):
-                event_forecast = calculate_event_forecast(
-                    total_sales=forecast.loc[:, ["asin", "avg units"]],
-                    full_event_df=results["get_event_spreadsheet"],
-                    event=event,
-                )
-                forecast["event"] = event
-                forecasted_units = (
-                    event_forecast[f"{event}_forecasted_sales"]
-                    / events[event]["duration"]
-                )
-            else:
-                forecasted_units = (
-                    forecast["avg units"] * averages[get_nearest_date(date)]
-                )
-                forecast["event"] = ""
-
-            forecast["units"] = forecasted_units
-            forecast.loc[
-                (forecast["restockable"] == "Do not ship to amazon")
-                | (forecast["life stage"] == "Discontinued"),
-                "units",
-            ] = forecast[["total_inventory", "units"]].min(axis=1)
-            if not event:
-                forecast["avg units"] = forecast["avg units"] * (179 / 180) + forecast[
-                    "units"
-                ] * (1 / 180)
-            forecast["total_inventory"] = forecast["total_inventory"] - forecast[
-                "units"
-            ].clip(0)
-
-            forecast["$"] = forecast["units"] * forecast["avg price"]
-
-            total = pd.concat(
-                [total, forecast[["asin", "date", "event", "units", "$"]]], axis=0
+        coefficients = seasonality_coefficients(seasonality, future_date_range)
+        if shards > 1:
+            units = _sharded_units(
+                forecast,
+                shards,
+                full_event_df=results["get_event_spreadsheet"],
+                future_date_range=future_date_range,
+                coefficients=coefficients,
+            )
+        else:
+            units = stacked_units(
+                forecast=forecast,
+                future_date_range=future_date_range,
+                coefficients=coefficients,
+                full_event_df=results["get_event_spreadsheet"],
             )
 
         dictionary = results["get_dictionary"][
@@ -227,31 +214,64 @@ def main(
             .agg(lambda x: ", ".join(x.unique()))
             .reset_index()
         )
-        total = pd.merge(dictionary, total, how="right", on="asin", validate="1:m")
-        total = total[
-            total["date"].between(
-                pd.to_datetime(f"{FORECAST_YEAR}-01-01").date(),
-                pd.to_datetime(f"{FORECAST_YEAR}-12-31").date(),
+        # months are generated (and written) one at a time, FORECAST_YEAR only
+        stacked_months = (
+            (
+                month,
+                pd.merge(dictionary, chunk, how="right", on="asin", validate="1:m"),
             )
-        ]
-        # import os
-        # total.to_csv(os.path.join(user_folder, "sales_forecast_stack.csv"), index=False)
+            for month, chunk in stacked_chunks(forecast, future_date_range, units)
+            if month.startswith(str(FORECAST_YEAR))
+        )
 
     elif stack == "daily":
-        for date in future_date_range:
-            forecast[date.date()] = (
-                forecast["avg units"] * averages[get_nearest_date(date)]
-            )
+        coefficients = seasonality_coefficients(seasonality, future_date_range)
+        forecast_base = forecast
+        forecast, forecast_dollars, units_matrix, dollars_matrix = daily_forecast(
+            forecast=forecast,
+            future_date_range=future_date_range,
+            coefficients=coefficients,
+        )
 
-            forecast_dollars[date.date()] = (
-                forecast[date.date()] * forecast_dollars["avg price"]
+    elif stack == "probabilistic":
+        coefficients = seasonality_coefficients(seasonality, future_date_range)
+        if shards > 1:
+            shard_results = _sharded_forecast(
+                probabilistic_forecast_shard,
+                forecast,
+                shards,
+                full_event_df=results["get_event_spreadsheet"],
+                future_date_range=future_date_range,
+                coefficients=coefficients,
+                seed=0,
             )
-
-            forecast["avg units"] = forecast["avg units"] * (179 / 180) + forecast[
-                date.date()
-            ] * (1 / 180)
+            summary = _merge_in_asin_order([x[0] for x in shard_results], forecast)
+            monthly = _merge_in_asin_order(
+                [x[1] for x in shard_results], forecast, ["month"]
+            )
+        else:
+            summary, monthly = probabilistic_forecast(
+                forecast=forecast,
+                future_date_range=future_date_range,
+                coefficients=coefficients,
+                full_event_df=results["get_event_spreadsheet"],
+            )
+        summary = pd.merge(
+            forecast[
+                ["asin", "avg units", "total_inventory", "life stage", "restockable"]
+            ],
+            summary,
+            how="left",
+            on="asin",
+            validate="1:1",
+        )
+        monthly = monthly[monthly["month"].str.startswith(str(FORECAST_YEAR))]
 
     elif stack == "last_year":
+        full_sales = load_asin_daily(
+            start_date=f"{FORECAST_YEAR - 1}-01-01",
+            end_date=f"{FORECAST_YEAR - 1}-12-31",
+        )
         full_sales["date"] = pd.to_datetime(
             full_sales["date"],
             format="%Y-%m-%d",
@@ -287,25 +307,65 @@ def main(
         )
 
     thread1 = threading.Thread(target=print_threaded, daemon=True)
-    thread2 = threading.Thread(
-        target=mm.export_to_excel,
-        args=(
-            (
-                [total]
-                if stack == "stacked" and total is not None
-                else [forecast, forecast_dollars]
+    # export in this thread: a failed write raises here instead of publishing a partial dataset
+    if stack == "daily":
+        # write the wide sheets straight from the float32 matrices
+        export = partial(
+            write_wide_sheets,
+            os.path.join(user_folder, "sales_forecast.xlsx"),
+            {
+                "forecast, units": (
+                    forecast.iloc[:, : forecast_base.shape[1]],
+                    units_matrix,
+                ),
+                "forecast, dollars": (forecast_base, dollars_matrix),
+            },
+            [x.strftime("%Y-%m-%d") for x in future_date_range],
+        )
+    elif stack == "stacked":
+        export = partial(
+            write_long_chunks,
+            stacked_months,
+            os.path.join(user_folder, "sales_forecast_stacked"),
+            excel_path=(
+                os.path.join(user_folder, "sales_forecast.xlsx")
+                if stacked_excel
+                else None
             ),
+        )
+    elif stack == "probabilistic":
+        export = partial(
+            mm.export_to_excel,
+            [summary, monthly],
+            ["summary", "monthly"],
+            "sales_forecast_probabilistic.xlsx",
+            user_folder,
+        )
+    else:
+        export = partial(
+            mm.export_to_excel,
+            [forecast, forecast_dollars],
             ["forecast"] if stack else ["forecast, units", "forecast, dollars"],
             "sales_forecast.xlsx",
             user_folder,
-        ),
-    )
+        )
+    stop = False
     thread1.start()
-    thread2.start()
-    thread2.join()
-    stop = True
+    try:
+        export()
+    finally:
+        stop = True
+        thread1.join()
     print("Export completed.")
-    thread1.join()
+
+    if publish:
+        load_frames_to_bq(
+            read_parquet_partitions(
+                os.path.join(user_folder, "sales_forecast_stacked"),
+                columns=["asin", "date", "units", "$"],
+            ),
+            "daily_reports.forecast",
+        )
 
 
 if __name__ == "__main__":
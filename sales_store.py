@@ -0,0 +1,213 @@
+"""
+Local, append-only store of Amazon sales history at the two grains the forecast uses:
+    company daily - date, unit_sales, dollar_sales (single small file)
+    asin daily - date, asin, unit_sales, dollar_sales (one uncompressed Feather file per month)
+Closed months are written once and never touched again, each update only re-pulls the last
+`REFRESH_DAYS` stored days (partial current day, late orders) plus any new days.
+Feather files are uncompressed so they can be memory-mapped instead of read into memory.
+"""
+
+import os
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+from common import user_folder
+from pyarrow import feather
+
+from db_utils import get_amazon_sales_daily
+
+SALES_STORE_FOLDER = os.path.join(user_folder, "sales_store")
+HISTORY_START = "2015-01-01"
+REFRESH_DAYS = 3
+# a store updated this recently up to the requested date is not refreshed again
+MAX_AGE_MINUTES = 60
+
+
+def _store_folder(marketplace: str) -> str:
+    folder = os.path.join(SALES_STORE_FOLDER, marketplace)
+    os.makedirs(os.path.join(folder, "asin_daily"), exist_ok=True)
+    return folder
+
+
+def _month_path(folder: str, month: str) -> str:
+    return os.path.join(folder, "asin_daily", f"{month}.feather")
+
+
+def _stored_months(folder: str) -> list[str]:
+    return sorted(
+        x.removesuffix(".feather")
+        for x in os.listdir(os.path.join(folder, "asin_daily"))
+        if x.endswith(".feather")
+    )
+
+
+def _read(path: str, memory_map: bool = True) -> pd.DataFrame:
+    return feather.read_table(path, memory_map=memory_map).to_pandas()
+
+
+def _write(df: pd.DataFrame, path: str) -> None:
+    # write to a temp file first so a failed update never leaves a broken partition
+    temp_path = path + ".tmp"
+    feather.write_feather(
+        df.reset_index(drop=True), temp_path, compression="uncompressed"
+    )
+    os.replace(temp_path, path)
+
+
+def last_stored_date(marketplace: str = "US") -> date | None:
+    path = os.path.join(_store_folder(marketplace), "company_daily.feather")
+    if not os.path.exists(path):
+        return None
+    return pd.to_datetime(_read(path)["date"]).max().date()
+
+
+def update_sales_store(
+    marketplace: str = "US",
+    max_date: str | None = None,
+    to_print: bool = False,
+    max_age_minutes: int = MAX_AGE_MINUTES,
+) -> None:
+    """
+    Extend the store up to `max_date` (today by default).
+    Only days from `REFRESH_DAYS` before the last stored date up to `max_date` are pulled,
+    only the days the pull returned are replaced and only the months they fall into are rewritten.
+    A `max_date` before the last stored date never changes the store.
+    """
+    folder = _store_folder(marketplace)
+    last_date = last_stored_date(marketplace)
+    company_path = os.path.join(folder, "company_daily.feather")
+    target_date = pd.to_datetime(max_date if max_date else "today").date()
+    if last_date is not None and (
+        last_date > target_date
+        or (
+            last_date == target_date
+            and time.time() - os.path.getmtime(company_path) < max_age_minutes * 60
+        )
+    ):
+        if to_print:
+            print(f"Sales store for {marketplace} is up to date")
+        return
+    min_date = (
+        pd.to_datetime(HISTORY_START).date()
+        if last_date is None
+        else min(last_date - timedelta(days=REFRESH_DAYS - 1), target_date)
+    )
+
+    new_sales = get_amazon_sales_daily(
+        output={},
+        to_print=to_print,
+        min_date=min_date.strftime("%Y-%m-%d"),
+        max_date=target_date.strftime("%Y-%m-%d"),
+        marketplace=marketplace,
+    )
+    if new_sales is None:
+        raise BaseException("Could not pull daily sales for the sales store")
+    new_sales["date"] = pd.to_datetime(new_sales["date"]).dt.date
+    new_sales["unit_sales"] = new_sales["unit_sales"].astype("int64")
+    new_sales["dollar_sales"] = new_sales["dollar_sales"].astype("float64")
+    new_sales["month"] = pd.to_datetime(new_sales["date"]).dt.strftime("%Y-%m")
+    # stored days the pull didn't return (e.g. not loaded to BigQuery yet) are kept
+    pulled_days = set(new_sales["date"])
+
+    for month in sorted(set(new_sales["month"])):
+        path = _month_path(folder, month)
+        month_sales = new_sales.loc[
+            new_sales["month"] == month, ["date", "asin", "unit_sales", "dollar_sales"]
+        ]
+        if os.path.exists(path):
+            stored = _read(path, memory_map=False)
+            stored = stored.loc[~stored["date"].isin(pulled_days)]
+            month_sales = pd.concat([stored, month_sales], ignore_index=True)
+        _write(month_sales.sort_values(["date", "asin"]), path)
+
+    new_company = (
+        new_sales.groupby("date")
+        .agg({"unit_sales": "sum", "dollar_sales": "sum"})
+        .reset_index()
+    )
+    if os.path.exists(company_path):
+        stored = _read(company_path, memory_map=False)
+        stored = stored.loc[~stored["date"].isin(pulled_days)]
+        new_company = pd.concat([stored, new_company], ignore_index=True)
+    _write(new_company.sort_values("date"), company_path)
+    if to_print:
+        print(
+            f"Sales store for {marketplace} updated from {min_date} with {len(new_sales)} rows"
+        )
+
+
+def load_company_daily(
+    start_date: str | date | None = None,
+    end_date: str | date | None = None,
+    marketplace: str = "US",
+) -> pd.DataFrame:
+    """Total units and dollars per date, columns: date, unit_sales, dollar_sales"""
+    path = os.path.join(_store_folder(marketplace), "company_daily.feather")
+    if not os.path.exists(path):
+        raise BaseException(
+            f"Sales store for {marketplace} is empty, run `update_sales_store` first"
+        )
+    return _filter_dates(_read(path), start_date, end_date)
+
+
+def load_asin_daily(
+    start_date: str | date | None = None,
+    end_date: str | date | None = None,
+    marketplace: str = "US",
+    memory_map: bool = True,
+) -> pd.DataFrame:
+    """
+    Units and dollars per date and asin, columns: date, asin, unit_sales, dollar_sales.
+    Only monthly files overlapping [start_date, end_date] are opened.
+    """
+    folder = _store_folder(marketplace)
+    start_month = (
+        pd.to_datetime(start_date).strftime("%Y-%m") if start_date else "0000-00"
+    )
+    end_month = pd.to_datetime(end_date).strftime("%Y-%m") if end_date else "9999-99"
+    months = [x for x in _stored_months(folder) if start_month <= x <= end_month]
+    if not months:
+        return pd.DataFrame(columns=["date", "asin", "unit_sales", "dollar_sales"])
+    asin_daily = pd.concat(
+        [_read(_month_path(folder, x), memory_map=memory_map) for x in months],
+        ignore_index=True,
+    )
+    return _filter_dates(asin_daily, start_date, end_date)
+
+
+def _filter_dates(df, start_date, end_date) -> pd.DataFrame:
+    if start_date:
+        df = df.loc[df["date"] >= pd.to_datetime(start_date).date()]
+    if end_date:
+        df = df.loc[df["date"] <= pd.to_datetime(end_date).date()]
+    return df.reset_index(drop=True)
+
+
+def get_amazon_sales_from_store(
+    output: dict,
+    to_print: bool = False,
+    num_days: int = 180,
+    max_date: str | None = None,
+    marketplaces: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Drop-in replacement for `get_amazon_sales` reading from the local store:
+    same date window (`num_days` + 90 days up to `max_date`), date x asin grain.
+    dataframe columns to return: date, marketplace, asin, unit_sales, dollar_sales
+    """
+    if to_print:
+        print("Starting to run `get_amazon_sales_from_store`")
+    end_date = pd.to_datetime(max_date if max_date else "today").date()
+    start_date = end_date - timedelta(days=num_days + 90)
+    market_sales = []
+    for marketplace in marketplaces or ["US"]:
+        update_sales_store(marketplace=marketplace, max_date=max_date)
+        sales = load_asin_daily(start_date, end_date, marketplace=marketplace)
+        sales.insert(1, "marketplace", marketplace)
+        market_sales.append(sales)
+    result = pd.concat(market_sales, ignore_index=True)
+    output["get_amazon_sales"] = result
+    if to_print:
+        print("Saved data to results `get_amazon_sales`")
+    return result
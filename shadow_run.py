@@ -0,0 +1,497 @@
+"""
+Shadow mode: run the current restock (legacy settings) and a candidate (e.g. engine="polars", shards, incremental)
+on the same pulled data, diff every output column per asin and compare run time and peak memory.
+`--forecast` also diffs the vectorized stacked forecast (`forecast_utils.stacked_units`) against the
+per-day reference loop `legacy_stacked_units` on a forecast built from the legacy restock.
+    python shadow_run.py --candidate engine=polars --synthetic 2000 --no-memory --forecast   # CI (.github/workflows/tests.yml)
+    python shadow_run.py --candidate n_shards=4 --snapshot pulled.pkl       # production snapshot (`save_snapshot`)
+    python shadow_run.py --candidate engine=polars --atol 0.01 --tolerance "avg price=0.001,0.01"
+Money columns allow cent rounding differences by default (`MONEY_ATOL`), exits with 1 when the outputs differ beyond the tolerances.
+"""
+
+import argparse
+import ast
+import gc
+import sys
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import main
+from date_utils import events, is_event
+from forecast_utils import (
+    build_seasonality_table,
+    seasonality_coefficients,
+    stacked_units,
+)
+from restock_utils import calculate_event_forecast
+
+DEFAULT_RTOL = 0.0
+DEFAULT_ATOL = 1e-6
+# money columns are rounded to cents, engines can differ by a cent (see benchmark_engines.py),
+# values derived from them (avg price = avg $ / avg units, lost sales) by a bit more
+MONEY_RTOL = 1e-3
+MONEY_ATOL = 0.01 + 1e-9
+MONEY_MARKERS = ("$", "dollar", "price", "lost sales")
+# same horizon as `sales_forecast.main`
+FORECAST_DAYS = 500
+RSS_SAMPLE_SECONDS = 0.01
+
+
+def _default_tolerance(column: str, rtol: float, atol: float) -> tuple[float, float]:
+    if any(x in column for x in MONEY_MARKERS):
+        return max(rtol, MONEY_RTOL), max(atol, MONEY_ATOL)
+    return rtol, atol
+
+
+def save_snapshot(pulled_results: dict, path: str) -> None:
+    """Store a `pull_data` result to replay it in shadow mode later"""
+    pd.to_pickle(pulled_results, path)
+
+
+def load_snapshot(path: str) -> dict:
+    return pd.read_pickle(path)
+
+
+def _restock_with(settings: dict) -> Callable[[dict, str], pd.DataFrame]:
+    """`main.compute_restock` with module settings (globals like `engine`, `n_shards`) replaced for the run"""
+
+    def _run(pulled_results: dict, market: str) -> pd.DataFrame:
+        previous = {name: getattr(main, name) for name in settings}
+        try:
+            for name, value in settings.items():
+                setattr(main, name, value)
+            restock, _ = main.compute_restock(pulled_results, market)
+        finally:
+            for name, value in previous.items():
+                setattr(main, name, value)
+        return restock
+
+    return _run
+
+
+def _rss_bytes(process) -> int:
+    """Resident memory of `process` and its children (process pool workers)"""
+    import psutil
+
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:  # worker exited between listing and reading
+            pass
+    return total
+
+
+def _peak_rss_mb(func: Callable, *args) -> float:
+    """
+    Peak resident memory above the starting point while `func` runs, sampled every `RSS_SAMPLE_SECONDS`.
+    Unlike tracemalloc it sees native allocations (polars, numpy) and process pool workers.
+    """
+    import psutil
+
+    gc.collect()
+    process = psutil.Process()
+    start = peak = _rss_bytes(process)
+    done = threading.Event()
+
+    def _sample():
+        nonlocal peak
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak = max(peak, _rss_bytes(process))
+
+    sampler = threading.Thread(target=_sample, daemon=True)
+    sampler.start()
+    try:
+        func(*args)
+    finally:
+        done.set()
+        sampler.join()
+    return (max(peak, _rss_bytes(process)) - start) / 2**20
+
+
+def _measure(
+    func: Callable, pulled_results: dict, market: str, memory: bool
+) -> tuple[pd.DataFrame, float, float | None]:
+    # pipelines modify the frames they get, every run starts from its own copy
+    inputs = {
+        k: v.copy() if isinstance(v, pd.DataFrame) else v
+        for k, v in pulled_results.items()
+    }
+    start = time.perf_counter()
+    result = func(inputs, market)
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if memory:
+        # separate sampled run, sampling would skew the timing
+        inputs = {
+            k: v.copy() if isinstance(v, pd.DataFrame) else v
+            for k, v in pulled_results.items()
+        }
+        peak_mb = _peak_rss_mb(func, inputs, market)
+    return result, seconds, peak_mb
+
+
+def diff_frames(
+    legacy: pd.DataFrame,
+    candidate: pd.DataFrame,
+    key: str = "asin",
+    tolerances: dict[str, tuple[float, float]] | None = None,
+    rtol: float = DEFAULT_RTOL,
+    atol: float = DEFAULT_ATOL,
+) -> pd.DataFrame:
+    """
+    Per-`key` diff of every column: key, column, legacy, candidate, abs diff.
+    `tolerances` - column -> (rtol, atol) overriding the defaults for numeric columns,
+    money columns ("$", "dollar", "price", "lost sales") default to at least MONEY_RTOL / MONEY_ATOL.
+    Values missing on both sides are equal, rows present on one side only are reported with column "_row".
+    """
+    tolerances = tolerances or {}
+    merged = pd.merge(
+        legacy,
+        candidate,
+        how="outer",
+        on=key,
+        suffixes=("_legacy", "_candidate"),
+        indicator=True,
+    )
+    diffs = [
+        pd.DataFrame(
+            {
+                key: merged.loc[merged["_merge"] != "both", key],
+                "column": "_row",
+                "legacy": merged.loc[merged["_merge"] != "both", "_merge"].astype(str),
+                "candidate": "",
+                "abs diff": np.nan,
+            }
+        )
+    ]
+    both = merged.loc[merged["_merge"] == "both"]
+    columns = [x for x in legacy.columns if x != key and x in candidate.columns]
+    for column in columns:
+        left, right = both[f"{column}_legacy"], both[f"{column}_candidate"]
+        if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+            column_rtol, column_atol = tolerances.get(
+                column, _default_tolerance(column, rtol, atol)
+            )
+            left_values = left.to_numpy(np.float64)
+            right_values = right.to_numpy(np.float64)
+            equal = np.isclose(
+                left_values, right_values, rtol=column_rtol, atol=column_atol
+            ) | (np.isnan(left_values) & np.isnan(right_values))
+            with np.errstate(invalid="ignore"):
+                abs_diff = np.abs(left_values - right_values)
+        else:
+            equal = (left.astype(str).values == right.astype(str).values) | (
+                left.isna().values & right.isna().values
+            )
+            abs_diff = np.full(len(left), np.nan)
+        diffs.append(
+            pd.DataFrame(
+                {
+                    key: both.loc[~equal, key],
+                    "column": column,
+                    "legacy": left.loc[~equal].astype(object),
+                    "candidate": right.loc[~equal].astype(object),
+                    "abs diff": abs_diff[~equal],
+                }
+            )
+        )
+    for column in set(legacy.columns) ^ set(candidate.columns):
+        diffs.append(
+            pd.DataFrame(
+                {
+                    key: ["_all"],
+                    "column": [column],
+                    "legacy": [column in legacy.columns],
+                    "candidate": [column in candidate.columns],
+                    "abs diff": [np.nan],
+                }
+            )
+        )
+    return pd.concat(diffs, ignore_index=True)
+
+
+def _summary(diffs: pd.DataFrame) -> pd.DataFrame:
+    return (
+        diffs.groupby("column")
+        .agg(mismatches=("column", "size"), max_abs_diff=("abs diff", "max"))
+        .reset_index()
+        .sort_values("mismatches", ascending=False)
+    )
+
+
+def shadow_run(
+    pulled_results: dict,
+    candidate: dict | Callable[[dict, str], pd.DataFrame],
+    legacy: dict | Callable[[dict, str], pd.DataFrame] | None = None,
+    market: str = "US",
+    tolerances: dict[str, tuple[float, float]] | None = None,
+    rtol: float = DEFAULT_RTOL,
+    atol: float = DEFAULT_ATOL,
+    memory: bool = True,
+) -> dict:
+    """
+    Run `legacy` (current settings by default) and `candidate` on the same pulled data.
+    Both are either main.py settings to override (e.g. {"engine": "polars"}) or functions
+    (pulled_results, market) -> restock frame with plain asins.
+    Returns a report: diffs (see `diff_frames`), summary per column, timings and memory ratio.
+    """
+    runs = {}
+    for name, pipeline in {"legacy": legacy or {}, "candidate": candidate}.items():
+        func = _restock_with(pipeline) if isinstance(pipeline, dict) else pipeline
+        runs[name] = _measure(func, pulled_results, market, memory)
+
+    diffs = diff_frames(
+        runs["legacy"][0],
+        runs["candidate"][0],
+        tolerances=tolerances,
+        rtol=rtol,
+        atol=atol,
+    )
+    (_, legacy_seconds, legacy_mb), (_, candidate_seconds, candidate_mb) = (
+        runs["legacy"],
+        runs["candidate"],
+    )
+    return {
+        "equal": diffs.empty,
+        "diffs": diffs,
+        "summary": _summary(diffs),
+        "legacy_seconds": legacy_seconds,
+        "candidate_seconds": candidate_seconds,
+        "time_ratio": candidate_seconds / legacy_seconds,
+        "legacy_peak_mb": legacy_mb,
+        "candidate_peak_mb": candidate_mb,
+        # RSS can stay flat when freed memory is reused, no ratio then
+        "memory_ratio": candidate_mb / legacy_mb if memory and legacy_mb else None,
+    }
+
+
+def legacy_stacked_units(
+    forecast: pd.DataFrame,
+    future_date_range: pd.DatetimeIndex,
+    coefficients: np.ndarray,
+    full_event_df: pd.DataFrame,
+) -> np.ndarray:
+    """
+    Reference for `forecast_utils.stacked_units`: the stacked forecast loop as it was before the
+    vectorized kernel, one pandas pass over all asins per day with `calculate_event_forecast` on event days.
+    Slow, only meant for shadow runs. Returns the asin x day units matrix in `forecast` order.
+    """
+    forecast = forecast.loc[
+        :, ["asin", "avg units", "total_inventory", "life stage", "restockable"]
+    ].reset_index(drop=True)
+    capped = (forecast["restockable"] == "Do not ship to amazon") | (
+        forecast["life stage"] == "Discontinued"
+    )
+    units = np.empty((len(forecast), len(future_date_range)))
+    for day, date in enumerate(future_date_range):
+        if event := is_event(date.year, date.month, date.day):
+            event_forecast = calculate_event_forecast(
+                total_sales=forecast.loc[:, ["asin", "avg units"]],
+                full_event_df=full_event_df,
+                event=event,
+            )
+            forecast["units"] = (
+                event_forecast[f"{event}_forecasted_sales"] / events[event]["duration"]
+            )
+        else:
+            forecast["units"] = forecast["avg units"] * coefficients[day]
+        forecast.loc[capped, "units"] = forecast[["total_inventory", "units"]].min(
+            axis=1
+        )
+        if not event:
+            forecast["avg units"] = forecast["avg units"] * (179 / 180) + forecast[
+                "units"
+            ] * (1 / 180)
+        forecast["total_inventory"] = forecast["total_inventory"] - forecast[
+            "units"
+        ].clip(0)
+        units[:, day] = forecast["units"].to_numpy(np.float64)
+    return units
+
+
+def _forecast_inputs(restock: pd.DataFrame, pulled_results: dict):
+    """
+    Forecast frame, horizon and seasonality coefficients like `sales_forecast.main` builds them,
+    with the seasonality taken from the pulled sales only (neutral where they are too short)
+    """
+    forecast = restock.loc[:, ["asin", "avg units", "life stage", "restockable"]]
+    forecast["total_inventory"] = (
+        restock[["wh_inventory", "incoming_containers", "amz_inventory"]]
+        .apply(pd.to_numeric, errors="coerce")
+        .fillna(0)
+        .sum(axis=1)
+    )
+    sales = pulled_results["get_amazon_sales"]
+    daily_sales = (
+        sales.assign(date=pd.to_datetime(sales["date"]))
+        .groupby("date", as_index=False)["unit_sales"]
+        .sum()
+    )
+    start = daily_sales["date"].max() + pd.Timedelta(days=1)
+    future_date_range = pd.date_range(start=start, periods=FORECAST_DAYS)
+    table = build_seasonality_table(daily_sales, event_dates=[])
+    # a pull shorter than the 180-day rolling window leaves slots without a coefficient
+    coefficients = np.nan_to_num(
+        seasonality_coefficients(table, future_date_range), nan=1.0
+    )
+    return forecast, future_date_range, coefficients
+
+
+def forecast_shadow_run(
+    pulled_results: dict,
+    market: str = "US",
+    restock: pd.DataFrame | None = None,
+    tolerances: dict[str, tuple[float, float]] | None = None,
+    rtol: float = DEFAULT_RTOL,
+    atol: float = DEFAULT_ATOL,
+) -> dict:
+    """
+    Diff the vectorized stacked forecast (`stacked_units`) against `legacy_stacked_units`
+    over `FORECAST_DAYS` days, on a forecast built from `restock` (computed from `pulled_results` if not given).
+    Returns a report like `shadow_run`: diffs per asin with one column per forecast date, timings, no memory.
+    """
+    if restock is None:
+        restock = _restock_with({})(
+            {
+                k: v.copy() if isinstance(v, pd.DataFrame) else v
+                for k, v in pulled_results.items()
+            },
+            market,
+        )
+    forecast, future_date_range, coefficients = _forecast_inputs(
+        restock, pulled_results
+    )
+    runs = {}
+    for name, func in {
+        "legacy": legacy_stacked_units,
+        "candidate": stacked_units,
+    }.items():
+        start = time.perf_counter()
+        units = func(
+            forecast=forecast.copy(),
+            future_date_range=future_date_range,
+            coefficients=coefficients,
+            full_event_df=pulled_results["get_event_spreadsheet"],
+        )
+        seconds = time.perf_counter() - start
+        frame = pd.DataFrame(units, columns=future_date_range.strftime("%Y-%m-%d"))
+        runs[name] = (frame.assign(asin=forecast["asin"].values), seconds)
+
+    diffs = diff_frames(
+        runs["legacy"][0],
+        runs["candidate"][0],
+        tolerances=tolerances,
+        rtol=rtol,
+        atol=atol,
+    )
+    legacy_seconds, candidate_seconds = runs["legacy"][1], runs["candidate"][1]
+    return {
+        "equal": diffs.empty,
+        "diffs": diffs,
+        "summary": _summary(diffs),
+        "legacy_seconds": legacy_seconds,
+        "candidate_seconds": candidate_seconds,
+        "time_ratio": candidate_seconds / legacy_seconds,
+        "legacy_peak_mb": None,
+        "candidate_peak_mb": None,
+        "memory_ratio": None,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"Time: legacy {report['legacy_seconds']:.2f}s, candidate {report['candidate_seconds']:.2f}s "
+        f"(x{report['time_ratio']:.2f})"
+    )
+    if report["memory_ratio"] is not None:
+        print(
+            f"Peak memory (RSS): legacy {report['legacy_peak_mb']:.0f} MB, "
+            f"candidate {report['candidate_peak_mb']:.0f} MB (x{report['memory_ratio']:.2f})"
+        )
+    if report["equal"]:
+        print("Outputs are equal")
+    else:
+        print(f"{len(report['diffs'])} mismatches:")
+        print(report["summary"].to_string(index=False))
+        print(report["diffs"].head(20).to_string(index=False))
+
+
+def _parse_settings(items: list[str]) -> dict:
+    settings = {}
+    for item in items:
+        name, value = item.split("=", 1)
+        if not hasattr(main, name):
+            raise ValueError(f"main.py has no setting `{name}`")
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[name] = value
+    return settings
+
+
+def _parse_tolerances(items: list[str]) -> dict[str, tuple[float, float]]:
+    """ "column=atol" or "column=rtol,atol" """
+    tolerances = {}
+    for item in items:
+        column, value = item.rsplit("=", 1)
+        parts = [float(x) for x in value.split(",")]
+        tolerances[column] = (
+            (parts[0], parts[1]) if len(parts) == 2 else (0.0, parts[0])
+        )
+    return tolerances
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shadow-run a candidate restock")
+    parser.add_argument("--candidate", nargs="+", required=True, help="setting=value")
+    parser.add_argument("--legacy", nargs="*", default=[], help="setting=value")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, metavar="N_ASINS")
+    source.add_argument("--snapshot", help="pickled `pull_data` result")
+    parser.add_argument("--market", default="US")
+    parser.add_argument("--rtol", type=float, default=DEFAULT_RTOL)
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL)
+    parser.add_argument("--tolerance", nargs="*", default=[], help="column=atol")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument(
+        "--forecast",
+        action="store_true",
+        help="also diff the stacked forecast kernel against the reference loop",
+    )
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from synthetic_data import synthetic_results
+
+        pulled = synthetic_results(marketplaces=[args.market], n_asins=args.synthetic)
+    else:
+        pulled = load_snapshot(args.snapshot)
+    report = shadow_run(
+        pulled,
+        _parse_settings(args.candidate),
+        legacy=_parse_settings(args.legacy),
+        market=args.market,
+        tolerances=_parse_tolerances(args.tolerance),
+        rtol=args.rtol,
+        atol=args.atol,
+        memory=not args.no_memory,
+    )
+    print_report(report)
+    equal = report["equal"]
+    if args.forecast:
+        print("\nStacked forecast, kernel vs reference loop:")
+        forecast_report = forecast_shadow_run(
+            pulled,
+            market=args.market,
+            tolerances=_parse_tolerances(args.tolerance),
+            rtol=args.rtol,
+            atol=args.atol,
+        )
+        print_report(forecast_report)
+        equal = equal and forecast_report["equal"]
+    sys.exit(0 if equal else 1)
@@ -0,0 +1,165 @@
+"""
+Process-pool sharding of per-asin (or per-sku) calculations.
+Input frames are written once to uncompressed Feather files and memory-mapped by the workers,
+each worker only materializes the rows of its own shard. Results come back in shard order and
+are merged by the caller in a fixed key order, so the output doesn't depend on which shard finishes first.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import feather
+
+from forecast_utils import probabilistic_forecast, stacked_units
+from restock_utils import (
+    calculate_amazon_inventory,
+    calculate_inventory_isr,
+    get_asin_sales,
+)
+
+
+def assign_shards(
+    keys: pd.Series, n_shards: int, groups: pd.Series | None = None
+) -> list[np.ndarray]:
+    """
+    Split unique `keys` into `n_shards` lists.
+    With `groups` (aligned with `keys`, e.g. collection per asin) whole groups stay in one shard and
+    groups are balanced by size (largest first), otherwise keys are split by a stable hash.
+    """
+    keys = pd.Series(keys).reset_index(drop=True)
+    if groups is None:
+        shard_ids = pd.util.hash_array(keys.astype(str).values) % n_shards
+    else:
+        groups = pd.Series(groups).reset_index(drop=True).fillna("").astype(str)
+        sizes = groups.value_counts().sort_index(kind="stable")
+        sizes = sizes.sort_values(ascending=False, kind="stable")
+        load = np.zeros(n_shards)
+        group_shard = {}
+        for group, size in sizes.items():
+            shard = int(np.argmin(load))
+            group_shard[group] = shard
+            load[shard] += size
+        shard_ids = groups.map(group_shard).values
+    return [np.sort(keys.values[shard_ids == x]) for x in range(n_shards)]
+
+
+def _load_shard(path: str, key: str, keys: np.ndarray) -> pd.DataFrame:
+    table = feather.read_table(path, memory_map=True)
+    table = table.filter(pc.is_in(table[key], value_set=pa.array(keys)))
+    return table.to_pandas()
+
+
+def _run_shard(func: Callable, paths: dict[str, str], key: str, keys, kwargs):
+    frames = {name: _load_shard(path, key, keys) for name, path in paths.items()}
+    return func(**frames, **kwargs)
+
+
+def run_sharded(
+    func: Callable,
+    frames: dict[str, pd.DataFrame],
+    key: str,
+    shards: list[np.ndarray],
+    max_workers: int | None = None,
+    **kwargs,
+) -> list:
+    """
+    Run `func(**frames, **kwargs)` once per shard in a process pool.
+    Every frame in `frames` must have a `key` column and is limited to the shard's keys,
+    small reference data that all shards need whole goes to `kwargs`.
+    `func` must be a module-level function. Returns the results in shard order.
+    """
+    missing = [name for name, df in frames.items() if key not in df.columns]
+    if missing:
+        raise ValueError(f"Frames without `{key}` column can't be sharded: {missing}")
+    folder = tempfile.mkdtemp(prefix="restock_shards_")
+    try:
+        paths = {}
+        for name, df in frames.items():
+            paths[name] = os.path.join(folder, f"{name}.feather")
+            feather.write_feather(
+                df.reset_index(drop=True), paths[name], compression="uncompressed"
+            )
+        with ProcessPoolExecutor(max_workers=max_workers or len(shards)) as executor:
+            futures = [
+                executor.submit(_run_shard, func, paths, key, keys, kwargs)
+                for keys in shards
+                if len(keys) > 0
+            ]
+            return [future.result() for future in futures]
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def concat_sorted(results: list[pd.DataFrame], key: str) -> pd.DataFrame:
+    """Merge per-shard frames in `key` order, same as a single groupby over all keys"""
+    return (
+        pd.concat(results, ignore_index=True)
+        .sort_values(key, kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def isr_shard(amazon_inventory, col_to_use, inv_max_date):
+    return calculate_inventory_isr(
+        amazon_inventory, inv_max_date_input=inv_max_date, col_to_use=col_to_use
+    )
+
+
+def asin_sales_shard(
+    amazon_sales,
+    amazon_inventory,
+    include_events,
+    long_term_days,
+    short_term_days,
+    sales_max_date,
+    inv_max_date,
+):
+    asin_isr = calculate_inventory_isr(
+        amazon_inventory, inv_max_date_input=inv_max_date
+    )
+    total_sales = get_asin_sales(
+        amazon_sales,
+        asin_isr,
+        include_events=include_events,
+        sales_max_date_input=sales_max_date,
+        long_term_days=long_term_days,
+        short_term_days=short_term_days,
+    )
+    return asin_isr, total_sales
+
+
+def amazon_inventory_shard(amazon_inventory, col_to_use):
+    return calculate_amazon_inventory(
+        amazon_inventory, col_to_use=col_to_use, show_warning=False
+    )
+
+
+def stacked_units_shard(
+    forecast, full_event_df, future_date_range, coefficients
+) -> tuple[np.ndarray, np.ndarray]:
+    units = stacked_units(forecast, future_date_range, coefficients, full_event_df)
+    return forecast["asin"].values, units
+
+
+def probabilistic_forecast_shard(
+    forecast, full_event_df, future_date_range, coefficients, seed, **kwargs
+):
+    # every shard draws from its own stream, seeded from the run seed and the shard's first asin
+    shard_seed = None
+    if seed is not None and len(forecast) > 0:
+        shard_seed = [seed, int(pd.util.hash_array(forecast["asin"].values[:1])[0])]
+    return probabilistic_forecast(
+        forecast,
+        future_date_range,
+        coefficients,
+        full_event_df,
+        seed=shard_seed,
+        **kwargs,
+    )
@@ -0,0 +1,115 @@
+"""
+SKU <-> ASIN incidence mapping built once from `get_dictionary`.
+Every sku belongs to one asin, so the incidence matrix is stored as an array of asin positions per sku:
+rollups (sku -> asin sums) are weighted bincounts and drilldowns (asin -> sku) are array lookups,
+instead of merging the dictionary and grouping again at every level change.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+class SkuAsinMap:
+    def __init__(self, dictionary: pd.DataFrame):
+        mapping = (
+            dictionary[["sku", "asin"]]
+            .dropna()
+            .astype(str)
+            .drop_duplicates("sku")
+            .reset_index(drop=True)
+        )
+        self.skus = pd.Index(mapping["sku"])
+        # asins sorted, same order as a groupby("asin") result
+        codes, self.asins = pd.factorize(mapping["asin"], sort=True)
+        self.sku_asin = codes.astype(np.int64)
+
+    def asin_positions(self, skus) -> np.ndarray:
+        """Position in `asins` for each of `skus`, -1 for skus missing from the dictionary"""
+        positions = self.skus.get_indexer(pd.Index(skus).astype(str))
+        return np.where(positions >= 0, self.sku_asin[positions], -1)
+
+    def rollup(
+        self, frame: pd.DataFrame, columns: list[str], key: str = "sku"
+    ) -> pd.DataFrame:
+        """
+        Sum sku-level `columns` of `frame` up to asins (NaN counts as 0). Only asins with at least one sku row
+        in `frame` are returned, skus missing from the dictionary are dropped - like merge + groupby("asin").sum()
+        """
+        positions = self.asin_positions(frame[key])
+        known = positions >= 0
+        positions = positions[known]
+        present = np.flatnonzero(np.bincount(positions, minlength=len(self.asins)))
+        rolled = {"asin": self.asins[present]}
+        for column in columns:
+            values = pd.to_numeric(frame[column], errors="coerce")
+            sums = np.bincount(
+                positions,
+                weights=np.nan_to_num(values.to_numpy(np.float64)[known]),
+                minlength=len(self.asins),
+            )[present]
+            # keep integer counts as integers, like groupby().sum()
+            if pd.api.types.is_integer_dtype(values.dtype):
+                sums = sums.round().astype(values.dtype)
+            rolled[column] = sums
+        return pd.DataFrame(rolled)
+
+    def drilldown(
+        self,
+        frame: pd.DataFrame,
+        columns: list[str],
+        weights: np.ndarray | None = None,
+    ) -> pd.DataFrame:
+        """
+        Spread asin-level `columns` of `frame` to every sku of the dictionary, multiplied by `weights`
+        (per sku in dictionary order, e.g. `sales_shares`). Asins missing from `frame` give NaN.
+        """
+        positions = self.asins.get_indexer(frame["asin"].astype(str))
+        known = positions >= 0
+        result = {"sku": self.skus, "asin": self.asins[self.sku_asin]}
+        for column in columns:
+            values = np.full(len(self.asins), np.nan)
+            values[positions[known]] = pd.to_numeric(
+                frame[column], errors="coerce"
+            ).to_numpy(np.float64)[known]
+            values = values[self.sku_asin]
+            result[column] = values if weights is None else values * weights
+        return pd.DataFrame(result)
+
+    def equal_shares(self) -> np.ndarray:
+        """Every sku of an asin gets the same share, for when there are no sku-level sales"""
+        return 1 / np.bincount(self.sku_asin)[self.sku_asin]
+
+    def sales_shares(self, sku_sales: pd.DataFrame) -> np.ndarray:
+        """
+        Share of each dictionary sku in its asin's unit sales (`sku_sales` - sku, unit_sales),
+        asins without sales split evenly between their skus
+        """
+        positions = self.skus.get_indexer(sku_sales["sku"].astype(str))
+        known = positions >= 0
+        units = np.bincount(
+            positions[known],
+            weights=np.nan_to_num(
+                sku_sales["unit_sales"].to_numpy(np.float64)[known]
+            ).clip(0),
+            minlength=len(self.skus),
+        )
+        asin_units = np.bincount(self.sku_asin, weights=units)[self.sku_asin]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(asin_units > 0, units / asin_units, self.equal_shares())
+
+
+_maps: dict[str, SkuAsinMap] = {}
+
+
+def sku_asin_map(dictionary: pd.DataFrame) -> SkuAsinMap:
+    """Mapping for `dictionary`, reused while the dictionary's sku / asin content doesn't change"""
+    pairs = dictionary[["sku", "asin"]].astype(str)
+    key = hashlib.sha256(
+        pd.util.hash_pandas_object(pairs, index=False).values.tobytes()
+    ).hexdigest()
+    if key not in _maps:
+        _maps.clear()
+        _maps[key] = SkuAsinMap(dictionary)
+    return _maps[key]
@@ -0,0 +1,167 @@
+"""
+Synthetic stand-in for `db_utils.pull_data`, for running the restock (and the restock service) offline.
+Frames have the same keys and columns as the real pull, values are random but reproducible for a `seed`.
+"""
+
+import numpy as np
+import pandas as pd
+
+from date_utils import events
+
+
+def synthetic_results(
+    num_days: int = 180,
+    max_date: str | None = None,
+    marketplaces: list[str] | None = None,
+    n_asins: int = 200,
+    seed: int = 0,
+) -> dict:
+    rng = np.random.default_rng(seed)
+    marketplaces = marketplaces or ["US"]
+    end = pd.to_datetime(max_date if max_date else "today").normalize()
+
+    asins = np.array([f"B0SYN{i:05d}" for i in range(n_asins)])
+    skus_per_asin = rng.integers(1, 3, n_asins)
+    sku_asins = np.repeat(asins, skus_per_asin)
+    skus = np.array(
+        [
+            f"SYN-{asin[-5:]}-{k}"
+            for asin, n in zip(asins, skus_per_asin)
+            for k in range(n)
+        ]
+    )
+    n_skus = len(skus)
+    collection_ids = rng.integers(0, max(1, n_asins // 10), n_asins)
+
+    dictionary = pd.DataFrame(
+        {
+            "sku": skus,
+            "asin": sku_asins,
+            "collection": np.repeat(
+                [f"Collection {x}" for x in collection_ids], skus_per_asin
+            ),
+            "size": rng.choice(["Twin", "Full", "Queen", "King"], n_skus),
+            "color": rng.choice(["White", "Grey", "Navy", "Beige"], n_skus),
+            "actuality": "Current",
+            "life stage": rng.choice(["Active", "Discontinued"], n_skus, p=[0.9, 0.1]),
+            "restockable": rng.choice(
+                ["Restockable", "Do not ship to amazon"], n_skus, p=[0.9, 0.1]
+            ),
+        }
+    )
+
+    rates = rng.gamma(1.0, 3.0, n_skus)
+    prices = rng.uniform(15, 60, n_skus).round(2)
+
+    def _market_frames(marketplace: str):
+        sales_dates = pd.date_range(end=end, periods=num_days + 91)
+        units = rng.poisson(rates, (len(sales_dates), n_skus))
+        day_index, sku_index = np.nonzero(units)
+        sales = pd.DataFrame(
+            {
+                "date": sales_dates[day_index].date,
+                "marketplace": marketplace,
+                "sku": skus[sku_index],
+                "asin": sku_asins[sku_index],
+                "unit_sales": units[day_index, sku_index],
+                "dollar_sales": units[day_index, sku_index] * prices[sku_index],
+            }
+        )
+
+        inventory_dates = pd.date_range(
+            end=end - pd.Timedelta(days=1), periods=num_days
+        )
+        stock = rng.integers(0, 400, n_skus) * (rng.random(n_skus) > 0.1)
+        out_of_stock = rng.random((len(inventory_dates), n_skus)) < 0.05
+        history_inventory = np.where(out_of_stock, 0, stock)
+        inventory = pd.DataFrame(
+            {
+                "date": np.repeat(inventory_dates.date, n_skus),
+                "marketplace": marketplace,
+                "sku": np.tile(skus, len(inventory_dates)),
+                "asin": np.tile(sku_asins, len(inventory_dates)),
+                "amz_inventory": history_inventory.ravel(),
+            }
+        )
+
+        snapshot = inventory.loc[inventory["date"] == inventory["date"].max()].copy()
+        snapshot["amz_available"] = (snapshot["amz_inventory"] * 0.8).round()
+        snapshot["alert"] = rng.choice(["", "Low inventory"], len(snapshot))
+        snapshot["recommended_action"] = rng.choice(
+            ["No action required", "Restock"], len(snapshot)
+        )
+        for column in [
+            "healthy_inventory_level",
+            "recommended_removal_quantity",
+            "estimated_excess_quantity",
+            "fba_minimum_inventory_level",
+        ]:
+            snapshot[column] = rng.integers(0, 100, len(snapshot))
+        snapshot["fba_inventory_level_health_status"] = rng.choice(
+            ["Healthy", "Low"], len(snapshot)
+        )
+        snapshot["storage_type"] = "Standard-size"
+        return sales, inventory, snapshot
+
+    market_frames = [_market_frames(x) for x in marketplaces]
+
+    wh_inventory = pd.DataFrame(
+        {
+            "sku": skus,
+            "wh_inventory": rng.integers(0, 2000, n_skus),
+            "incoming_containers": rng.integers(0, 3, n_skus) * 500,
+        }
+    )
+    incoming_weeks = pd.DataFrame(
+        {
+            "eta": pd.to_datetime([end + pd.Timedelta(weeks=x) for x in range(1, 5)]),
+            "items": [
+                [
+                    {"SKU": sku, "QtyOrdered": int(rng.integers(50, 500))}
+                    for sku in rng.choice(skus, min(20, n_skus), replace=False)
+                ]
+                for _ in range(4)
+            ],
+        }
+    )
+
+    event_spreadsheet = pd.DataFrame({"ASIN": asins})
+    for event in events:
+        event_spreadsheet[f"Average {event} sales, units (total)"] = rng.gamma(
+            1.0, 40.0, n_asins
+        ).round()
+        event_spreadsheet[f"Best {event} performance"] = rng.uniform(
+            1, 5, n_asins
+        ).round(2)
+
+    size_match = pd.DataFrame(
+        {"asin": asins, "sets in a box": rng.choice([2, 4, 6, 8], n_asins)}
+    )
+
+    return {
+        "get_amazon_sales": pd.concat([x[0] for x in market_frames], ignore_index=True),
+        "get_amazon_inventory": pd.concat(
+            [x[1] for x in market_frames], ignore_index=True
+        ),
+        "get_amazon_inventory_snapshot": pd.concat(
+            [x[2] for x in market_frames], ignore_index=True
+        ),
+        "get_wh_inventory": wh_inventory,
+        "incoming_weeks": incoming_weeks,
+        "get_event_spreadsheet": event_spreadsheet,
+        "get_dictionary": dictionary,
+        "size_match": size_match,
+    }
+
+
+def synthetic_pull_data(
+    num_days,
+    max_date=None,
+    marketplaces: list[str] | None = None,
+    use_sales_store: bool = False,
+    use_inventory_store: bool = False,
+) -> dict:
+    """Drop-in replacement for `db_utils.pull_data`"""
+    return synthetic_results(
+        num_days=num_days, max_date=max_date, marketplaces=marketplaces
+    )
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from allocation_utils import allocate_wh_inventory
+
+
+def test_missing_box_size_falls_back_to_units():
+    forecast = pd.DataFrame(
+        {
+            "asin": ["A1", "A2"],
+            "to_ship_units": [10.0, 7.0],
+            "to_ship_boxes": [2.0, np.nan],
+            "sets in a box": [5.0, np.nan],
+            "lost sales max": [1.0, 2.0],
+            "dos_inbound": [10.0, 10.0],
+        }
+    )
+    wh_inventory = pd.DataFrame(
+        {
+            "sku": ["S1", "S2", "S3"],
+            "asin": ["A1", "A2", "A2"],
+            "wh_inventory": [100, 3, 1],
+            "restockable": ["Restockable", "Restockable", "Do not ship to amazon"],
+        }
+    )
+
+    allocation = allocate_wh_inventory(forecast, wh_inventory, days_of_sale=49)
+
+    assert allocation["allocated_units"].tolist() == [10, 3]
+    assert allocation["allocated_boxes"].tolist() == [2, 3]
+    assert allocation["unallocated_units"].tolist() == [0, 4]
+
+    capped = allocate_wh_inventory(
+        forecast, wh_inventory, days_of_sale=49, capacity_units=8
+    )
+    # A2 has the higher lost sales and goes first
+    assert capped["allocated_units"].tolist() == [5, 3]
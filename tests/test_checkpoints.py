@@ -0,0 +1,32 @@
+import pandas as pd
+
+import main
+from checkpoint_utils import load_stage, run_id, save_stage
+
+
+def test_run_id_changes_with_output_settings(monkeypatch):
+    baseline = run_id(main._run_params())
+    for name, value in [
+        ("allocate_stock", True),
+        ("dos_shipped_formula", True),
+        ("n_shards", 4),
+        ("shard_by", "collection"),
+        ("engine", "polars"),
+    ]:
+        with monkeypatch.context() as patch:
+            patch.setattr(main, name, value)
+            assert run_id(main._run_params()) != baseline, name
+
+
+def test_stage_round_trip_keeps_object_columns(tmp_path):
+    incoming = pd.DataFrame(
+        {"sku": ["a", "b"], "2026-44": pd.Series([5.0, float("nan")], dtype=object)}
+    )
+    values = {"incoming_weeks": incoming, "results": {"incoming": incoming}, "n": 3}
+    save_stage(str(tmp_path), "run", "stage", values)
+
+    loaded = load_stage(str(tmp_path), "run", "stage")
+    assert loaded["n"] == 3
+    for frame in [loaded["incoming_weeks"], loaded["results"]["incoming"]]:
+        assert frame["2026-44"].dtype == object
+        pd.testing.assert_frame_equal(frame, incoming)
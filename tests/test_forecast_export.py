@@ -0,0 +1,41 @@
+import pytest
+
+import main
+import sales_forecast
+from synthetic_data import synthetic_results
+
+
+def test_failed_export_is_raised_and_not_published(monkeypatch, tmp_path):
+    results = synthetic_results(num_days=365, n_asins=20)
+    sales = results["get_amazon_sales"]
+    company_daily = (
+        sales.groupby("date")
+        .agg(unit_sales=("unit_sales", "sum"), dollar_sales=("dollar_sales", "sum"))
+        .reset_index()
+    )
+    published = []
+
+    def restock(**kwargs):
+        return main.calculate_restock(include_events=False, num_days=365)
+
+    def failing_writer(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main, "pull_data", lambda **kwargs: results)
+    monkeypatch.setattr(main, "user_folder", str(tmp_path))
+    monkeypatch.setattr(main.mm, "export_to_excel", lambda **kwargs: None)
+    monkeypatch.setattr(main.mm, "open_file_folder", lambda *args: None)
+    monkeypatch.setattr(sales_forecast, "user_folder", str(tmp_path))
+    monkeypatch.setattr(sales_forecast, "update_sales_store", lambda **kwargs: None)
+    monkeypatch.setattr(
+        sales_forecast, "load_company_daily", lambda **kwargs: company_daily
+    )
+    monkeypatch.setattr(sales_forecast, "calculate_restock", restock)
+    monkeypatch.setattr(sales_forecast, "write_long_chunks", failing_writer)
+    monkeypatch.setattr(
+        sales_forecast, "load_frames_to_bq", lambda *args: published.append(args)
+    )
+
+    with pytest.raises(OSError, match="disk full"):
+        sales_forecast.main(stack="stacked", publish=True)
+    assert published == []
@@ -0,0 +1,64 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from incremental_utils import (
+    advance_restock_state,
+    build_restock_state,
+    state_pull_days,
+    state_total_sales,
+)
+
+PARAMS = {
+    "num_days": 60,
+    "num_short_term_days": 14,
+    "include_events": False,
+    "marketplace": "US",
+}
+
+
+def _pulled(days: pd.DatetimeIndex, seed: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    asins = [f"B0TEST{i:04d}" for i in range(20)]
+    sales = pd.DataFrame(
+        [(day, asin) for day in days for asin in asins], columns=["date", "asin"]
+    )
+    sales["unit_sales"] = rng.integers(0, 6, len(sales))
+    sales["dollar_sales"] = sales["unit_sales"] * 19.99
+    inventory = sales[["date", "asin"]].copy()
+    inventory["sku"] = inventory["asin"] + "-1"
+    inventory["amz_inventory"] = rng.integers(0, 4, len(inventory))
+    return sales, inventory
+
+
+def test_incremental_run_matches_full_recompute_after_restated_day():
+    first_run, second_run = date(2026, 4, 20), date(2026, 4, 22)
+    sales, inventory = _pulled(pd.date_range("2026-01-01", first_run), seed=0)
+    state = build_restock_state(sales, inventory, PARAMS, first_run)
+
+    new_sales, new_inventory = _pulled(
+        pd.date_range(first_run, second_run, inclusive="right"), seed=1
+    )
+    # the last stored days were partial: the next pull restates them
+    restated = sales["date"] >= pd.Timestamp("2026-04-18")
+    sales.loc[restated, "unit_sales"] += 3
+    sales.loc[restated, "dollar_sales"] += 3 * 19.99
+    inventory.loc[inventory["date"] >= pd.Timestamp("2026-04-18"), "amz_inventory"] = 0
+    full_sales = pd.concat([sales, new_sales], ignore_index=True)
+    full_inventory = pd.concat([inventory, new_inventory], ignore_index=True)
+
+    pull_days = state_pull_days(state, PARAMS, second_run)
+    pull_start = pd.Timestamp(second_run) - pd.Timedelta(days=pull_days)
+    advanced = advance_restock_state(
+        state,
+        full_sales.loc[full_sales["date"] > pull_start],
+        full_inventory.loc[full_inventory["date"] > pull_start],
+        second_run,
+    )
+    full = build_restock_state(full_sales, full_inventory, PARAMS, second_run)
+
+    for incremental, recomputed in zip(
+        state_total_sales(advanced), state_total_sales(full)
+    ):
+        pd.testing.assert_frame_equal(incremental, recomputed)
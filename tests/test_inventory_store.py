@@ -0,0 +1,91 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import inventory_store
+from inventory_store import ATTRIBUTES, NUMERIC_COLUMNS, TEXT_COLUMNS
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    """
+    Daily snapshots of 6 skus in September, S1 is missing on 2026-09-22.
+    `source["frame"]` is what the next pull sees, `pulls` records the pulled date ranges.
+    """
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2026-09-01", "2026-09-30").date
+    full = pd.DataFrame(
+        [(day, f"S{i}") for day in days for i in range(6)], columns=["date", "sku"]
+    )
+    full = full.loc[~((full["sku"] == "S1") & (full["date"] == date(2026, 9, 22)))]
+    full["asin"] = "A" + full["sku"].str[1:]
+    for column in NUMERIC_COLUMNS:
+        # few distinct values, so runs of equal days get merged into intervals
+        full[column] = rng.integers(0, 3, len(full)).astype(float)
+    for column in TEXT_COLUMNS[1:]:
+        full[column] = rng.choice(["low", "ok", None], len(full), p=[0.1, 0.8, 0.1])
+    full = full.reset_index(drop=True)
+    source = {"frame": full}
+    pulls = []
+
+    def pull(output, to_print, min_date, max_date, marketplace):
+        pulls.append((min_date, max_date))
+        frame = source["frame"]
+        return frame.loc[pd.to_datetime(frame["date"]).between(min_date, max_date)]
+
+    monkeypatch.setattr(inventory_store, "INVENTORY_STORE_FOLDER", str(tmp_path))
+    monkeypatch.setattr(inventory_store, "get_fba_inventory_daily", pull)
+    return full, source, pulls
+
+
+def _normalized(intervals: pd.DataFrame) -> pd.DataFrame:
+    intervals = intervals.assign(
+        sku=intervals["sku"].astype(str), value=intervals["value"].astype(object)
+    )
+    return intervals.sort_values(["sku", "valid_from"]).reset_index(drop=True)
+
+
+def test_incremental_update_equals_full_encoding(snapshots):
+    full, source, pulls = snapshots
+    # the first pull of 2026-09-21 is partial: S2 isn't loaded yet
+    source["frame"] = full.loc[
+        ~((full["sku"] == "S2") & (full["date"] == date(2026, 9, 21)))
+    ]
+    inventory_store.update_inventory_store(max_date="2026-09-21")
+    source["frame"] = full
+    inventory_store.update_inventory_store(max_date="2026-09-25")
+
+    assert pulls[-1] == ("2026-09-21", "2026-09-25")
+    expected = inventory_store.encode_intervals(
+        full.loc[full["date"] <= date(2026, 9, 25)]
+    )
+    for attribute in ATTRIBUTES:
+        pd.testing.assert_frame_equal(
+            _normalized(inventory_store.load_intervals(attribute)),
+            _normalized(expected[attribute]),
+            check_dtype=False,
+            obj=attribute,
+        )
+
+
+def test_store_rebuilds_the_snapshots(snapshots):
+    full, _, _ = snapshots
+    inventory_store.update_inventory_store(max_date="2026-09-30")
+
+    history = inventory_store.daily_history(
+        "2026-09-01", "2026-09-30", columns=ATTRIBUTES
+    )
+    pd.testing.assert_frame_equal(
+        history,
+        full[history.columns].sort_values(["date", "sku"]).reset_index(drop=True),
+        check_dtype=False,
+    )
+    day = date(2026, 9, 22)
+    snapshot = inventory_store.snapshot_as_of(day)
+    pd.testing.assert_frame_equal(
+        snapshot,
+        full.loc[full["date"] == day, snapshot.columns].reset_index(drop=True),
+        check_dtype=False,
+    )
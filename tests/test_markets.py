@@ -0,0 +1,24 @@
+import main
+from db_utils import split_results_by_marketplace
+from synthetic_data import synthetic_results
+
+
+def test_market_worker_uses_run_settings(monkeypatch):
+    for name in ["num_days", "max_date", "include_events", "num_short_term_days"]:
+        monkeypatch.setattr(main, name, getattr(main, name))
+    results = synthetic_results(num_days=90, marketplaces=["US", "CA"], n_asins=50)
+    settings = {
+        "include_events": False,
+        "num_days": 90,
+        "max_date": None,
+        "num_short_term_days": 7,
+    }
+
+    market, forecast, _ = main._restock_market(
+        "CA", split_results_by_marketplace(results, "CA"), settings
+    )
+
+    assert market == "CA"
+    assert "avg sales units, 90 days" in forecast.columns
+    assert "avg sales units, 7 days" in forecast.columns
+    assert "avg sales units, 180 days" not in forecast.columns
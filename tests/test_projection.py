@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+import main
+from synthetic_data import synthetic_results
+
+
+def _store_shaped(sales: pd.DataFrame) -> pd.DataFrame:
+    """Sales as `get_amazon_sales_from_store` returns them: date x asin, no sku"""
+    return (
+        sales.groupby(["date", "marketplace", "asin"], as_index=False)[
+            ["unit_sales", "dollar_sales"]
+        ]
+        .sum()
+        .reset_index(drop=True)
+    )
+
+
+def _projection(results: dict, monkeypatch) -> pd.DataFrame:
+    monkeypatch.setattr(main, "projection_weeks", 8)
+    main.compute_restock(results, "US")
+    main.prepare_projection()
+    return main.projection  # type: ignore
+
+
+def test_projection_with_sales_store(monkeypatch):
+    results = synthetic_results(n_asins=50)
+    results["get_amazon_sales"] = _store_shaped(results["get_amazon_sales"])
+    projection = _projection(results, monkeypatch)
+
+    assert not main.sku_sales_pulled
+    assert set(projection["sku"]) == set(results["get_dictionary"]["sku"])
+    shares = main._sku_sales_shares()
+    np.testing.assert_allclose(shares, main.sku_map.equal_shares())  # type: ignore
+
+
+def test_projection_shares_from_sku_sales(monkeypatch):
+    results = synthetic_results(n_asins=50)
+    _projection(results, monkeypatch)
+
+    assert main.sku_sales_pulled
+    shares = pd.Series(main._sku_sales_shares())
+    asin_totals = shares.groupby(main.sku_map.sku_asin).sum()  # type: ignore
+    np.testing.assert_allclose(asin_totals, 1)
+
+
+def test_projection_skips_events_the_restock_does_not_plan_for(monkeypatch):
+    results = synthetic_results(n_asins=50)
+    projections = []
+    for days_to_event in [120, 400]:
+        # 120 days: inside the projection horizon, but beyond the restock's 90-day threshold
+        monkeypatch.setattr(
+            main, "get_event_days_delta", lambda: ("BFCM", days_to_event, 4)
+        )
+        monkeypatch.setattr(main, "projection_weeks", 26)
+        main.compute_restock(
+            {
+                k: v.copy() if isinstance(v, pd.DataFrame) else v
+                for k, v in results.items()
+            },
+            "US",
+        )
+        main.prepare_projection()
+        projections.append(main.projection)  # type: ignore
+
+    pd.testing.assert_frame_equal(*projections)
@@ -0,0 +1,31 @@
+import pyarrow as pa
+
+import main
+from synthetic_data import synthetic_results
+
+
+def test_publish_after_export_with_missing_inventory(monkeypatch, tmp_path):
+    results = synthetic_results(n_asins=50)
+    snapshot = results["get_amazon_inventory_snapshot"]
+    missing = results["get_dictionary"]["asin"].iloc[0]
+    results["get_amazon_inventory_snapshot"] = snapshot.loc[snapshot["asin"] != missing]
+    calls = []
+
+    def upload(frames, destination):
+        for frame in frames:
+            pa.Table.from_pandas(frame)
+            calls.append(("publish", frame))
+
+    monkeypatch.setattr(main, "pull_data", lambda **kwargs: results)
+    monkeypatch.setattr(main, "user_folder", str(tmp_path))
+    monkeypatch.setattr(main, "load_frames_to_bq", upload)
+    monkeypatch.setattr(
+        main.mm, "export_to_excel", lambda **kwargs: calls.append(("export", None))
+    )
+    monkeypatch.setattr(main.mm, "open_file_folder", lambda *args: None)
+
+    main.calculate_restock(include_events=False, publish=True)
+
+    assert [x[0] for x in calls] == ["export", "publish"]
+    restock = calls[1][1]
+    assert restock.loc[restock["asin"] == missing, "alert"].tolist() == [""]
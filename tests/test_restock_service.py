@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+
+import main
+import restock_utils
+from data_registry import DataRegistry, date_window
+from restock_service import RestockService
+from synthetic_data import synthetic_pull_data, synthetic_results
+
+
+def _no_dialogs(*args, **kwargs):
+    raise AssertionError("tkinter dialog opened")
+
+
+def test_stale_snapshot_without_dialogs(monkeypatch):
+    monkeypatch.setattr(restock_utils, "showwarning", _no_dialogs)
+    monkeypatch.setattr(main.messagebox, "showwarning", _no_dialogs)
+    results = synthetic_results(n_asins=50)
+    snapshot = results["get_amazon_inventory_snapshot"]
+    snapshot["date"] = snapshot["date"] - timedelta(days=4)
+
+    monkeypatch.setattr(main, "marketplace", "CA")
+
+    restock, _ = main.compute_restock(results, "US", interactive=False)
+    assert restock["amz_inventory"].sum() > 0
+    # the run's settings don't leak into later runs
+    assert main.show_dialogs and main.marketplace == "CA"
+
+
+def test_service_refresh_without_dialogs(monkeypatch):
+    monkeypatch.setattr(restock_utils, "showwarning", _no_dialogs)
+    monkeypatch.setattr(main.messagebox, "showwarning", _no_dialogs)
+    service = RestockService(synthetic_pull_data)
+    service.refresh()
+    assert service.health()["asins"] > 0
+    assert main.show_dialogs
+
+
+def test_invalidate_drops_overlapping_windows():
+    registry = DataRegistry()
+    calls = []
+
+    def pull(output, num_days, max_date=None):
+        calls.append((num_days, max_date))
+        output["pull"] = num_days
+
+    old = {"num_days": 30, "max_date": "2024-01-31"}
+    registry.fetch(pull, old, window=date_window(**old))
+    registry.fetch(pull, {"num_days": 30}, window=date_window(30))
+    stats = registry.stats()
+
+    assert registry.invalidate(date_window(30)) == 1
+    assert registry.stats() == stats
+    registry.fetch(pull, old, window=date_window(**old))
+    registry.fetch(pull, {"num_days": 30}, window=date_window(30))
+    assert len(calls) == 3
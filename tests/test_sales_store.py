@@ -0,0 +1,63 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sales_store
+
+
+@pytest.fixture
+def sales(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2026-08-01", "2026-09-30").date
+    full = pd.DataFrame(
+        [(day, f"A{i}") for day in days for i in range(5)], columns=["date", "asin"]
+    )
+    full["unit_sales"] = rng.integers(0, 5, len(full))
+    full["dollar_sales"] = full["unit_sales"] * 9.99
+    pulls = []
+
+    def pull(output, to_print, min_date, max_date, marketplace):
+        pulls.append((min_date, max_date))
+        dates = pd.to_datetime(full["date"])
+        return full.loc[dates.between(min_date, max_date)].copy()
+
+    monkeypatch.setattr(sales_store, "SALES_STORE_FOLDER", str(tmp_path))
+    monkeypatch.setattr(sales_store, "get_amazon_sales_daily", pull)
+    sales_store.update_sales_store(max_date="2026-09-30")
+    return full, pulls
+
+
+def _stored_units() -> pd.Series:
+    return sales_store.load_company_daily().set_index("date")["unit_sales"]
+
+
+def test_earlier_max_date_keeps_store(sales):
+    full, pulls = sales
+    stored = _stored_units()
+
+    sales_store.update_sales_store(max_date="2026-09-20", max_age_minutes=0)
+
+    assert len(pulls) == 1
+    pd.testing.assert_series_equal(_stored_units(), stored)
+    assert sales_store.last_stored_date() == date(2026, 9, 30)
+
+
+def test_refresh_replaces_only_pulled_days(sales, monkeypatch):
+    full, pulls = sales
+    full.loc[full["date"] == date(2026, 9, 29), "unit_sales"] += 100
+    # the last day is missing from the new pull
+    full.drop(full.index[full["date"] == date(2026, 9, 30)], inplace=True)
+
+    sales_store.update_sales_store(max_date="2026-09-30", max_age_minutes=0)
+
+    assert pulls[-1] == ("2026-09-28", "2026-09-30")
+    units = _stored_units()
+    assert (
+        units[date(2026, 9, 29)]
+        == full.loc[full["date"] == date(2026, 9, 29), "unit_sales"].sum()
+    )
+    assert date(2026, 9, 30) in units.index
+    asin_daily = sales_store.load_asin_daily("2026-09-30", "2026-09-30")
+    assert len(asin_daily) == 5
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from shadow_run import diff_frames, forecast_shadow_run, shadow_run
+from synthetic_data import synthetic_results
+
+
+def test_missing_text_on_both_sides_is_equal():
+    restock = pd.DataFrame(
+        {
+            "asin": ["A", "B", "C"],
+            "alert": [None, np.nan, "Low stock"],
+            "avg units": [1.0, np.nan, 2.0],
+        }
+    )
+    assert diff_frames(restock, restock.copy()).empty
+
+    changed = restock.assign(alert=["Low stock", np.nan, "Low stock"])
+    diffs = diff_frames(restock, changed)
+    assert diffs[["asin", "column"]].values.tolist() == [["A", "alert"]]
+
+
+def test_money_columns_allow_cent_rounding():
+    legacy = pd.DataFrame({"asin": ["A"], "avg $": [10.01], "avg units": [1.0]})
+    candidate = pd.DataFrame({"asin": ["A"], "avg $": [10.02], "avg units": [1.01]})
+    diffs = diff_frames(legacy, candidate)
+    assert diffs["column"].tolist() == ["avg units"]
+
+
+def test_polars_engine_matches_pandas():
+    pytest.importorskip("polars")
+    report = shadow_run(
+        synthetic_results(n_asins=500), {"engine": "polars"}, memory=False
+    )
+    assert report["equal"], report["summary"]
+
+
+def test_forecast_kernel_matches_reference_loop():
+    report = forecast_shadow_run(synthetic_results(n_asins=100))
+    assert report["equal"], report["summary"]
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import numpy as np
+
+import main
+import whatif
+from synthetic_data import synthetic_results
+
+
+def test_whatif_does_not_import_main():
+    code = "import sys, whatif; assert 'main' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_baseline_is_the_snapshot(monkeypatch):
+    monkeypatch.setattr(main, "allocate_stock", True)
+    restock, _ = main.compute_restock(synthetic_results(n_asins=100), "US")
+    state = whatif.build_whatif_state(restock)
+    asin = restock["asin"].iloc[0]
+
+    diff = whatif.what_if(
+        state, [{"asin": asin, "days_of_sale": main.STANDARD_DAYS_OF_SALE}]
+    )
+
+    row = restock.loc[restock["asin"] == asin].iloc[0]
+    for column in whatif.OUTPUT_COLUMNS:
+        assert np.isclose(diff[f"{column} baseline"].iloc[0], row[column])
+        assert np.isclose(diff[f"{column} change"].iloc[0], 0, equal_nan=True)
+    assert diff["allocated_units baseline"].iloc[0] == row["allocated_units"]
@@ -1,13 +1,27 @@
+import os
 import re
+import shutil
 from tkinter.filedialog import askopenfilename
-from typing import Any
+from typing import Any, Iterable
 
+import numpy as np
 import openpyxl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
 from common import user_folder
 from connectors import gcloud as gc
+from google.cloud import bigquery
 
 from date_utils import Event, EventName
+from db_utils import MARKETPLACES
+
+# rows per sheet including the header row
+EXCEL_MAX_ROWS = 1_048_576
+# rows per BigQuery load job
+BQ_CHUNK_ROWS = 500_000
 
 
 def create_column_formatting(
@@ -97,32 +111,197 @@ def create_column_formatting(
     return column_formatting
 
 
+def row_formulas(
+    columns: list[str], template: str, n_rows: int, first_row: int = 2
+) -> pd.Series:
+    """
+    One formula per row from a template with column names in braces, e.g.
+    "=({to_ship_boxes}*{sets in a box})" -> "=(Y2*X2)", "=(Y3*X3)"...
+    Column letters come from the positions in `columns`, so the formula follows the exported column order.
+    `first_row` is the Excel row of the first data row (2 - right below the header).
+    """
+    letters = {column: xl_col_to_name(i) for i, column in enumerate(columns)}
+    rows = pd.Series(range(first_row, first_row + n_rows)).astype(str)
+    formulas = pd.Series("", index=rows.index)
+    # odd parts are column names, even parts are literal text
+    for i, part in enumerate(re.split(r"\{(.*?)\}", template)):
+        formulas = formulas + (letters[part] + rows if i % 2 else part)
+    return formulas
+
+
+def write_wide_sheets(
+    file_path: str,
+    sheets: dict[str, tuple[pd.DataFrame, np.ndarray]],
+    matrix_headers: list[str],
+) -> None:
+    """
+    Write wide sheets where each row is the frame's columns followed by a row of the numeric matrix.
+    Rows are streamed with xlsxwriter in constant memory mode instead of going through `DataFrame.to_excel`.
+    """
+    workbook = xlsxwriter.Workbook(
+        file_path, {"constant_memory": True, "nan_inf_to_errors": True}
+    )
+    try:
+        for sheet_name, (df, matrix) in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, [str(x) for x in df.columns] + matrix_headers)
+            values = df.astype(object).where(df.notna(), None).values.tolist()
+            offset = df.shape[1]
+            for i, (row, numbers) in enumerate(zip(values, matrix.tolist()), start=1):
+                worksheet.write_row(i, 0, row)
+                worksheet.write_row(i, offset, numbers)
+    finally:
+        workbook.close()
+
+
+def write_long_chunks(
+    chunks: Iterable[tuple[str, pd.DataFrame]],
+    folder: str,
+    partition: str = "month",
+    excel_path: str | None = None,
+    sheet_name: str = "forecast",
+) -> int:
+    """
+    Stream (partition value, frame) chunks to a Hive-partitioned Parquet dataset
+    `folder`/`partition`=<value>/part-0.parquet, readable back with `pd.read_parquet(folder)`.
+    An existing dataset in `folder` is replaced.
+    With `excel_path`, the same rows are also written to Excel, continuing on "`sheet_name` 2", "`sheet_name` 3"...
+    whenever a sheet reaches Excel's row limit. Only one chunk is held in memory at a time.
+    Returns the number of rows written.
+    """
+    shutil.rmtree(folder, ignore_errors=True)
+    workbook = worksheet = None
+    if excel_path:
+        workbook = xlsxwriter.Workbook(
+            excel_path, {"constant_memory": True, "nan_inf_to_errors": True}
+        )
+    total_rows, sheet_row, sheet_number = 0, EXCEL_MAX_ROWS, 0
+    try:
+        for value, chunk in chunks:
+            part_folder = os.path.join(folder, f"{partition}={value}")
+            os.makedirs(part_folder, exist_ok=True)
+            pq.write_table(
+                pa.Table.from_pandas(chunk, preserve_index=False),
+                os.path.join(part_folder, "part-0.parquet"),
+            )
+            total_rows += len(chunk)
+            if workbook is None:
+                continue
+            for row in chunk.astype(object).where(chunk.notna(), None).values.tolist():
+                if sheet_row >= EXCEL_MAX_ROWS:
+                    sheet_number += 1
+                    worksheet = workbook.add_worksheet(
+                        sheet_name
+                        if sheet_number == 1
+                        else f"{sheet_name} {sheet_number}"
+                    )
+                    worksheet.write_row(0, 0, [str(x) for x in chunk.columns])
+                    sheet_row = 1
+                worksheet.write_row(sheet_row, 0, row)
+                sheet_row += 1
+    finally:
+        if workbook is not None:
+            workbook.close()
+    return total_rows
+
+
 def load_excel_with_hyperlinks(file_path, sheet_name: str | None = None):
-    wb = openpyxl.load_workbook(file_path, data_only=False)
-    sheet = wb.active if not sheet_name else wb[sheet_name]
-    if not sheet:
-        raise ValueError("The Excel file does not contain any sheets.")
+    """
+    Read a sheet into a DataFrame, replacing =HYPERLINK(url,"text") formulas with their text.
+    The workbook is streamed in read-only mode (rows as plain values, no cell objects),
+    hyperlink text is extracted with one vectorized `str.extract` per column that holds formulas.
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=False)
+    try:
+        sheet = wb.active if not sheet_name else wb[sheet_name]
+        if not sheet:
+            raise ValueError("The Excel file does not contain any sheets.")
+
+        rows = sheet.iter_rows(values_only=True)
+        headers = list(next(rows, ()))
+        columns = [[] for _ in headers]
+        for row in rows:
+            # read-only rows can be shorter than the header if trailing cells are empty
+            for i, column in enumerate(columns):
+                column.append(row[i] if i < len(row) else None)
+    finally:
+        wb.close()
 
-    data = []
-    headers = [cell.value for cell in next(sheet.iter_rows(min_row=1, max_row=1))]
+    data = {}
+    for i, values in enumerate(columns):
+        series = pd.Series(values, dtype=object)
+        formulas = series.map(
+            lambda x: isinstance(x, str) and x.startswith("=HYPERLINK")
+        )
+        if formulas.any():
+            # fallback to the formula itself if the structure differs
+            link_text = series[formulas].str.extract(r',"(.*?)"\)', expand=False)
+            series[formulas] = link_text.fillna(series[formulas])
+        data[i] = series.infer_objects()
+    df = pd.DataFrame(data)
+    df.columns = headers
+    return df
+
+
+def bq_column_names(columns) -> list[str]:
+    """Column names BigQuery accepts: "$" becomes "dollars", other non-word characters become underscores"""
+    return [re.sub(r"\W", "_", str(x).replace("$", "dollars")) for x in columns]
 
-    for row in sheet.iter_rows(min_row=2):
-        row_data = []
-        for cell in row:
-            val = cell.value
 
-            if isinstance(val, str) and val.startswith("=HYPERLINK"):
-                match = re.search(r',"(.*?)"\)', val)
-                if match:
-                    row_data.append(match.group(1))
-                else:
-                    # Fallback if regex fails (e.g. if formula structure differs)
-                    row_data.append(val)
-            else:
-                row_data.append(val)
-        data.append(row_data)
+def load_frames_to_bq(
+    frames: Iterable[pd.DataFrame],
+    destination: str,
+    chunk_rows: int = BQ_CHUNK_ROWS,
+    to_print: bool = True,
+) -> int:
+    """
+    Replace BigQuery table `destination` with `frames` using Parquet load jobs (no Excel round trip),
+    column names go through `bq_column_names`.
+    Frames are uploaded in slices of up to `chunk_rows` rows to a staging table (`destination`_staging):
+    the first job truncates it, the following ones append. The staging table then replaces `destination`
+    in one copy job, so a failed chunk never leaves `destination` partially loaded.
+    Returns the number of rows loaded.
+    """
+    staging = f"{destination}_staging"
+    total_rows = 0
+    with gc.gcloud_connect() as client:
+        try:
+            for frame in frames:
+                frame = frame.set_axis(bq_column_names(frame.columns), axis=1)
+                for start in range(0, len(frame), chunk_rows):
+                    job_config = bigquery.LoadJobConfig(
+                        source_format=bigquery.SourceFormat.PARQUET,
+                        write_disposition=(
+                            bigquery.WriteDisposition.WRITE_APPEND
+                            if total_rows
+                            else bigquery.WriteDisposition.WRITE_TRUNCATE
+                        ),
+                    )
+                    chunk = frame.iloc[start : start + chunk_rows]
+                    client.load_table_from_dataframe(
+                        chunk, staging, job_config=job_config
+                    ).result()
+                    total_rows += len(chunk)
+            if total_rows == 0:
+                raise BaseException(f"No rows to load to {destination}")
+            client.copy_table(
+                staging,
+                destination,
+                job_config=bigquery.CopyJobConfig(
+                    write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+                ),
+            ).result()
+        finally:
+            client.delete_table(staging, not_found_ok=True)
+    if to_print:
+        print(f"Loaded {total_rows} rows to {destination}")
+    return total_rows
 
-    return pd.DataFrame(data, columns=headers)
+
+def read_parquet_partitions(folder: str, columns: list[str] | None = None):
+    """Yield a Parquet dataset written by `write_long_chunks` one partition at a time"""
+    for partition in sorted(os.listdir(folder)):
+        yield pd.read_parquet(os.path.join(folder, partition), columns=columns)
 
 
 def push_restock_to_bq() -> None:
@@ -142,21 +321,28 @@ def push_restock_to_bq() -> None:
         raise BaseException(
             "restock must be a non-empty DataFrame with 'to_ship_units' column"
         )
-    _ = gc.push_to_cloud(
-        restock, destination="daily_reports.restock", if_exists="replace"
-    )
+    # same loader (and column names) as `calculate_restock(publish=True)`
+    load_frames_to_bq([restock], "daily_reports.restock")
 
 
-def push_forecast_to_bq() -> None:
+def push_forecast_to_bq(file_path: str | None = None) -> None:
     """
     Helper function to push forecast located in https://drive.google.com/drive/folders/1fSNHjoA6o1EOLOuBZrIrKDcM3wG9Xyre?usp=drive_link
     to BigQuery table daily_reports.forecast
+    `file_path` - Excel file or the stacked forecast's Parquet dataset folder (or any .parquet file inside it)
     """
 
-    file_path = askopenfilename(
-        title="Select a file with the forecast", initialdir=user_folder
-    )
-    forecast = pd.read_excel(file_path)
+    if not file_path:
+        file_path = askopenfilename(
+            title="Select a file with the forecast", initialdir=user_folder
+        )
+    if file_path.endswith(".parquet"):
+        # a partition file was picked, read the whole dataset
+        file_path = os.path.dirname(os.path.dirname(file_path))
+    if os.path.isdir(file_path):
+        forecast = pd.read_parquet(file_path, columns=["asin", "date", "units", "$"])
+    else:
+        forecast = pd.read_excel(file_path)
 
     if (
         not isinstance(forecast, pd.DataFrame)
@@ -167,71 +353,136 @@ def push_forecast_to_bq() -> None:
             "forecast must be a non-empty DataFrame with 'to_ship_units' column"
         )
     forecast = forecast[["asin", "date", "units", "$"]]
-    _ = gc.push_to_cloud(
-        forecast, destination="daily_reports.forecast", if_exists="replace"
-    )
+    # same loader (and column names) as `sales_forecast.main(publish=True)`
+    load_frames_to_bq([forecast], "daily_reports.forecast")
+
 
+def _event_label(event: Event) -> str:
+    return f"{event.name}{event.event_start.year}"
 
-def compare_events():
-    """Helper function to compare hourly sales per ASIN between events"""
-    pd2025 = Event(name=EventName.PD, year=2025, month=7, start=8, duration=4)
-    pd2026 = Event(name=EventName.PD, year=2026, month=6, start=23, duration=4)
 
-    def _generate_query(event: Event):
-        return f"""
+def _event_hourly_query(event: Event, sales_channel: str) -> str:
+    """Units and sales per asin, event day (1-based) and Pacific hour"""
+    return f"""
         SELECT
-            DATETIME(purchase_date, "America/Los_Angeles") as pacific_datetime, 
-            sales_channel,
+            DATE_DIFF(DATE(DATETIME(purchase_date, "America/Los_Angeles")), DATE("{event.event_start}"), DAY) + 1 AS day,
+            EXTRACT(HOUR FROM DATETIME(purchase_date, "America/Los_Angeles")) AS hour,
             asin,
-            quantity,
-            item_price,
-            item_promotion_discount,
-            order_status, item_status
-            from `mellanni-project-da.reports.all_orders`
+            SUM(quantity) AS units,
+            SUM(item_price) AS sales,
+            SUM(item_promotion_discount) AS discount
+        FROM `mellanni-project-da.reports.all_orders`
         WHERE DATETIME(purchase_date, "America/Los_Angeles") BETWEEN DATETIME("{event.event_start_str}") AND DATETIME("{event.event_end_str}")
-        AND LOWER(sales_channel) = "amazon.com"
+        AND LOWER(sales_channel) = "{sales_channel}"
+        GROUP BY day, hour, asin
     """
 
-    def _generate_hourly_template(asin_df):
-        asins = asin_df["asin"].values.tolist()
-        days = ["day 1", "day 2", "day 3", "day 4"]
-        hours = range(24)
-
-        columns = ["Day", "Hour", "ASIN"]
-        full_template = pd.DataFrame(columns=columns)
-
-        for day in days:
-            for hour in hours:
-                temp = pd.DataFrame(columns=columns)
-                temp["ASIN"] = asins
-                temp["Day"] = day
-                temp["Hour"] = hour
-
-                full_template = pd.concat([full_template, temp])
-
-        return full_template
 
-    query_event1 = _generate_query(pd2025)
-    query_event2 = _generate_query(pd2026)
+def compare_events(
+    events: list[Event] | None = None,
+    marketplace: str = "US",
+    file_path: str | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Compare hourly sales per ASIN between any number of events (PD 2025 vs PD 2026 by default).
+    Hourly aggregation runs in BigQuery, all event queries are started at once.
+    Returns (lift, hourly):
+        lift - per asin units / sales per event and units / sales lift of every event vs the first one
+        hourly - asin x day x hour grid (days up to the longest event) with units / sales per event,
+            hours past an event's duration are empty
+    Both are exported to `file_path` (event_comparison.xlsx in user folder by default). The full hourly grid
+    can pass Excel's row limit (~6.2k asins for a 7-day event), so Excel only gets the asins with sales
+    (continued on "hourly 2"... if needed) and the full grid goes to a Parquet dataset
+    `file_path` without extension + "_hourly", partitioned by day.
+    """
+    if events is None:
+        events = [
+            Event(name=EventName.PD, year=2025, month=7, start=8, duration=4),
+            Event(name=EventName.PD, year=2026, month=6, start=23, duration=4),
+        ]
+    if not events:
+        raise ValueError("At least one event is required")
+    sales_channel = MARKETPLACES[marketplace].lower()
+    labels = [_event_label(x) for x in events]
+    if len(set(labels)) != len(labels):
+        raise ValueError(f"Events must be unique: {labels}")
 
     with gc.gcloud_connect() as client:
-        event1_result = client.query(query_event1).to_dataframe()
-        event2_result = client.query(query_event2).to_dataframe()
-        dict_result = client.query(
+        jobs = [client.query(_event_hourly_query(x, sales_channel)) for x in events]
+        dict_job = client.query(
             "select distinct(asin) from  `mellanni-project-da.auxillary_development.dictionary`"
-        ).to_dataframe()
+        )
+        event_results = [job.to_dataframe() for job in jobs]
+        dict_result = dict_job.to_dataframe()
 
-    event1_result["pacific_datetime"] = event1_result["purchase_date"].dt.tz_localize(
-        None
+    hourly_sales = pd.concat(
+        [x.assign(event=label) for x, label in zip(event_results, labels)],
+        ignore_index=True,
+    )
+    hourly_sales = hourly_sales.pivot_table(
+        index=["asin", "day", "hour"],
+        columns="event",
+        values=["units", "sales"],
+        aggfunc="sum",
     )
-    event2_result["pacific_datetime"] = event2_result["purchase_date"].dt.tz_localize(
-        None
+    hourly_sales.columns = [f"{value} {event}" for value, event in hourly_sales.columns]
+
+    asins = pd.DataFrame(
+        {
+            "asin": pd.unique(
+                pd.concat(
+                    [
+                        dict_result["asin"],
+                        hourly_sales.index.get_level_values("asin").to_series(),
+                    ]
+                ).dropna()
+            )
+        }
+    )
+    days = pd.DataFrame({"day": range(1, max(x.duration for x in events) + 1)})
+    hours = pd.DataFrame({"hour": range(24)})
+    hourly = asins.merge(days, how="cross").merge(hours, how="cross")
+    hourly = hourly.merge(
+        hourly_sales.reset_index(), how="left", on=["asin", "day", "hour"]
+    )
+    hourly = hourly.reindex(
+        columns=["asin", "day", "hour"]
+        + [f"{value} {label}" for label in labels for value in ("units", "sales")]
+    )
+    for event, label in zip(events, labels):
+        columns = [f"units {label}", f"sales {label}"]
+        within_event = hourly["day"] <= event.duration
+        hourly.loc[within_event, columns] = hourly.loc[within_event, columns].fillna(0)
+
+    units = hourly.groupby("asin")[[f"units {x}" for x in labels]].sum()
+    sales = hourly.groupby("asin")[[f"sales {x}" for x in labels]].sum()
+    lift = pd.concat([units, sales], axis=1)
+    base_units, base_sales = units.iloc[:, 0].replace(0, np.nan), sales.iloc[
+        :, 0
+    ].replace(0, np.nan)
+    for label in labels[1:]:
+        lift[f"units lift {label}"] = lift[f"units {label}"] / base_units - 1
+        lift[f"sales lift {label}"] = lift[f"sales {label}"] / base_sales - 1
+    lift = lift.reset_index()
+
+    file_path = file_path or os.path.join(user_folder, "event_comparison.xlsx")
+    write_long_chunks(
+        ((day, x.drop(columns="day")) for day, x in hourly.groupby("day")),
+        folder=os.path.splitext(file_path)[0] + "_hourly",
+        partition="day",
     )
-    asin_template = _generate_hourly_template(dict_result)
-
-    with pd.ExcelWriter(
-        path="/home/misunderstood/temp/results.xlsx", engine="xlsxwriter"
-    ) as writer:
-        event1_result.to_excel(writer, sheet_name="pd2025", index=False)
-        event2_result.to_excel(writer, sheet_name="pd2026", index=False)
-        asin_template.to_excel(writer, sheet_name="full template", index=False)
+    event_columns = [x for x in lift.columns if " lift " not in x and x != "asin"]
+    asins_with_sales = lift.loc[lift[event_columns].sum(axis=1) > 0, "asin"]
+    excel_hourly = hourly.loc[hourly["asin"].isin(asins_with_sales)]
+    sheet_rows = EXCEL_MAX_ROWS - 1
+    with pd.ExcelWriter(path=file_path, engine="xlsxwriter") as writer:
+        lift.to_excel(writer, sheet_name="asin lift", index=False)
+        for number, start in enumerate(
+            range(0, max(len(excel_hourly), 1), sheet_rows), start=1
+        ):
+            excel_hourly.iloc[start : start + sheet_rows].to_excel(
+                writer,
+                sheet_name="hourly" if number == 1 else f"hourly {number}",
+                index=False,
+            )
+    return lift, hourly
@@ -0,0 +1,218 @@
+"""
+What-if recomputation of restock quantities for a few asins or collections.
+The per-asin inputs of the final restock step are kept as arrays (`build_whatif_state`), overrides are applied
+to the selected rows only and the same formulas as `main.prepare_wh_inventory` / `prepare_forecast` are re-run
+on them in one vectorized pass.
+Supported overrides (any subset, missing / NaN values keep the baseline):
+    avg_units - replaces "avg units"
+    days_of_sale - replaces STANDARD_DAYS_OF_SALE
+    event_multiplier - scales the nearest event's forecasted sales
+    extra_wh_inventory - added to "wh_inventory"
+"""
+
+import numpy as np
+import pandas as pd
+
+from date_utils import event_is_near, get_event_days_delta
+from restock_utils import STANDARD_DAYS_OF_SALE, event_forecast_units
+
+OVERRIDE_COLUMNS = [
+    "avg_units",
+    "days_of_sale",
+    "event_multiplier",
+    "extra_wh_inventory",
+]
+OUTPUT_COLUMNS = [
+    "total units needed",
+    "to_ship_units",
+    "to_ship_boxes",
+    "dos_available",
+    "dos_inbound",
+    "dos_shipped",
+]
+# warehouse allocation ranks every asin against all others, it is reported from the snapshot but not re-run
+ALLOCATION_COLUMNS = ["allocated_units", "allocated_boxes", "unallocated_units"]
+
+
+def build_whatif_state(
+    restock: pd.DataFrame, days_of_sale: int = STANDARD_DAYS_OF_SALE
+) -> dict:
+    """
+    Cache the inputs of the final restock step from a restock frame with plain asins
+    (`main.compute_restock` output), and its outputs as the what-if baseline.
+    """
+    nearest_event, days_to_event, event_duration = get_event_days_delta()
+    restock = restock.drop_duplicates("asin").reset_index(drop=True)
+    inputs = restock[
+        [
+            "avg units",
+            f"Average {nearest_event} sales, units (total)",
+            f"Best {nearest_event} performance",
+            "amz_inventory",
+            "amz_available",
+            "wh_inventory",
+            "sets in a box",
+        ]
+    ]
+    collections = {}
+    for i, value in enumerate(restock["collection"].astype(str)):
+        for name in value.split(", "):
+            collections.setdefault(name, []).append(i)
+    return {
+        "asins": pd.Index(restock["asin"].astype(str)),
+        "collections": {k: np.array(v) for k, v in collections.items()},
+        "inputs": {
+            name: pd.to_numeric(inputs[column], errors="coerce").to_numpy(np.float64)
+            for name, column in zip(
+                [
+                    "avg_units",
+                    "event_average_sales",
+                    "event_best_performance",
+                    "amz_inventory",
+                    "amz_available",
+                    "wh_inventory",
+                    "sets_in_box",
+                ],
+                inputs.columns,
+            )
+        },
+        "baseline": {
+            column: pd.to_numeric(restock[column], errors="coerce").to_numpy(np.float64)
+            for column in OUTPUT_COLUMNS + ALLOCATION_COLUMNS
+            if column in restock.columns
+        },
+        "nearest_event": nearest_event,
+        "days_to_event": days_to_event,
+        "event_duration": event_duration,
+        "days_of_sale": days_of_sale,
+    }
+
+
+def _restock_values(
+    state: dict,
+    rows: np.ndarray,
+    avg_units=None,
+    days_of_sale=None,
+    event_multiplier=None,
+    extra_wh_inventory=None,
+) -> dict[str, np.ndarray]:
+    """Restock step for `rows` of the state, same formulas as main.py"""
+    inputs = {k: v[rows] for k, v in state["inputs"].items()}
+    n = len(rows)
+    avg = inputs["avg_units"] if avg_units is None else avg_units
+    days = np.full(n, state["days_of_sale"]) if days_of_sale is None else days_of_sale
+    multiplier = np.ones(n) if event_multiplier is None else event_multiplier
+    wh_inventory = inputs["wh_inventory"] + (
+        0 if extra_wh_inventory is None else extra_wh_inventory
+    )
+
+    event_sales = (
+        event_forecast_units(
+            avg,
+            np.nan_to_num(inputs["event_average_sales"]),
+            np.nan_to_num(inputs["event_best_performance"]),
+            state["event_duration"],
+        )
+        * multiplier
+    )
+    near = event_is_near(state["nearest_event"], state["days_to_event"])
+    total_needed = avg * ((state["days_to_event"] if near else 0) + days)
+    if near:
+        total_needed = total_needed + event_sales
+
+    to_ship_units = np.nan_to_num(
+        np.round(np.clip(total_needed - inputs["amz_inventory"], 0, None))
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_ship_boxes = np.round(to_ship_units / inputs["sets_in_box"])
+        # ship at least one unit of asins that are out of stock on amazon but available in the warehouse
+        ship_one = (
+            (to_ship_units == 0) & (inputs["amz_inventory"] == 0) & (wh_inventory > 0)
+        )
+        to_ship_units = np.where(ship_one, 1, to_ship_units)
+        to_ship_boxes = np.where(ship_one, 1, to_ship_boxes)
+        return {
+            "total units needed": total_needed,
+            "to_ship_units": to_ship_units,
+            "to_ship_boxes": to_ship_boxes,
+            "dos_available": inputs["amz_available"] / avg,
+            "dos_inbound": inputs["amz_inventory"] / avg,
+            "dos_shipped": (
+                np.nan_to_num(to_ship_boxes * inputs["sets_in_box"])
+                + inputs["amz_inventory"]
+            )
+            / avg,
+        }
+
+
+def _override_rows(state: dict, overrides: pd.DataFrame) -> pd.DataFrame:
+    """One row per affected asin position, collection overrides expanded to their asins (asin overrides win)"""
+    frames = []
+    if "collection" in overrides.columns:
+        by_collection = overrides.loc[overrides["collection"].notna()]
+        for _, row in by_collection.iterrows():
+            positions = state["collections"].get(str(row["collection"]))
+            if positions is None:
+                raise ValueError(f"Unknown collection: {row['collection']}")
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "row": positions,
+                        "priority": 0,
+                        **{c: row.get(c) for c in OVERRIDE_COLUMNS},
+                    }
+                )
+            )
+    if "asin" in overrides.columns:
+        by_asin = overrides.loc[overrides["asin"].notna()]
+        positions = state["asins"].get_indexer(by_asin["asin"].astype(str))
+        if (positions < 0).any():
+            missing = by_asin["asin"][positions < 0].tolist()
+            raise ValueError(f"Unknown asins: {missing}")
+        frames.append(
+            by_asin.reindex(columns=OVERRIDE_COLUMNS).assign(row=positions, priority=1)
+        )
+    if not frames:
+        raise ValueError("Overrides must have an `asin` or `collection` column")
+    rows = pd.concat(frames, ignore_index=True)
+    return (
+        rows.sort_values("priority", kind="stable")
+        .drop_duplicates("row", keep="last")
+        .sort_values("row")
+        .reset_index(drop=True)
+    )
+
+
+def what_if(state: dict, overrides: pd.DataFrame | list[dict]) -> pd.DataFrame:
+    """
+    Apply a batch of overrides (rows with `asin` or `collection` plus any of OVERRIDE_COLUMNS) and return
+    a diff for every affected asin: "<column> baseline" (from the restock snapshot), "<column>" (what-if)
+    and "<column> change". Allocation columns of the snapshot are added as "<column> baseline" only.
+    """
+    overrides = pd.DataFrame(overrides)
+    rows = _override_rows(state, overrides)
+    positions = rows["row"].to_numpy()
+    inputs = state["inputs"]
+
+    def _value(column, baseline):
+        values = pd.to_numeric(rows[column], errors="coerce").to_numpy(np.float64)
+        return np.where(np.isnan(values), baseline, values)
+
+    baseline = {k: v[positions] for k, v in state["baseline"].items()}
+    scenario = _restock_values(
+        state,
+        positions,
+        avg_units=_value("avg_units", inputs["avg_units"][positions]),
+        days_of_sale=_value("days_of_sale", state["days_of_sale"]),
+        event_multiplier=_value("event_multiplier", 1.0),
+        extra_wh_inventory=_value("extra_wh_inventory", 0.0),
+    )
+    diff = {"asin": state["asins"][positions]}
+    for column in OUTPUT_COLUMNS:
+        diff[f"{column} baseline"] = baseline[column]
+        diff[column] = scenario[column]
+        diff[f"{column} change"] = scenario[column] - baseline[column]
+    for column in ALLOCATION_COLUMNS:
+        if column in baseline:
+            diff[f"{column} baseline"] = baseline[column]
+    return pd.DataFrame(diff)